@@ -7,6 +7,7 @@ import os
 from example_run_dll import CryptoLib,ECPoint
 from example_KeyPackage import KeyPackage
 from typing import overload, Union
+from example_usb_session import USBSessionPool
 def usb_control_transfer(vid, pid, bmRequestType, bRequest, wValue=0, wIndex=0, data_or_wLength=None, timeout=1000):
     """
     執行 USB Control Transfer
@@ -20,17 +21,11 @@ def usb_control_transfer(vid, pid, bmRequestType, bRequest, wValue=0, wIndex=0,
     :param timeout: 超時時間(毫秒)
     :return: 傳輸的數據
     """
-    # 查找 USB 設備
-    dev = usb.core.find(idVendor=vid, idProduct=pid)
-    if dev is None:
-        raise ValueError('設備未找到，請檢查VID和PID')
-
+    # 使用缓存的设备句柄（首次使用时查找和配置，设备拔出后自动重新打开）
+    session = USBSessionPool.get(vid, pid)
     try:
-        # 設置配置
-        dev.set_configuration()
-        
         # 執行 Control Transfer
-        result = dev.ctrl_transfer(
+        result = session.ctrl_transfer(
             bmRequestType=bmRequestType,
             bRequest=bRequest,
             wValue=wValue,
@@ -43,8 +38,6 @@ def usb_control_transfer(vid, pid, bmRequestType, bRequest, wValue=0, wIndex=0,
     except usb.core.USBError as e:
         print(f"USB Control Transfer 錯誤: {str(e)}")
         raise
-    finally:
-        dev = None
 
 def get_control_transfer(mValue : int, dataLen : int):
 
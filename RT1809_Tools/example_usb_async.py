@@ -0,0 +1,324 @@
+"""USB异步bulk写入：通过ctypes调用libusb异步接口，保持多个OUT传输同时在途"""
+
+import sys
+import ctypes
+import threading
+
+import usb.core
+
+from example_usb_session import BULK_CHUNK_SIZE
+
+# libusb.h
+LIBUSB_TRANSFER_TYPE_BULK = 2
+LIBUSB_TRANSFER_COMPLETED = 0
+LIBUSB_TRANSFER_CANCELLED = 3
+TRANSFER_STATUS_NAMES = {
+    0: "COMPLETED",
+    1: "ERROR",
+    2: "TIMED_OUT",
+    3: "CANCELLED",
+    4: "STALL",
+    5: "NO_DEVICE",
+    6: "OVERFLOW",
+}
+
+ASYNC_QUEUE_DEPTH = 4  # 同时在途的传输数（2为双缓冲，4为四缓冲）
+ASYNC_TIMEOUT = 5000  # 每个传输的超时（毫秒）
+
+# 关闭时仍有传输未回调的写入器：libusb之后处理事件时仍会调用其回调、写入其缓冲区，
+# 因此回调、传输和缓冲区在进程结束前都不能释放
+_orphaned_writers = []
+
+# Windows上libusb使用WINAPI调用约定
+_FUNCTYPE = ctypes.WINFUNCTYPE if sys.platform == "win32" else ctypes.CFUNCTYPE
+
+
+class _Timeval(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_usec", ctypes.c_long)]
+
+
+class _Transfer(ctypes.Structure):
+    pass
+
+
+_TransferCallback = _FUNCTYPE(None, ctypes.POINTER(_Transfer))
+
+_Transfer._fields_ = [
+    ("dev_handle", ctypes.c_void_p),
+    ("flags", ctypes.c_uint8),
+    ("endpoint", ctypes.c_ubyte),
+    ("type", ctypes.c_ubyte),
+    ("timeout", ctypes.c_uint),
+    ("status", ctypes.c_int),
+    ("length", ctypes.c_int),
+    ("actual_length", ctypes.c_int),
+    ("callback", _TransferCallback),
+    ("user_data", ctypes.c_void_p),
+    ("buffer", ctypes.c_void_p),
+    ("num_iso_packets", ctypes.c_int),
+]
+
+
+class _LibUSBAsync:
+    """
+    libusb异步接口的函数原型
+
+    从pyusb已加载的库中单独取函数，不修改pyusb设置的argtypes/restype。
+    """
+
+    def __init__(self, lib):
+        self.alloc_transfer = _FUNCTYPE(ctypes.POINTER(_Transfer), ctypes.c_int)(("libusb_alloc_transfer", lib))
+        self.free_transfer = _FUNCTYPE(None, ctypes.POINTER(_Transfer))(("libusb_free_transfer", lib))
+        self.submit_transfer = _FUNCTYPE(ctypes.c_int, ctypes.POINTER(_Transfer))(("libusb_submit_transfer", lib))
+        self.cancel_transfer = _FUNCTYPE(ctypes.c_int, ctypes.POINTER(_Transfer))(("libusb_cancel_transfer", lib))
+        self.handle_events_timeout_completed = _FUNCTYPE(
+            ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(_Timeval), ctypes.POINTER(ctypes.c_int)
+        )(("libusb_handle_events_timeout_completed", lib))
+
+
+class AsyncBulkWriter:
+    """
+    异步bulk OUT写入器
+
+    预先分配depth个传输和缓冲区，submit把数据复制到空闲缓冲区后立即提交，
+    不等待传输完成；depth个传输都在途时submit阻塞（背压），有传输完成后继续。
+    后台线程处理libusb事件，传输完成时调用完成回调callback(字节数, 状态)。
+
+    数据按transfer_size（向下取整为wMaxPacketSize的整数倍）拆分提交，
+    同一端点的传输按提交顺序完成。任一传输失败后不再接受新数据，
+    submit和flush抛出usb.core.USBError，调用close后重新创建。
+
+    仅支持pyusb的libusb1后端（is_supported），其他后端请使用同步的bulk_write。
+
+    用法:
+        with AsyncBulkWriter(dev, ep) as writer:
+            writer.submit(d_start)
+            writer.submit(data)
+            writer.submit(d_end)
+            writer.flush()
+    """
+
+    def __init__(self, dev, ep, depth: int = ASYNC_QUEUE_DEPTH, transfer_size: int = BULK_CHUNK_SIZE,
+                 timeout: int = ASYNC_TIMEOUT, callback=None):
+        """
+        Args:
+            dev: usb.core.Device（接口需已声明）
+            ep: OUT端点描述符
+            depth: 同时在途的传输数
+            transfer_size: 单个传输的最大字节数
+            timeout: 每个传输的超时（毫秒）
+            callback: 每个传输完成时调用callback(字节数, 状态)，在事件线程中执行
+        """
+        if not self.is_supported(dev):
+            raise NotImplementedError("异步bulk写入仅支持libusb1后端")
+        backend = dev._ctx.backend
+        self._lib = _LibUSBAsync(backend.lib)
+        self._ctx = backend.ctx
+        dev._ctx.managed_open()
+        self._handle = dev._ctx.handle.handle
+        self.endpoint = ep.bEndpointAddress
+        packet_size = ep.wMaxPacketSize or 64
+        self.transfer_size = max(packet_size, transfer_size - transfer_size % packet_size)
+        self.timeout = timeout
+        self.callback = callback
+        self.bytes_sent = 0
+        self.error = None
+
+        self._depth = depth
+        self._cond = threading.Condition()
+        self._callback_ref = _TransferCallback(self._on_complete)  # 保持引用，防止被回收
+        self._transfers = []
+        self._buffers = []
+        self._views = []
+        self._slots = {}  # {传输地址: 序号}
+        self._slot_callbacks = [None] * depth
+        self._free = list(range(depth))
+        for index in range(depth):
+            transfer = self._lib.alloc_transfer(0)
+            if not transfer:
+                self._free_transfers()
+                raise MemoryError("libusb_alloc_transfer失败")
+            buffer = bytearray(self.transfer_size)
+            self._transfers.append(transfer)
+            self._buffers.append((ctypes.c_char * self.transfer_size).from_buffer(buffer))
+            self._views.append(memoryview(buffer))
+            self._slots[ctypes.addressof(transfer.contents)] = index
+
+        self._running = True
+        self._event_thread = threading.Thread(target=self._event_loop, daemon=True)
+        self._event_thread.start()
+
+    @staticmethod
+    def is_supported(dev) -> bool:
+        """设备是否使用pyusb的libusb1后端"""
+        backend = getattr(getattr(dev, "_ctx", None), "backend", None)
+        return type(backend).__module__ == "usb.backend.libusb1"
+
+    @property
+    def depth(self) -> int:
+        return self._depth
+
+    @property
+    def pending(self) -> int:
+        """在途的传输数"""
+        with self._cond:
+            return self.depth - len(self._free)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _event_loop(self):
+        timeval = _Timeval(0, 100000)  # 100ms，便于及时退出
+        while self._running:
+            self._lib.handle_events_timeout_completed(self._ctx, ctypes.byref(timeval), None)
+
+    def _on_complete(self, transfer_p):
+        transfer = transfer_p.contents
+        index = self._slots[ctypes.addressof(transfer)]
+        status = transfer.status
+        actual_length = transfer.actual_length
+        callback = self._slot_callbacks[index]
+        with self._cond:
+            if status == LIBUSB_TRANSFER_COMPLETED:
+                self.bytes_sent += actual_length
+            elif self.error is None:
+                self.error = usb.core.USBError(
+                    f"异步bulk传输失败: {TRANSFER_STATUS_NAMES.get(status, status)} (端点0x{self.endpoint:02X})")
+            self._slot_callbacks[index] = None
+            self._free.append(index)
+            self._cond.notify_all()
+        for handler in (self.callback, callback):
+            if handler:
+                try:
+                    handler(actual_length, status)
+                except Exception as e:
+                    print(f"异步传输回调异常: {e}")
+
+    def _acquire_slot(self, timeout):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._free or self.error is not None or not self._running, timeout):
+                raise TimeoutError("等待空闲传输超时")
+            if self.error is not None:
+                raise self.error
+            if not self._running:
+                raise RuntimeError("异步写入器已关闭")
+            return self._free.pop(0)
+
+    def submit(self, data, timeout=None, callback=None) -> int:
+        """
+        提交数据（复制后立即返回，不等待传输完成）
+
+        Args:
+            data: bytes、bytearray或memoryview
+            timeout: 等待空闲传输的最长秒数，None为一直等待
+            callback: 本次数据的每个传输完成时调用callback(字节数, 状态)
+
+        Returns:
+            提交的字节数
+        """
+        view = memoryview(data)
+        for offset in range(0, len(view), self.transfer_size):
+            piece = view[offset:offset + self.transfer_size]
+            length = len(piece)
+            index = self._acquire_slot(timeout)
+            self._views[index][:length] = piece
+            transfer = self._transfers[index].contents
+            transfer.dev_handle = self._handle
+            transfer.flags = 0
+            transfer.endpoint = self.endpoint
+            transfer.type = LIBUSB_TRANSFER_TYPE_BULK
+            transfer.timeout = self.timeout
+            transfer.status = 0
+            transfer.length = length
+            transfer.actual_length = 0
+            transfer.callback = self._callback_ref
+            transfer.user_data = None
+            transfer.buffer = ctypes.addressof(self._buffers[index])
+            transfer.num_iso_packets = 0
+            self._slot_callbacks[index] = callback
+            result = self._lib.submit_transfer(self._transfers[index])
+            if result < 0:
+                with self._cond:
+                    self._slot_callbacks[index] = None
+                    self._free.append(index)
+                    if self.error is None:
+                        self.error = usb.core.USBError(f"提交异步bulk传输失败: {result}")
+                    raise self.error
+        return len(view)
+
+    def flush(self, timeout=None):
+        """
+        等待所有在途传输完成
+
+        Args:
+            timeout: 最长等待秒数，None为一直等待
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: len(self._free) == self.depth, timeout):
+                raise TimeoutError("等待异步传输完成超时")
+            if self.error is not None:
+                raise self.error
+
+    def _free_transfers(self):
+        for transfer in self._transfers:
+            self._lib.free_transfer(transfer)
+        self._transfers = []
+
+    def close(self):
+        """取消在途传输并释放资源"""
+        if not self._running:
+            return
+        with self._cond:
+            busy = [index for index in range(self.depth) if index not in self._free]
+        for index in busy:
+            self._lib.cancel_transfer(self._transfers[index])
+        # 取消的传输也会回调，全部回调后才能释放
+        with self._cond:
+            self._cond.wait_for(lambda: len(self._free) == self.depth, (self.timeout / 1000) + 1)
+            idle = len(self._free) == self.depth
+        self._running = False
+        self._event_thread.join()
+        if idle:
+            self._free_transfers()
+        else:
+            print(f"异步写入器关闭时仍有 {self.depth - len(self._free)} 个传输未完成，保留其资源")
+            _orphaned_writers.append(self)
+
+
+def open_async_writer(session, address: int, interface: int = 0, depth: int = ASYNC_QUEUE_DEPTH,
+                      timeout: int = ASYNC_TIMEOUT):
+    """
+    获取会话的异步写入器（缓存在会话中，会话关闭时一并关闭）
+
+    Args:
+        session: USBSession
+        address: OUT端点地址
+        interface: 接口号
+        depth: 同时在途的传输数（仅在新建时使用）
+        timeout: 每个传输的超时（毫秒）
+
+    Returns:
+        AsyncBulkWriter，后端不支持或创建失败时返回None（调用方改用同步的bulk_write）
+    """
+    key = ("async_writer", interface, address)
+    with session.lock:
+        writer = session.cache.get(key)
+        if writer is not None and writer.error is None:
+            writer.timeout = timeout
+            return writer
+        if writer is not None:
+            writer.close()
+            session.cache.pop(key, None)
+        try:
+            dev = session.claim_interface(interface)
+            if not AsyncBulkWriter.is_supported(dev):
+                return None
+            writer = AsyncBulkWriter(dev, session.endpoint(address, interface), depth, session.bulk_chunk_size, timeout)
+        except (NotImplementedError, AttributeError, OSError, MemoryError) as e:
+            print(f"异步bulk写入不可用，使用同步写入: {e}")
+            return None
+        session.cache[key] = writer
+        return writer
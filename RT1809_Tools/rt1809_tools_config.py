@@ -28,6 +28,9 @@ CHIP_RT9806 = "RT9806"
 FW_SIZE = 64 * 1024
 OTA_TxBLOCK_SIZE = 2048
 
+# RT9806 OTA固件头部
+FIRMWARE_HEADER_RT9806 = [0x43, 0x4D, 0x33, 0x58]  # 'CM3X'
+
 # USB设备VID/PID
 USB_VID_RT1809 = 0x34C7
 USB_PID_RT1809 = 0x8888
@@ -40,8 +43,21 @@ class ISPConfig:
     INITIAL_BAUDRATE = 38400
     ISP_BAUDRATE = 115200
     NEW_BAUDRATE = 307200
+    AUTO_BAUDRATE = 0  # NEW_BAUDRATE设为此值时自动协商波特率
+    # 自动协商的候选波特率（从低到高逐级试探），均为98304000/(16*N)可整除的值，
+    # 921600等标准波特率无法由设备分频得到，不在候选内
+    BAUDRATE_CANDIDATES = (307200, 384000, 512000, 614400, 768000, 1024000, 1228800, 1536000)
+    BAUDRATE_CONFIRM_ROUNDS = 3  # 每级波特率需连续成功的CHECK_ID往返次数
+    BAUDRATE_MEMORY_FILE = "isp_baudrates.json"  # 各串口最佳波特率记录
+    DIFFERENTIAL_BURN = False  # 差分烧录：只擦写与上次烧录镜像不同的扇区
+    DIFF_MAX_SECTORS = 8  # 一个块内变化的扇区超过此数时改用整块擦除
+    DEVICE_IMAGE_DIR = "device_images"  # 各串口上次烧录镜像的记录目录
     BLOCK_SIZE = 0x10000  # 64K
+    SECTOR_SIZE = 0x1000  # 4K，SECTOR_ERASE的擦除单位
     PROGRAM_SIZE = 0x0800  # 2KB
+    EVENT_DRIVEN_IO = False  # 事件驱动收发：后台线程接收，应答到达即返回，不再sleep轮询
+    PROGRAM_WINDOW = 1  # 编程发送窗口（未应答的PROGRAM包数），1为严格停等
+    FIRMWARE_MMAP_THRESHOLD = 0x100000  # 不小于此大小（1MB）的固件文件以只读内存映射加载
     START_CODE = 0xA5
     DEVICE_ID = b"GPCM2100A"
     ISP_CMD_FILE = "Isp_bin/ISP_WriterCMD.bin"
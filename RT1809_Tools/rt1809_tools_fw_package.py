@@ -0,0 +1,323 @@
+"""固件包格式（目标芯片、固件数据及预计算的分块CRC和校验和）"""
+
+import os
+import sys
+import zlib
+import struct
+import argparse
+from typing import List, Optional, Tuple
+
+from rt1809_tools_config import ISPConfig, FW_SIZE, CHIP_RT1809, CHIP_RT9806, FIRMWARE_HEADER_RT9806
+from rt1809_tools_isp_manifest import CRCManifest
+from rt1809_tools_isp_firmware import FirmwareImage
+
+# 固件数据类型
+PAYLOAD_ISP = 1  # ISP烧录固件
+PAYLOAD_OTA_FIRMWARE = 2  # OTA固件（RT1809为64KB，RT9806不超过64KB且以CM3X开头）
+PAYLOAD_OTA_RESOURCE = 3  # RT1809 OTA影像资源
+
+PAYLOAD_NAMES = {
+    PAYLOAD_ISP: "isp",
+    PAYLOAD_OTA_FIRMWARE: "ota",
+    PAYLOAD_OTA_RESOURCE: "res",
+}
+
+
+def validate_payload(chip: str, payload_type: int, data) -> None:
+    """
+    检查固件数据是否符合目标芯片和用途的大小、头部要求
+
+    Raises:
+        ValueError: 不符合要求
+    """
+    if payload_type == PAYLOAD_OTA_FIRMWARE:
+        if chip == CHIP_RT9806:
+            if len(data) < 4:
+                raise ValueError('固件数据无效')
+            file_header = list(data[:4])
+            if file_header != FIRMWARE_HEADER_RT9806:
+                raise ValueError(f'固件头部不匹配，期望: {FIRMWARE_HEADER_RT9806}, 实际: {file_header}')
+            if len(data) > FW_SIZE:
+                raise ValueError('固件超过64KB限制')
+        elif len(data) != FW_SIZE:
+            raise ValueError('文件大小不符合')
+    elif payload_type == PAYLOAD_OTA_RESOURCE:
+        if len(data) == 0:
+            raise ValueError("资源文件为空")
+        if len(data) == FW_SIZE:
+            raise ValueError("文件可能为固件，非影像资源")
+    elif payload_type == PAYLOAD_ISP:
+        if len(data) == 0:
+            raise ValueError("固件为空")
+    else:
+        raise ValueError(f"未知的固件数据类型: {payload_type}")
+
+
+class FirmwarePackage:
+    """
+    固件包（.rtfw）
+
+    文件结构（小端）：
+        文件头      魔数"RTFW"、版本、文件头长度、目标芯片、数据类型、
+                    数据偏移和长度、块大小、块数、字节和、数据区CRC32、文件头CRC32
+        分块CRC表   每块(长度, ISP块CRC)，与CRCManifest的清单相同
+        固件数据    按16字节对齐
+
+    字节和为所有固件字节之和的低32位，即RT1809 OTA结尾发送的校验和
+    （大端4字节）和RT9806 OTA的校验和，两者计算方法相同，只存一份。
+    打包时完成所有检查和计算；读取时只用一次zlib.crc32扫过内存映射的数据区，
+    校验通过即可直接使用预计算的值，烧录和OTA时不再重新计算。
+    """
+
+    MAGIC = b"RTFW"
+    VERSION = 1
+    EXTENSION = ".rtfw"
+    PAYLOAD_ALIGN = 16
+    _HEADER_STRUCT = struct.Struct('<4sHH16sBxxxIIIIII')
+    _HEADER_CRC_STRUCT = struct.Struct('<I')
+    _ENTRY_STRUCT = struct.Struct('<II')
+    HEADER_SIZE = _HEADER_STRUCT.size + _HEADER_CRC_STRUCT.size
+
+    def __init__(self, chip: str, payload_type: int, image: FirmwareImage, payload_offset: int,
+                 block_size: int, block_checksums: List[Tuple[int, int]], byte_sum: int):
+        self.chip = chip
+        self.payload_type = payload_type
+        self.image = image
+        self.payload_offset = payload_offset  # 固件数据在文件中的偏移
+        self.block_size = block_size
+        self.block_checksums = block_checksums
+        self.byte_sum = byte_sum
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def payload(self) -> memoryview:
+        """固件数据（不拷贝）"""
+        return self.image.data
+
+    @property
+    def ota_checksum(self) -> bytes:
+        """RT1809 OTA结尾发送的大端4字节校验和"""
+        return struct.pack('>I', self.byte_sum)
+
+    @property
+    def rt9806_checksum(self) -> List[int]:
+        """RT9806 OTA的校验和（与calculate_rt9806_checksum的返回格式相同）"""
+        return list(self.ota_checksum)
+
+    def expect(self, chip: str, payload_type: int):
+        """
+        检查固件包的目标芯片和数据类型
+
+        Raises:
+            ValueError: 不匹配
+        """
+        if self.chip != chip or self.payload_type != payload_type:
+            raise ValueError(
+                f"固件包目标不匹配，期望: {chip}/{PAYLOAD_NAMES.get(payload_type)}，"
+                f"实际: {self.chip}/{PAYLOAD_NAMES.get(self.payload_type)}"
+            )
+
+    def close(self):
+        """释放固件数据（关闭内存映射）"""
+        self.image.close()
+
+    @classmethod
+    def is_package(cls, file_path: str) -> bool:
+        """按魔数判断文件是否为固件包"""
+        try:
+            with open(file_path, 'rb') as f:
+                return f.read(len(cls.MAGIC)) == cls.MAGIC
+        except OSError:
+            return False
+
+    @classmethod
+    def build(cls, payload, chip: str, payload_type: int, block_size: int = ISPConfig.BLOCK_SIZE) -> bytes:
+        """
+        构建固件包
+
+        Args:
+            payload: 固件数据
+            chip: 目标芯片（CHIP_RT1809 / CHIP_RT9806）
+            payload_type: 数据类型（PAYLOAD_ISP / PAYLOAD_OTA_FIRMWARE / PAYLOAD_OTA_RESOURCE）
+            block_size: 分块CRC的块大小
+
+        Returns:
+            固件包数据
+        """
+        validate_payload(chip, payload_type, payload)
+        chip_bytes = chip.encode('ascii')
+        if len(chip_bytes) > 16:
+            raise ValueError(f"芯片名称过长: {chip}")
+
+        entries = CRCManifest.build(payload, block_size)
+        table = b''.join(cls._ENTRY_STRUCT.pack(length, crc) for length, crc in entries)
+        table_end = cls.HEADER_SIZE + len(table)
+        payload_offset = (table_end + cls.PAYLOAD_ALIGN - 1) // cls.PAYLOAD_ALIGN * cls.PAYLOAD_ALIGN
+        body = table + b'\x00' * (payload_offset - table_end) + bytes(payload)
+
+        header = cls._HEADER_STRUCT.pack(
+            cls.MAGIC, cls.VERSION, cls.HEADER_SIZE, chip_bytes, payload_type,
+            payload_offset, len(payload), block_size, len(entries),
+            sum(payload) & 0xFFFFFFFF, zlib.crc32(body)
+        )
+        return header + cls._HEADER_CRC_STRUCT.pack(zlib.crc32(header)) + body
+
+    @classmethod
+    def create(cls, output_path: str, payload, chip: str, payload_type: int,
+               block_size: int = ISPConfig.BLOCK_SIZE):
+        """构建固件包并写入文件（先写临时文件再替换）"""
+        data = cls.build(payload, chip, payload_type, block_size)
+        temp_path = f"{output_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, output_path)
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    @classmethod
+    def open(cls, file_path: str, mmap_threshold: Optional[int] = None) -> "FirmwarePackage":
+        """
+        打开并校验固件包（文件头、分块CRC表和固件数据一次扫描校验）
+
+        Args:
+            file_path: 固件包路径
+            mmap_threshold: 使用内存映射的最小文件大小，None时使用ISPConfig.FIRMWARE_MMAP_THRESHOLD
+
+        Raises:
+            ValueError: 不是固件包或校验失败
+        """
+        buffer, mapping = FirmwareImage.map_file(file_path, mmap_threshold)
+        try:
+            view = memoryview(buffer)
+            try:
+                package = cls._parse(view, buffer, mapping)
+            finally:
+                view.release()
+        except Exception:
+            if mapping is not None:
+                mapping.close()
+            raise
+        return package
+
+    @classmethod
+    def _parse(cls, view: memoryview, buffer, mapping) -> "FirmwarePackage":
+        if len(view) < cls.HEADER_SIZE:
+            raise ValueError("不是固件包：文件过短")
+        (magic, version, header_size, chip_bytes, payload_type, payload_offset, payload_size,
+         block_size, block_count, byte_sum, body_crc) = cls._HEADER_STRUCT.unpack_from(view, 0)
+        if magic != cls.MAGIC:
+            raise ValueError("不是固件包：魔数不匹配")
+        if version != cls.VERSION:
+            raise ValueError(f"不支持的固件包版本: {version}")
+        header_crc, = cls._HEADER_CRC_STRUCT.unpack_from(view, cls._HEADER_STRUCT.size)
+        if zlib.crc32(view[:cls._HEADER_STRUCT.size]) != header_crc:
+            raise ValueError("固件包文件头校验失败")
+
+        payload_end = payload_offset + payload_size
+        table_end = header_size + block_count * cls._ENTRY_STRUCT.size
+        if (header_size < cls.HEADER_SIZE or table_end > payload_offset or payload_end > len(view)
+                or block_size <= 0 or block_count != (payload_size + block_size - 1) // block_size):
+            raise ValueError("固件包结构错误")
+        if zlib.crc32(view[header_size:payload_end]) != body_crc:
+            raise ValueError("固件包数据校验失败")
+
+        entries = [cls._ENTRY_STRUCT.unpack_from(view, header_size + index * cls._ENTRY_STRUCT.size)
+                   for index in range(block_count)]
+        chip = chip_bytes.rstrip(b'\x00').decode('ascii')
+        image = FirmwareImage(buffer, payload_offset, payload_size, mapping=mapping)
+        return cls(chip, payload_type, image, payload_offset, block_size, entries, byte_sum)
+
+
+def load_isp_firmware(file_path: str, block_size: int = ISPConfig.BLOCK_SIZE):
+    """
+    加载ISP烧录固件：固件包直接使用其中的分块CRC，原始固件文件使用CRC清单缓存
+
+    Returns:
+        (固件镜像, 每个块的(长度, CRC)列表, 来源："package" / "memory" / "file" / "computed")
+    """
+    if FirmwarePackage.is_package(file_path):
+        package = FirmwarePackage.open(file_path)
+        try:
+            package.expect(CHIP_RT1809, PAYLOAD_ISP)
+        except ValueError:
+            package.close()
+            raise
+        if package.block_size == block_size:
+            return package.image, package.block_checksums, "package"
+        return package.image, CRCManifest.build(package.payload, block_size), "computed"
+
+    image = FirmwareImage.open(file_path)
+    try:
+        entries, source = CRCManifest.load_or_build(file_path, image.data, block_size)
+    except Exception:
+        image.close()
+        raise
+    return image, entries, source
+
+
+def load_ota_firmware(file_path: str, chip: str) -> Tuple[bytes, int]:
+    """
+    读取OTA固件：固件包直接使用打包时的检查结果和字节和，原始固件文件现场检查和计算
+
+    Returns:
+        (固件数据, 字节和)
+
+    Raises:
+        ValueError: 固件不符合要求
+    """
+    if FirmwarePackage.is_package(file_path):
+        with FirmwarePackage.open(file_path) as package:
+            package.expect(chip, PAYLOAD_OTA_FIRMWARE)
+            return bytes(package.payload), package.byte_sum
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    validate_payload(chip, PAYLOAD_OTA_FIRMWARE, data)
+    return data, sum(data) & 0xFFFFFFFF
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="固件包打包与查看")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    pack_parser = subparsers.add_parser("pack", help="把固件文件打包为固件包")
+    pack_parser.add_argument("input", help="固件文件路径")
+    pack_parser.add_argument("output", nargs="?", help="固件包路径，默认为固件文件名加.rtfw")
+    pack_parser.add_argument("--chip", choices=(CHIP_RT1809, CHIP_RT9806), default=CHIP_RT1809, help="目标芯片")
+    pack_parser.add_argument("--type", choices=tuple(PAYLOAD_NAMES.values()), default="isp", help="固件数据类型")
+    info_parser = subparsers.add_parser("info", help="校验并显示固件包信息")
+    info_parser.add_argument("input", help="固件包路径")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.action == "pack":
+            payload_type = {name: value for value, name in PAYLOAD_NAMES.items()}[args.type]
+            output_path = args.output or os.path.splitext(args.input)[0] + FirmwarePackage.EXTENSION
+            with open(args.input, 'rb') as f:
+                payload = f.read()
+            FirmwarePackage.create(output_path, payload, args.chip, payload_type)
+            print(f"已生成固件包: {output_path}")
+            return 0
+
+        with FirmwarePackage.open(args.input) as package:
+            print(f"目标芯片: {package.chip}")
+            print(f"数据类型: {PAYLOAD_NAMES.get(package.payload_type, package.payload_type)}")
+            print(f"固件大小: {len(package.payload)} bytes")
+            print(f"分块CRC: {len(package.block_checksums)} 块 x 0x{package.block_size:X}")
+            print(f"字节和: 0x{package.byte_sum:08X}")
+        return 0
+    except (OSError, ValueError) as e:
+        print(f"错误: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -24,6 +24,9 @@ from rt1809_tools_ota_func import (
     is_driver_mode_available  # 新增：检查驱动模式是否可用
 )
 
+# 波特率下拉框中"自动协商"选项的显示文本
+BAUDRATE_AUTO_TEXT = "自动"
+
 
 class MainApplication:
     """主应用程序 - 整合ISP和OTA功能"""
@@ -136,9 +139,10 @@ class MainApplication:
         # 波特率选择
         ttk.Label(port_frame, text="波特率:").pack(side=tk.LEFT, padx=(0, 5))
         from rt1809_tools_config import ISPConfig
-        self.baudrate_var = tk.StringVar(value=str(ISPConfig.NEW_BAUDRATE))
+        initial_baudrate = BAUDRATE_AUTO_TEXT if ISPConfig.NEW_BAUDRATE == ISPConfig.AUTO_BAUDRATE else str(ISPConfig.NEW_BAUDRATE)
+        self.baudrate_var = tk.StringVar(value=initial_baudrate)
         self.baudrate_combo = ttk.Combobox(port_frame, textvariable=self.baudrate_var, 
-                                          values=["307200", "115200"], state="readonly", width=10)
+                                          values=[BAUDRATE_AUTO_TEXT, "307200", "115200"], state="readonly", width=10)
         self.baudrate_combo.pack(side=tk.LEFT)
         self.baudrate_combo.bind("<<ComboboxSelected>>", self.on_baudrate_changed)
         
@@ -164,6 +168,11 @@ class MainApplication:
         self.isp_stop_btn = ttk.Button(button_frame, text="停止", command=self.stop_isp_burn, state=tk.DISABLED, width=8)
         self.isp_stop_btn.pack(side=tk.LEFT)
         
+        # 差分烧录：只擦写与上次烧录镜像不同的扇区
+        self.differential_var = tk.BooleanVar(value=ISPConfig.DIFFERENTIAL_BURN)
+        self.differential_check = ttk.Checkbutton(button_frame, text="差分烧录", variable=self.differential_var)
+        self.differential_check.pack(side=tk.LEFT, padx=(10, 0))
+        
         # 进度条
         progress_frame = ttk.LabelFrame(self.isp_frame, text="烧录进度", padding=8)
         progress_frame.pack(fill=tk.X, pady=(0, 8))
@@ -347,15 +356,22 @@ class MainApplication:
         VideoFrameExtractor(video_window)
 
     # ==================== ISP功能方法 ====================
-    def on_baudrate_changed(self, event=None):
-        """波特率选择变更时的处理"""
+    def apply_baudrate_selection(self):
+        """将界面选择的波特率写入ISP配置，选择"自动"时启用自动协商"""
         from rt1809_tools_config import ISPConfig
+        value = self.baudrate_var.get()
+        if value == BAUDRATE_AUTO_TEXT:
+            ISPConfig.NEW_BAUDRATE = ISPConfig.AUTO_BAUDRATE
+            return
         try:
-            baudrate = int(self.baudrate_var.get())
-            ISPConfig.NEW_BAUDRATE = baudrate
+            ISPConfig.NEW_BAUDRATE = int(value)
         except ValueError:
             pass
     
+    def on_baudrate_changed(self, event=None):
+        """波特率选择变更时的处理"""
+        self.apply_baudrate_selection()
+    
     def check_port_available(self, port: str) -> bool:
         """
         检测串口是否可用（未被占用）
@@ -419,7 +435,7 @@ class MainApplication:
         """浏览选择固件文件"""
         filename = filedialog.askopenfilename(
             title="选择固件文件",
-            filetypes=[("Binary files", "*.bin"), ("All files", "*.*")]
+            filetypes=[("Binary files", "*.bin"), ("Firmware packages", "*.rtfw"), ("All files", "*.*")]
         )
         if filename:
             self.firmware_var.set(filename)
@@ -501,11 +517,8 @@ class MainApplication:
         
         # 更新波特率配置
         from rt1809_tools_config import ISPConfig
-        try:
-            baudrate = int(self.baudrate_var.get())
-            ISPConfig.NEW_BAUDRATE = baudrate
-        except ValueError:
-            pass
+        self.apply_baudrate_selection()
+        ISPConfig.DIFFERENTIAL_BURN = self.differential_var.get()
         
         # 检查ISP文件是否存在
         if getattr(sys, 'frozen', False):
@@ -541,6 +554,7 @@ class MainApplication:
         self.browse_btn.config(state=tk.DISABLED)
         self.refresh_btn.config(state=tk.DISABLED)
         self.baudrate_combo.config(state=tk.DISABLED)
+        self.differential_check.config(state=tk.DISABLED)
         
         # 重置进度和状态
         self.isp_progress_var.set(0)
@@ -712,6 +726,7 @@ class MainApplication:
         self.browse_btn.config(state=tk.NORMAL)
         self.refresh_btn.config(state=tk.NORMAL)
         self.baudrate_combo.config(state="readonly")
+        self.differential_check.config(state=tk.NORMAL)
 
     # ==================== OTA功能方法 ====================
     def on_chip_type_changed(self):
@@ -828,7 +843,7 @@ class MainApplication:
         """浏览OTA文件"""
         filename = filedialog.askopenfilename(
             title="选择OTA文件",
-            filetypes=[("Binary files", "*.bin"), ("All files", "*.*")]
+            filetypes=[("Binary files", "*.bin"), ("Firmware packages", "*.rtfw"), ("All files", "*.*")]
         )
         if filename:
             self.file_var.set(filename)
@@ -0,0 +1,590 @@
+"""ISP协议与烧录器的asyncio实现"""
+
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Optional, Callable, List
+
+try:
+    import serial_asyncio
+except ImportError:
+    serial_asyncio = None
+
+from rt1809_tools_config import ISPConfig, Command, Response
+from rt1809_tools_isp_programmer import ISPProgrammer
+from rt1809_tools_isp_baudrate import BaudrateMemory
+
+
+class _SerialReceiver(asyncio.Protocol):
+    """串口接收协议：数据到达时放入缓冲区并唤醒等待者"""
+
+    def __init__(self):
+        self.transport = None
+        self.buffer = bytearray()
+        self.data_event = asyncio.Event()
+        self.closed = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.buffer.extend(data)
+        self.data_event.set()
+
+    def connection_lost(self, exc):
+        self.closed = True
+        self.data_event.set()
+
+
+class AsyncSerialProtocol:
+    """
+    串口通讯协议的asyncio实现
+
+    基于pyserial-asyncio（可选依赖），同一事件循环可同时驱动多个串口。
+    请求包的构建复用SerialProtocol，receive_data以asyncio.wait_for实现超时。
+    """
+
+    def __init__(self, builder):
+        """
+        Args:
+            builder: 用于构建请求包的SerialProtocol（不打开串口）
+        """
+        self.builder = builder
+        self.config = ISPConfig()
+        self.current_port_name: str = ""
+        self.current_baudrate: int = 0
+        # create_serial_connection返回的transport；connection_made在下一轮事件循环才被调用，
+        # 不能依赖_receiver.transport
+        self._transport = None
+        self._receiver: Optional[_SerialReceiver] = None
+        self._closing_receiver: Optional[_SerialReceiver] = None
+
+    @staticmethod
+    def available() -> bool:
+        """pyserial-asyncio是否已安装"""
+        return serial_asyncio is not None
+
+    @property
+    def is_open(self) -> bool:
+        return self._receiver is not None and not self._receiver.closed
+
+    async def open_port(self, port: str, baudrate: int) -> bool:
+        """打开串口"""
+        if serial_asyncio is None:
+            raise RuntimeError("未安装pyserial-asyncio，无法使用异步ISP接口")
+        # transport在下一轮事件循环才真正关闭串口，等待关闭完成后再重新打开
+        self.close_port()
+        if self._closing_receiver is not None:
+            await self._wait_closed(self._closing_receiver)
+            self._closing_receiver = None
+        try:
+            loop = asyncio.get_running_loop()
+            self._transport, self._receiver = await serial_asyncio.create_serial_connection(
+                loop, _SerialReceiver, port,
+                baudrate=baudrate, bytesize=8, parity='N', stopbits=1,
+                xonxoff=False, rtscts=False, dsrdtr=False
+            )
+            self.current_port_name = port
+            self.current_baudrate = baudrate
+            return True
+        except Exception as e:
+            print(f"打开串口失败: {e}")
+            self._transport = None
+            self._receiver = None
+            return False
+
+    @staticmethod
+    async def _wait_closed(receiver: _SerialReceiver, timeout: float = 1):
+        """等待串口连接关闭"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not receiver.closed and loop.time() < deadline:
+            receiver.data_event.clear()
+            try:
+                await asyncio.wait_for(receiver.data_event.wait(), deadline - loop.time())
+            except asyncio.TimeoutError:
+                break
+
+    def close_port(self):
+        """关闭串口"""
+        if self._transport is not None:
+            self._transport.close()
+            self._closing_receiver = self._receiver
+        self._transport = None
+        self._receiver = None
+
+    def reset_input_buffer(self):
+        """清空已收到但未读取的数据"""
+        if self._receiver is not None:
+            self._receiver.buffer.clear()
+
+    async def send_data(self, data) -> bool:
+        """
+        发送数据
+
+        数据先复制一份再交给transport，调用方可立即复用数据包缓冲区。
+        """
+        if not self.is_open:
+            return False
+        self._transport.write(bytes(data))
+        return True
+
+    async def receive_data(self, length: int, timeout: float = 1) -> Optional[bytes]:
+        """
+        接收指定长度的数据，数据到达即返回
+
+        Returns:
+            接收到的数据，超时或串口关闭时返回None
+        """
+        receiver = self._receiver
+        if receiver is None:
+            return None
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while len(receiver.buffer) < length:
+            remaining = deadline - loop.time()
+            if remaining <= 0 or receiver.closed:
+                return None
+            receiver.data_event.clear()
+            try:
+                await asyncio.wait_for(receiver.data_event.wait(), remaining)
+            except asyncio.TimeoutError:
+                return None
+        data = bytes(receiver.buffer[:length])
+        del receiver.buffer[:length]
+        return data
+
+    def build_request_packet(self, command: int, address: int, data: bytes = b'',
+                             data_len: Optional[int] = None) -> bytes:
+        """构建请求包，见SerialProtocol.build_request_packet"""
+        return self.builder.build_request_packet(command, address, data, data_len)
+
+
+class AsyncISPProgrammer:
+    """
+    ISP烧录器的asyncio实现
+
+    固件加载、分块CRC清单和PROGRAM包构建复用ISPProgrammer，串口收发全部为
+    可等待操作。取消烧录直接取消运行burn_firmware的任务（task.cancel()），
+    不再轮询is_cancelled标志。差分烧录仅同步版本支持。
+    """
+
+    def __init__(self, log_callback: Optional[Callable] = None, address_callback: Optional[Callable] = None,
+                 get_resource_path_func=None):
+        """
+        初始化异步ISP烧录器
+
+        Args:
+            log_callback: 日志回调函数
+            address_callback: 地址显示回调函数
+        """
+        self.core = ISPProgrammer(log_callback, address_callback, get_resource_path_func)
+        self.config = self.core.config
+        self.protocol = AsyncSerialProtocol(self.core.protocol)
+
+    def log(self, message: str, level: str = "INFO"):
+        """输出日志"""
+        self.core.log(message, level)
+
+    def load_firmware(self, file_path: str) -> bool:
+        """加载固件文件及分块CRC清单"""
+        return self.core.load_firmware(file_path)
+
+    async def _request(self, packet, timeout: float, max_retries: int, operation_name: str) -> Optional[int]:
+        """
+        发送一次请求包并等待1字节应答，超时时清空输入后继续等待（不重发）
+
+        与ISPProgrammer.send_with_retry + receive_with_timeout_and_retry相同：
+        重发由调用方的重试循环负责，每轮只发送一次。
+
+        Args:
+            max_retries: 接收应答的重试次数
+
+        Returns:
+            应答码，重试次数用尽时返回None
+        """
+        if not await self.protocol.send_data(packet):
+            return None
+        for attempt in range(max_retries):
+            response = await self.protocol.receive_data(1, timeout)
+            if response is not None:
+                return response[0]
+            self.log(f"{operation_name}应答超时 {attempt+1}/{max_retries}", "WARNING")
+            self.protocol.reset_input_buffer()
+        self.log(f"{operation_name}失败，请检查串口连接或切换波特率后重试", "ERROR")
+        return None
+
+    async def start_isp_mode(self, port: str) -> bool:
+        """启动ISP模式，流程与ISPProgrammer.start_isp_mode相同"""
+        try:
+            self.log("步骤1: 初始化ISP模式...")
+            if not await self.protocol.open_port(port, self.config.INITIAL_BAUDRATE):
+                return False
+            await self.protocol.send_data(b'\x00')
+            await asyncio.sleep(0.001)
+
+            self.log("步骤2: 发送ISP_WriterCMD...")
+            isp_cmd_path = self.core.get_resource_path(self.config.ISP_CMD_FILE)
+            if not os.path.exists(isp_cmd_path):
+                self.log(f"ISP命令文件不存在: {isp_cmd_path}", "ERROR")
+                return False
+            with open(isp_cmd_path, 'rb') as f:
+                cmd_data = f.read(39)
+            await self.protocol.send_data(cmd_data)
+            self.protocol.close_port()
+
+            self.log("步骤3: 等待IC响应...")
+            if not await self.protocol.open_port(port, self.config.ISP_BAUDRATE):
+                return False
+
+            self.log("步骤4: 发送ISP驱动代码前256字节...")
+            isp_driver_path = self.core.get_resource_path(self.config.ISP_DRIVER_FILE)
+            if not os.path.exists(isp_driver_path):
+                self.log(f"ISP驱动文件不存在: {isp_driver_path}", "ERROR")
+                return False
+            with open(isp_driver_path, 'rb') as f:
+                driver_data = f.read()
+            await self.protocol.send_data(driver_data[:256])
+
+            code_size_data = await self.protocol.receive_data(4, 1)
+            if code_size_data != b'\x0E\x1D\x00\x00':
+                self.log(f"请检查串口连接，[CodeSize: {code_size_data.hex() if code_size_data else 'None'}]", "ERROR")
+                return False
+
+            self.log("步骤5: 发送剩余ISP驱动代码...")
+            code_size = 0x1D0E
+            await self.protocol.send_data(driver_data[256:256+code_size])
+
+            checksum_data = await self.protocol.receive_data(4, 1)
+            if checksum_data != b'\xD4\x13\x06\x00':
+                self.log(f"请关闭弹窗后重试[Checksum: {checksum_data.hex() if checksum_data else 'None'}]", "ERROR")
+                return False
+
+            self.log("成功进入ISP模式", "SUCCESS")
+            return True
+        except (OSError, RuntimeError) as e:
+            self.log(f"进入ISP模式失败: {e}", "ERROR")
+            return False
+
+    async def check_id(self, timeout: float = 2, max_retries: int = 2) -> bool:
+        """检查设备ID"""
+        self.log("检查设备ID...")
+        packet = self.protocol.build_request_packet(
+            Command.CHECK_ID,
+            self.core.firmware_size - 1,  # 固件尾地址
+            self.config.DEVICE_ID
+        )
+        response = await self._request(packet, timeout, max_retries, "检查设备ID")
+        if response is None:
+            self.log("设备ID验证失败: 无响应", "ERROR")
+            return False
+        if response == Response.ACK:
+            self.log("设备ID验证成功", "SUCCESS")
+            return True
+        self.log(f"设备ID验证失败: 0x{response:02X}", "ERROR")
+        return False
+
+    async def set_baudrate(self, new_baudrate: int) -> bool:
+        """设置新波特率（设备不应答，切换后由调用方确认）"""
+        self.log(f"设置波特率为 {new_baudrate}...")
+        packet = self.protocol.build_request_packet(
+            Command.BAUDRATE,
+            0,  # 任意地址
+            (98304000 // (16 * new_baudrate)).to_bytes(2, 'little')
+        )
+        if not await self.protocol.send_data(packet):
+            return False
+
+        current_port = self.protocol.current_port_name
+        await asyncio.sleep(0.1)
+        if not await self.protocol.open_port(current_port, new_baudrate):
+            self.log(f"无法以新波特率 {new_baudrate} 打开串口", "ERROR")
+            return False
+        return True
+
+    async def negotiate_baudrate(self, candidates=None) -> Optional[int]:
+        """自动协商波特率，策略与ISPProgrammer.negotiate_baudrate相同"""
+        if candidates is None:
+            candidates = self.config.BAUDRATE_CANDIDATES
+        port = self.protocol.current_port_name
+        stable_baudrate = self.protocol.current_baudrate
+        candidates = sorted(rate for rate in set(candidates) if rate > stable_baudrate)
+
+        async def switch_and_confirm(baudrate):
+            if not await self.set_baudrate(baudrate):
+                return False
+            for _ in range(self.config.BAUDRATE_CONFIRM_ROUNDS):
+                if not await self.check_id(timeout=0.5, max_retries=1):
+                    return False
+            return True
+
+        async def fall_back(failed_baudrate, attempts=5):
+            self.log(f"退回稳定波特率 {stable_baudrate}", "WARNING")
+            for attempt in range(attempts):
+                if attempt > 0 and not await self.protocol.open_port(port, failed_baudrate):
+                    return False
+                if await self.set_baudrate(stable_baudrate) and await self.check_id(timeout=0.5, max_retries=1):
+                    return True
+            self.log(f"无法退回波特率 {stable_baudrate}，请重新上电后重试", "ERROR")
+            return False
+
+        remembered = BaudrateMemory.get(port)
+        if remembered is not None and remembered in candidates:
+            self.log(f"使用串口 {port} 记录的波特率 {remembered}")
+            if await switch_and_confirm(remembered):
+                return remembered
+            BaudrateMemory.forget(port)
+            if not await fall_back(remembered):
+                return None
+
+        for baudrate in candidates:
+            if not await switch_and_confirm(baudrate):
+                if not await fall_back(baudrate):
+                    return None
+                break
+            stable_baudrate = baudrate
+
+        BaudrateMemory.remember(port, stable_baudrate)
+        self.log(f"波特率协商完成: {stable_baudrate}", "SUCCESS")
+        return stable_baudrate
+
+    async def verify_block(self, block_address: int, block_size: int, max_retries=3) -> Optional[bool]:
+        """
+        验证数据块
+
+        Returns:
+            True表示一致，False表示需要更新，None表示通讯失败
+        """
+        self.core.update_address_display("Verify", block_address)
+        block_length, code_checksum = self.core.get_block_checksum(block_address, block_size)
+        packet = self.protocol.build_request_packet(
+            Command.VERIFY,
+            block_address,
+            block_length.to_bytes(4, 'little') + code_checksum.to_bytes(4, 'little'),
+            data_len=8
+        )
+        for retry_count in range(max_retries):
+            response = await self._request(packet, 1, 2, f"验证块 0x{block_address:08X}")
+            if response == Response.ACK:
+                return True
+            elif response == Response.CODE_CHECKSUM_FAIL:
+                return False
+            elif response is None or response == Response.CHECKSUM_FAIL:
+                if retry_count < max_retries - 1:
+                    await asyncio.sleep(0.02)
+            else:
+                return None
+        self.log(f"验证失败 @ 0x{block_address:08X}", "ERROR")
+        return None
+
+    async def erase_block(self, block_address: int, max_retries=2) -> bool:
+        """擦除数据块"""
+        self.log(f"擦除块 0x{block_address:08X}...")
+        self.core.update_address_display("Erase", block_address)
+        packet = self.protocol.build_request_packet(Command.BLOCK_ERASE, block_address, b'', data_len=0)
+        for retry_count in range(max_retries):
+            response = await self._request(packet, 3, 2, f"擦除块 0x{block_address:08X}")
+            if response == Response.ACK:
+                self.log(f"块 0x{block_address:08X} 擦除成功", "SUCCESS")
+                return True
+            elif response is None or response == Response.CHECKSUM_FAIL:
+                if retry_count < max_retries - 1:
+                    await asyncio.sleep(0.05)
+            else:
+                self.log(f"擦除失败: 0x{response:02X}", "ERROR")
+                return False
+        return False
+
+    async def _program_packet_with_retry(self, packet, program_address: int, max_retries=2) -> bool:
+        """停等方式发送一个PROGRAM数据包并等待应答，失败时重试"""
+        for retry_count in range(max_retries):
+            response = await self._request(packet, 1, 2, f"编程块 0x{program_address:08X}")
+            if response == Response.ACK:
+                return True
+            elif response is not None and response != Response.CHECKSUM_FAIL:
+                self.log(f"编程失败 @ 0x{program_address:08X}: 0x{response:02X}", "ERROR")
+                return False
+        return False
+
+    async def program_block(self, block_address: int, block_size: int, progress_callback=None, max_retries=2) -> bool:
+        """
+        编程数据块 - 按program_window流水线发送，策略与ISPProgrammer.program_pages相同
+        """
+        self.log(f"编程块 0x{block_address:08X}...")
+        self.core.update_address_display("Program", block_address)
+
+        block_end = min(block_address + block_size, self.core.firmware_size)
+        program_addresses = list(range(block_address, block_end, self.config.PROGRAM_SIZE))
+        window = max(1, self.core.program_window)
+
+        # 在途数据包：(地址, 数据包)
+        in_flight = deque()
+        next_index = 0
+        while next_index < len(program_addresses) or in_flight:
+            # 填满发送窗口
+            while next_index < len(program_addresses) and len(in_flight) < window:
+                program_address = program_addresses[next_index]
+                packet = self.core.build_program_packet(program_address)
+                await self.protocol.send_data(packet)
+                in_flight.append((program_address, packet))
+                next_index += 1
+
+            program_address, packet = in_flight.popleft()
+            response = await self.protocol.receive_data(1, 1)
+            if response is not None and response[0] == Response.ACK:
+                self.core._update_program_progress(program_address, progress_callback)
+                continue
+            if response is not None and response[0] != Response.CHECKSUM_FAIL:
+                self.log(f"编程失败 @ 0x{program_address:08X}: 0x{response[0]:02X}", "ERROR")
+                return False
+
+            # 收齐其余在途数据包的应答，未确认的与失败的数据包一起退回停等模式重发
+            retry_packets = [(program_address, packet, max_retries - 1)]
+            for pending_address, pending_packet in in_flight:
+                pending_response = await self.protocol.receive_data(1, 1)
+                if pending_response is not None and pending_response[0] == Response.ACK:
+                    self.core._update_program_progress(pending_address, progress_callback)
+                else:
+                    retry_packets.append((pending_address, pending_packet, max_retries))
+            in_flight.clear()
+
+            self.log(f"编程 0x{program_address:08X} 未确认，停等重发 {len(retry_packets)} 个数据包", "WARNING")
+            self.protocol.reset_input_buffer()
+            for retry_address, retry_packet, retries in retry_packets:
+                if not await self._program_packet_with_retry(retry_packet, retry_address, retries):
+                    return False
+                self.core._update_program_progress(retry_address, progress_callback)
+
+        self.log(f"块 0x{block_address:08X} 编程成功", "SUCCESS")
+        return True
+
+    async def exit_isp_mode(self, timeout: float = 2, max_retries: int = 2) -> bool:
+        """退出ISP模式"""
+        self.log("退出ISP模式...")
+        packet = self.protocol.build_request_packet(Command.EXIT_ISP_MODE, 0, b'')
+        response = await self._request(packet, timeout, max_retries, "退出ISP模式")
+        if response is None:
+            self.log(f"退出ISP模式失败: 无响应", "ERROR")
+            return False
+        if response == Response.ACK:
+            self.log("成功退出ISP模式", "SUCCESS")
+            return True
+        self.log(f"退出ISP模式失败: 0x{response:02X}", "ERROR")
+        return False
+
+    async def burn_firmware(self, port: str, firmware_path: Optional[str], progress_callback=None) -> bool:
+        """
+        烧录固件主流程
+
+        Args:
+            firmware_path: 固件文件路径，None时使用core.set_firmware设置的固件
+
+        取消运行本协程的任务即可中止烧录：已进入ISP模式时先尽力退出ISP模式，
+        串口在退出时关闭。
+        """
+        in_isp_mode = False
+        cancelled = False
+        try:
+            if firmware_path is not None:
+                if not self.load_firmware(firmware_path):
+                    return False
+            elif self.core.firmware_data is None:
+                self.log("未加载固件", "ERROR")
+                return False
+
+            if not await self.start_isp_mode(port):
+                return False
+            in_isp_mode = True
+            if not await self.check_id():
+                return False
+
+            # 设置高速波特率，AUTO_BAUDRATE时自动协商
+            if self.config.NEW_BAUDRATE == self.config.AUTO_BAUDRATE:
+                if await self.negotiate_baudrate() is None:
+                    return False
+            elif not await self.set_baudrate(self.config.NEW_BAUDRATE):
+                return False
+
+            total_blocks = (self.core.firmware_size + self.config.BLOCK_SIZE - 1) // self.config.BLOCK_SIZE
+            for block_num in range(total_blocks):
+                block_address = block_num * self.config.BLOCK_SIZE
+                verify_result = await self.verify_block(block_address, self.config.BLOCK_SIZE, max_retries=3)
+                if verify_result is None:
+                    return False
+                elif verify_result is False:
+                    if not await self.erase_block(block_address, max_retries=3):
+                        return False
+                    await asyncio.sleep(0.01)
+                    if not await self.program_block(block_address, self.config.BLOCK_SIZE,
+                                                    progress_callback, max_retries=3):
+                        self.log(f"烧录过程出错：设备可能已断开连接，请检查", "ERROR")
+                        return False
+                if progress_callback:
+                    progress_callback((block_num + 1) * 100 // total_blocks)
+
+            in_isp_mode = False
+            if not await self.exit_isp_mode():
+                return False
+            self.log("固件烧录成功！", "SUCCESS")
+            return True
+        except asyncio.CancelledError:
+            cancelled = True
+            self.log("操作已被用户取消", "WARNING")
+            raise
+        except Exception as e:
+            self.log(f"烧录过程出错: {e}", "ERROR")
+            return False
+        finally:
+            try:
+                if cancelled and in_isp_mode and self.protocol.is_open:
+                    await self._exit_isp_mode_after_cancel()
+            finally:
+                self.protocol.close_port()
+
+    async def _exit_isp_mode_after_cancel(self):
+        """取消后尽力退出ISP模式：丢弃在途请求的应答，失败时忽略"""
+        try:
+            self.protocol.reset_input_buffer()
+            await self.exit_isp_mode(timeout=0.5, max_retries=1)
+        except Exception:
+            pass
+
+
+async def burn_ports(ports: List[str], firmware_path: str, log_callback: Optional[Callable] = None,
+                     progress_callback: Optional[Callable] = None, timeout: Optional[float] = None) -> dict:
+    """
+    在一个事件循环中同时烧录多个串口
+
+    Args:
+        ports: 串口名称列表
+        firmware_path: 固件文件路径（只加载一次，各烧录器共享）
+        log_callback: 日志回调函数 log_callback(port, message)
+        progress_callback: 进度回调函数 progress_callback(port, progress)
+        timeout: 每个串口的整体超时（秒），超时的串口按失败处理
+
+    Returns:
+        {串口名称: 是否成功}
+    """
+    loader = ISPProgrammer()
+    if not loader.load_firmware(firmware_path):
+        return {port: False for port in ports}
+
+    async def burn_one(port):
+        programmer = AsyncISPProgrammer(
+            (lambda message: log_callback(port, message)) if log_callback else None
+        )
+        programmer.core.set_firmware(loader.firmware_data, loader.block_checksums)
+        callback = (lambda progress: progress_callback(port, progress)) if progress_callback else None
+        start_time = time.time()
+        try:
+            return await asyncio.wait_for(programmer.burn_firmware(port, None, callback), timeout)
+        except asyncio.TimeoutError:
+            programmer.log(f"烧录超时（{time.time() - start_time:.1f}秒）", "ERROR")
+            return False
+
+    try:
+        results = await asyncio.gather(*(burn_one(port) for port in ports))
+    finally:
+        loader.release_firmware()
+    return dict(zip(ports, results))
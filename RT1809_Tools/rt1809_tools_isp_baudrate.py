@@ -0,0 +1,94 @@
+"""ISP串口最佳波特率记录"""
+
+import os
+import json
+import threading
+from typing import Optional, Dict
+
+from rt1809_tools_config import ISPConfig
+
+
+class BaudrateMemory:
+    """
+    按串口名称记录自动协商得到的最佳波特率
+
+    记录以JSON文件保存在用户目录（Windows下为%APPDATA%/RT1809_Tools），
+    下次在同一串口上烧录时直接切换到记录的波特率，无需再逐级试探。
+    记录的波特率确认失败时由调用方调用forget()删除。
+    """
+
+    VERSION = 1
+
+    _lock = threading.Lock()
+    # 进程内缓存：{串口名称: 波特率}，首次访问时从文件加载
+    _rates: Optional[Dict[str, int]] = None
+
+    @staticmethod
+    def storage_path() -> str:
+        """获取记录文件路径"""
+        base_dir = os.environ.get("APPDATA") or os.path.expanduser("~")
+        return os.path.join(base_dir, "RT1809_Tools", ISPConfig.BAUDRATE_MEMORY_FILE)
+
+    @classmethod
+    def _load(cls) -> Dict[str, int]:
+        """读取记录文件，文件不存在或格式错误时返回空记录"""
+        try:
+            with open(cls.storage_path(), 'r', encoding='utf-8') as f:
+                content = json.load(f)
+            if content.get("version") != cls.VERSION:
+                return {}
+            return {str(port): int(rate) for port, rate in content["ports"].items()}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return {}
+
+    @classmethod
+    def _save(cls) -> bool:
+        """
+        写入记录文件（先写临时文件再替换）
+
+        Returns:
+            是否写入成功（目录不可写时返回False，不影响烧录）
+        """
+        path = cls.storage_path()
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({"version": cls.VERSION, "ports": cls._rates}, f)
+            os.replace(temp_path, path)
+            return True
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return False
+
+    @classmethod
+    def get(cls, port: str) -> Optional[int]:
+        """获取串口记录的最佳波特率，没有记录时返回None"""
+        with cls._lock:
+            if cls._rates is None:
+                cls._rates = cls._load()
+            return cls._rates.get(port)
+
+    @classmethod
+    def remember(cls, port: str, baudrate: int) -> bool:
+        """记录串口的最佳波特率"""
+        with cls._lock:
+            if cls._rates is None:
+                cls._rates = cls._load()
+            if cls._rates.get(port) == baudrate:
+                return True
+            cls._rates[port] = baudrate
+            return cls._save()
+
+    @classmethod
+    def forget(cls, port: str) -> bool:
+        """删除串口的波特率记录"""
+        with cls._lock:
+            if cls._rates is None:
+                cls._rates = cls._load()
+            if cls._rates.pop(port, None) is None:
+                return True
+            return cls._save()
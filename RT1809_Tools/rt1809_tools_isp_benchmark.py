@@ -0,0 +1,359 @@
+"""ISP烧录性能基准测试（分阶段计时，基于ISP虚拟设备）"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+from collections import Counter
+
+from rt1809_tools_config import ISPConfig
+from rt1809_tools_isp_crc import CRCCalculator
+from rt1809_tools_isp_manifest import CRCManifest
+from rt1809_tools_isp_programmer import ISPProgrammer
+from rt1809_tools_isp_telemetry import RetryEvent
+
+
+class BurnBenchmark:
+    """
+    ISP烧录基准测试 - 记录一次burn_firmware各阶段的耗时与开销
+
+    通过替换ISPProgrammer实例上的方法进行计时，不修改烧录流程本身：
+    - 各阶段墙钟时间（start_isp_mode、check_id、set_baudrate、每个块的verify/erase/program等）
+    - 烧录线程在CRC计算与数据包构建上花费的CPU时间
+    - 线路收发字节数、有效吞吐率
+    - 重发的数据包数（按ISPProgrammer的重试遥测统计）、接收超时次数和各应答码次数
+    结果为可在不同版本之间对比的JSON。阶段可能嵌套（如差分烧录内的program_pages），
+    各阶段时间之和可能大于总耗时。
+    """
+
+    VERSION = 1
+    PHASES = (
+        "load_firmware", "start_isp_mode", "check_id", "set_baudrate", "negotiate_baudrate",
+        "verify_block", "erase_block", "erase_sector", "program_block", "program_pages",
+        "burn_block_differential", "exit_isp_mode",
+    )
+    # 按块记录的阶段（第一个参数为地址）
+    BLOCK_PHASES = ("verify_block", "erase_block", "program_block")
+
+    def __init__(self, programmer: ISPProgrammer):
+        self.programmer = programmer
+        self.phase_calls = []  # [(阶段, 地址或None, 秒)]
+        self.crc_cpu_seconds = 0.0
+        self.crc_calls = 0
+        self.build_cpu_seconds = 0.0
+        self.packets_built = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.packets_sent = 0
+        self.resent_packets = Counter()  # {命令名: 重发次数}
+        self.receive_timeouts = 0
+        self.responses = Counter()
+        self._thread_id = None
+
+    def _wrap_phase(self, name: str):
+        original = getattr(self.programmer, name)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                address = args[0] if name in self.BLOCK_PHASES and args else None
+                self.phase_calls.append((name, address, time.perf_counter() - start))
+        setattr(self.programmer, name, timed)
+
+    def _wrap_protocol(self):
+        protocol = self.programmer.protocol
+        original_build = protocol.build_request_packet_into
+        original_send = protocol.send_data
+        original_receive = protocol.receive_data
+
+        def build(*args, **kwargs):
+            start = time.thread_time()
+            try:
+                return original_build(*args, **kwargs)
+            finally:
+                self.build_cpu_seconds += time.thread_time() - start
+                self.packets_built += 1
+
+        def send(data):
+            result = original_send(data)
+            if result:
+                self.bytes_sent += len(data)
+                if len(data) >= protocol.HEADER_SIZE and data[0] == protocol.config.START_CODE:
+                    self.packets_sent += 1
+            return result
+
+        def receive(length, timeout=1):
+            data = original_receive(length, timeout)
+            if data is None:
+                self.receive_timeouts += 1
+            else:
+                self.bytes_received += len(data)
+                if length == 1:
+                    self.responses[f"0x{data[0]:02X}"] += 1
+            return data
+
+        protocol.build_request_packet_into = build
+        protocol.send_data = send
+        protocol.receive_data = receive
+
+    def handle(self, event):
+        """
+        遥测输出：统计重发的请求包
+
+        只计入重新发送请求包的重试（"resend"/"send_failed"），只重新等待应答的
+        "receive_timeout"不算；同一地址上多次发送的CHECK_ID、BAUDRATE等也不会被误计。
+        """
+        if isinstance(event, RetryEvent) and event.reason != "receive_timeout":
+            self.resent_packets[event.command_name] += 1
+
+    def close(self):
+        pass
+
+    def run(self, port: str, firmware_path: str) -> dict:
+        """
+        执行一次烧录并返回结果
+
+        Returns:
+            可序列化为JSON的结果字典
+        """
+        for name in self.PHASES:
+            self._wrap_phase(name)
+        self._wrap_protocol()
+        self.programmer.add_telemetry_sink(self)
+
+        # 只统计烧录线程的CRC计算（虚拟设备线程做VERIFY时也会计算CRC）
+        self._thread_id = threading.get_ident()
+        original_crc = CRCCalculator.__dict__["calculate_block_checksum"]
+        crc_function = original_crc.__func__
+
+        def crc(data):
+            if threading.get_ident() != self._thread_id:
+                return crc_function(data)
+            start = time.thread_time()
+            try:
+                return crc_function(data)
+            finally:
+                self.crc_cpu_seconds += time.thread_time() - start
+                self.crc_calls += 1
+
+        CRCCalculator.calculate_block_checksum = staticmethod(crc)
+        try:
+            start = time.perf_counter()
+            success = self.programmer.burn_firmware(port, firmware_path)
+            total_seconds = time.perf_counter() - start
+        finally:
+            CRCCalculator.calculate_block_checksum = original_crc
+            self.programmer.remove_telemetry_sink(self)
+        return self.result(success, total_seconds)
+
+    def result(self, success: bool, total_seconds: float) -> dict:
+        """整理计时结果"""
+        phases = {}
+        for name, _, seconds in self.phase_calls:
+            phase = phases.setdefault(name, {"count": 0, "seconds": 0.0, "max_seconds": 0.0})
+            phase["count"] += 1
+            phase["seconds"] += seconds
+            phase["max_seconds"] = max(phase["max_seconds"], seconds)
+
+        blocks = {}
+        for name, address, seconds in self.phase_calls:
+            if address is not None:
+                block = blocks.setdefault(address, {"address": address})
+                block[name] = block.get(name, 0.0) + seconds
+
+        firmware_size = self.programmer.firmware_size
+        return {
+            "version": self.VERSION,
+            "success": success,
+            "total_seconds": total_seconds,
+            "firmware_size": firmware_size,
+            "throughput_bytes_per_second": firmware_size / total_seconds if total_seconds else 0.0,
+            "phases": phases,
+            "blocks": [blocks[address] for address in sorted(blocks)],
+            "cpu": {
+                "crc_seconds": self.crc_cpu_seconds,
+                "crc_calls": self.crc_calls,
+                "packet_build_seconds": self.build_cpu_seconds,
+                "packets_built": self.packets_built,
+            },
+            "wire": {
+                "bytes_sent": self.bytes_sent,
+                "bytes_received": self.bytes_received,
+                "packets_sent": self.packets_sent,
+            },
+            "retries": {
+                "resent_packets": sum(self.resent_packets.values()),
+                "resent_by_command": dict(self.resent_packets),
+                "receive_timeouts": self.receive_timeouts,
+                "responses": dict(self.responses),
+            },
+        }
+
+
+def make_firmware(size: int, seed: int = 1) -> str:
+    """生成固定随机种子的测试固件，返回文件路径"""
+    data = random.Random(seed).getrandbits(8 * size).to_bytes(size, 'little') if size else b''
+    fd, path = tempfile.mkstemp(suffix=".bin")
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def run_simulated(firmware_path: str, program_window: int = 1, event_driven: bool = False,
+                  baudrate: int = ISPConfig.NEW_BAUDRATE, cold_crc: bool = True, quiet: bool = True,
+                  **device_options) -> dict:
+    """
+    在ISP虚拟设备上执行一次烧录基准测试
+
+    Args:
+        firmware_path: 固件文件路径
+        program_window: 编程发送窗口
+        event_driven: 是否使用事件驱动收发
+        baudrate: 烧录波特率
+        cold_crc: 是否不使用分块CRC清单缓存（计入CRC计算时间）；在固件的临时副本上烧录，
+            不删除原固件已有的清单文件
+        quiet: 是否关闭烧录日志输出
+        device_options: 传给VirtualISPDevice的参数（延时、限速、错误注入等）
+
+    Returns:
+        结果字典（含settings与虚拟设备统计）
+    """
+    from rt1809_tools_isp_simulator import VirtualISPDevice
+
+    burn_path = firmware_path
+    if cold_crc:
+        CRCManifest._memory_cache.clear()
+        # 副本旁没有清单文件，烧录时重新计算分块CRC
+        fd, burn_path = tempfile.mkstemp(suffix=os.path.splitext(firmware_path)[1])
+        os.close(fd)
+        shutil.copyfile(firmware_path, burn_path)
+
+    saved = (ISPConfig.NEW_BAUDRATE, ISPConfig.EVENT_DRIVEN_IO)
+    ISPConfig.NEW_BAUDRATE = baudrate
+    ISPConfig.EVENT_DRIVEN_IO = event_driven
+    try:
+        programmer = ISPProgrammer()
+        programmer.set_program_window(program_window)
+        if quiet:
+            programmer.log = lambda message, level="INFO": None
+        with VirtualISPDevice(**device_options) as device:
+            result = BurnBenchmark(programmer).run(device.port, burn_path)
+            result["device"] = device.stats()
+    finally:
+        ISPConfig.NEW_BAUDRATE, ISPConfig.EVENT_DRIVEN_IO = saved
+        if burn_path != firmware_path:
+            for path in (burn_path, CRCManifest.sidecar_path(burn_path)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    result["settings"] = {
+        "program_window": program_window,
+        "event_driven": event_driven,
+        "baudrate": baudrate,
+        "cold_crc": cold_crc,
+        "crc_engine": CRCCalculator.get_engine(),
+        "device": device_options,
+    }
+    result["environment"] = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+    return result
+
+
+def compare(baseline: dict, current: dict) -> str:
+    """
+    对比两次基准测试结果
+
+    Returns:
+        对比表格文本（比值<1表示当前更快）
+    """
+    def row(name, old, new):
+        ratio = f"{new / old:.2f}x" if old else "-"
+        return f"{name:<28}{old:>12.4f}{new:>12.4f}{ratio:>10}"
+
+    lines = [f"{'项目':<26}{'基准':>10}{'当前':>10}{'比值':>8}"]
+    lines.append(row("total_seconds", baseline["total_seconds"], current["total_seconds"]))
+    for name in BurnBenchmark.PHASES:
+        old = baseline["phases"].get(name, {}).get("seconds", 0.0)
+        new = current["phases"].get(name, {}).get("seconds", 0.0)
+        if old or new:
+            lines.append(row(name, old, new))
+    for name in ("crc_seconds", "packet_build_seconds"):
+        lines.append(row(f"cpu.{name}", baseline["cpu"][name], current["cpu"][name]))
+    lines.append(row("throughput_KB/s", baseline["throughput_bytes_per_second"] / 1024,
+                     current["throughput_bytes_per_second"] / 1024))
+    lines.append(row("resent_packets", baseline["retries"]["resent_packets"],
+                     current["retries"]["resent_packets"]))
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="ISP烧录性能基准测试（ISP虚拟设备）")
+    parser.add_argument("--firmware", help="固件文件路径，不指定时生成随机固件")
+    parser.add_argument("--size", type=int, default=512 * 1024, help="随机固件大小（字节）")
+    parser.add_argument("--window", type=int, default=ISPConfig.PROGRAM_WINDOW, help="编程发送窗口")
+    parser.add_argument("--event-driven", action="store_true", help="使用事件驱动收发")
+    parser.add_argument("--baudrate", type=int, default=ISPConfig.NEW_BAUDRATE, help="烧录波特率")
+    parser.add_argument("--throttle", action="store_true", help="按波特率模拟线路传输时间")
+    parser.add_argument("--program-latency", type=float, default=0.0, help="每个PROGRAM包的Flash写入延时（秒）")
+    parser.add_argument("--erase-latency", type=float, default=0.0, help="BLOCK_ERASE延时（秒）")
+    parser.add_argument("--verify-latency", type=float, default=0.0, help="VERIFY延时（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入校验错误的概率")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="注入应答丢失的概率")
+    parser.add_argument("--seed", type=int, default=0, help="错误注入随机种子")
+    parser.add_argument("--warm-crc", action="store_true", help="保留分块CRC清单缓存")
+    parser.add_argument("--output", help="结果JSON输出路径")
+    parser.add_argument("--compare", help="与之对比的基准结果JSON")
+    args = parser.parse_args(argv)
+
+    firmware_path = args.firmware or make_firmware(args.size)
+    try:
+        result = run_simulated(
+            firmware_path,
+            program_window=args.window,
+            event_driven=args.event_driven,
+            baudrate=args.baudrate,
+            cold_crc=not args.warm_crc,
+            throttle_baudrate=args.throttle,
+            program_latency=args.program_latency,
+            erase_latency=args.erase_latency,
+            verify_latency=args.verify_latency,
+            error_rate=args.error_rate,
+            drop_rate=args.drop_rate,
+            seed=args.seed,
+        )
+    finally:
+        if not args.firmware:
+            os.remove(firmware_path)
+            try:
+                os.remove(CRCManifest.sidecar_path(firmware_path))
+            except OSError:
+                pass
+
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            print(compare(json.load(f), result))
+    return 0 if result["success"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
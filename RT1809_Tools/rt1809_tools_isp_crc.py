@@ -1,5 +1,18 @@
 """CRC校验计算器"""
 
+import struct
+
+# NumPy为可选依赖，未安装时自动回退到纯Python实现
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# CRC计算引擎
+ENGINE_AUTO = "auto"
+ENGINE_PYTHON = "python"
+ENGINE_NUMPY = "numpy"
+
 
 class CRCCalculator:
     """CRC校验计算器 - 使用查找表优化性能"""
@@ -7,6 +20,42 @@ class CRCCalculator:
     # CRC查找表（类变量，只初始化一次）
     _crc_table_16bit = None
     _crc_table_8bit = None
+    _prev_crc_table = None
+    _slicing_table = None
+    _np_word_table = None
+    _np_shift_tables = None
+    
+    # 当前使用的计算引擎
+    _engine = ENGINE_AUTO
+    
+    @classmethod
+    def available_engines(cls) -> list:
+        """获取当前环境可用的计算引擎"""
+        engines = [ENGINE_PYTHON]
+        if np is not None:
+            engines.append(ENGINE_NUMPY)
+        return engines
+    
+    @classmethod
+    def set_engine(cls, engine: str):
+        """
+        选择CRC计算引擎
+        
+        Args:
+            engine: ENGINE_AUTO（有NumPy时使用NumPy）、ENGINE_PYTHON 或 ENGINE_NUMPY
+        """
+        if engine not in (ENGINE_AUTO, ENGINE_PYTHON, ENGINE_NUMPY):
+            raise ValueError(f"未知的CRC计算引擎: {engine}")
+        if engine == ENGINE_NUMPY and np is None:
+            raise ValueError("NumPy未安装，无法使用numpy引擎")
+        cls._engine = engine
+    
+    @classmethod
+    def get_engine(cls) -> str:
+        """获取实际使用的计算引擎"""
+        if cls._engine == ENGINE_AUTO:
+            return ENGINE_NUMPY if np is not None else ENGINE_PYTHON
+        return cls._engine
     
     @classmethod
     def _init_crc_table_16bit(cls):
@@ -87,6 +136,36 @@ class CRCCalculator:
             # 高字节表（word的高8位）
             cls._crc_table_8bit[1][i] = cls._calculate_crc_for_word(i << 8)
     
+    @classmethod
+    def _init_prev_crc_table(cls):
+        """初始化前一个CRC值的线性变换表（4个256条目，按字节拆分32位CRC）"""
+        if cls._prev_crc_table is not None:
+            return
+        
+        # 变换是GF(2)上的线性运算，32位输入可拆成4个字节分别查表后异或
+        cls._prev_crc_table = [
+            [cls._process_prev_crc(i << (8 * k)) for i in range(256)]
+            for k in range(4)
+        ]
+    
+    @classmethod
+    def _init_slicing_table(cls):
+        """
+        初始化切片查表法（slicing-by-8）所需的8个256条目查找表
+        
+        table[k][b] 表示字节b后面再跟k个零字节时对CRC的贡献：
+        table[0]/table[1] 分别是16位字的低/高字节贡献，
+        table[k+2] 由 table[k] 再经过一次前一个CRC值的变换得到（相当于多处理一个零字）
+        """
+        if cls._slicing_table is not None:
+            return
+        
+        cls._init_crc_table_8bit()
+        tables = [list(cls._crc_table_8bit[0]), list(cls._crc_table_8bit[1])]
+        for k in range(2, 8):
+            tables.append([cls._process_prev_crc(v) for v in tables[k - 2]])
+        cls._slicing_table = tables
+    
     @staticmethod
     def crc_checksum_16bit_table(w_value: int, dw_pre_crc: int) -> int:
         """
@@ -106,15 +185,19 @@ class CRCCalculator:
         # 查表获取w_value对应的CRC贡献
         crc_from_data = CRCCalculator._crc_table_16bit[w_value & 0xFFFF]
         
-        # 处理前一个CRC值的贡献（需要对原始CRC进行线性变换）
-        crc_from_prev = CRCCalculator._process_prev_crc(dw_pre_crc)
+        # 处理前一个CRC值的贡献（线性变换，按字节查表）
+        if CRCCalculator._prev_crc_table is None:
+            CRCCalculator._init_prev_crc_table()
+        p0, p1, p2, p3 = CRCCalculator._prev_crc_table
+        crc_from_prev = (p0[dw_pre_crc & 0xFF] ^ p1[(dw_pre_crc >> 8) & 0xFF] ^
+                         p2[(dw_pre_crc >> 16) & 0xFF] ^ p3[(dw_pre_crc >> 24) & 0xFF])
         
         # 组合两个CRC贡献
         return crc_from_data ^ crc_from_prev
     
     @staticmethod
     def _process_prev_crc(dw_pre_crc: int) -> int:
-        """处理前一个CRC值的线性变换"""
+        """处理前一个CRC值的线性变换（原始LFSR方程，用于生成查找表）"""
         lfsr_q = [0] * 32
         lfsr_c = [0] * 32
         
@@ -164,10 +247,79 @@ class CRCCalculator:
         
         return crc
     
+    @classmethod
+    def _init_numpy_tables(cls):
+        """
+        初始化NumPy引擎的查找表
+        
+        _np_word_table: 65536条目，每个16位字（初始CRC为0）的CRC贡献
+        _np_shift_tables[j]: 前一个CRC值连续经过 2^j 个零字后的线性变换，
+        按字节拆成4个256条目的表（形状为 4x256）
+        """
+        if cls._np_word_table is not None:
+            return
+        
+        cls._init_slicing_table()
+        t0, t1 = cls._slicing_table[0], cls._slicing_table[1]
+        word_table = np.array(t0, dtype=np.uint32)[None, :] ^ np.array(t1, dtype=np.uint32)[:, None]
+        
+        cls._init_prev_crc_table()
+        shift = np.array(cls._prev_crc_table, dtype=np.uint32)
+        shift_tables = []
+        # 64KB块为32768个字只需15级，这里覆盖到2^31个字
+        for _ in range(32):
+            shift_tables.append(shift)
+            # 2^(j+1)次变换 = 对2^j次变换的结果再做一次2^j次变换
+            shift = cls._apply_shift_numpy(shift, shift)
+        
+        cls._np_word_table = word_table.reshape(-1)
+        cls._np_shift_tables = shift_tables
+    
+    @staticmethod
+    def _apply_shift_numpy(values, table):
+        """对数组中每个CRC值按字节查表做线性变换"""
+        return (table[0][values & 0xFF] ^ table[1][(values >> 8) & 0xFF] ^
+                table[2][(values >> 16) & 0xFF] ^ table[3][values >> 24])
+    
+    @staticmethod
+    def _calculate_block_checksum_numpy(data: bytes) -> int:
+        """
+        使用NumPy并行前缀归约计算数据块的CRC校验值
+        
+        CRC在GF(2)上是线性的：两段数据A、B拼接后的CRC等于
+        CRC(A)经过len(B)个零字的变换后再与CRC(B)异或。
+        先查表得到每个字单独的CRC贡献，再两两合并，每一级合并的
+        段长相同，因此只需一组变换表即可对整个数组向量化处理。
+        """
+        if CRCCalculator._np_word_table is None:
+            CRCCalculator._init_numpy_tables()
+        
+        length = len(data)
+        if length == 0:
+            return 0
+        
+        words = np.frombuffer(data, dtype='<u2', count=length // 2)
+        if length & 1:
+            words = np.append(words, np.uint16(data[length - 1]))
+        
+        # 前补零字到2的整数次幂（初始CRC为0时，前导零字不影响结果）
+        total = len(words)
+        levels = max(total - 1, 0).bit_length()
+        padded = 1 << levels
+        values = np.zeros(padded, dtype=np.uint32)
+        values[padded - total:] = CRCCalculator._np_word_table[words]
+        
+        # 逐级两两合并，第j级合并的右半段长度为 2^j 个字
+        for level in range(levels):
+            table = CRCCalculator._np_shift_tables[level]
+            values = CRCCalculator._apply_shift_numpy(values[0::2], table) ^ values[1::2]
+        
+        return int(values[0])
+    
     @staticmethod
     def calculate_block_checksum(data: bytes) -> int:
         """
-        使用查表法计算数据块的CRC校验值
+        计算数据块的CRC校验值，按当前引擎分派
         
         Args:
             data: 待计算的数据
@@ -175,11 +327,50 @@ class CRCCalculator:
         Returns:
             CRC校验值
         """
+        if CRCCalculator.get_engine() == ENGINE_NUMPY:
+            return CRCCalculator._calculate_block_checksum_numpy(data)
+        return CRCCalculator._calculate_block_checksum_python(data)
+    
+    @staticmethod
+    def _calculate_block_checksum_python(data: bytes) -> int:
+        """
+        使用切片查表法（slicing-by-8）计算数据块的CRC校验值
+        
+        每步处理4个16位字（8字节），结果与逐字LFSR计算完全一致。
+        数据长度为奇数时，最后一个字节作为高位为0的字处理。
+        
+        Args:
+            data: 待计算的数据
+            
+        Returns:
+            CRC校验值
+        """
+        if CRCCalculator._slicing_table is None:
+            CRCCalculator._init_slicing_table()
+        t0, t1, t2, t3, t4, t5, t6, t7 = CRCCalculator._slicing_table
+        
+        length = len(data)
+        word_count = length // 2
+        words = struct.unpack_from(f'<{word_count}H', data) if word_count else ()
+        if length & 1:
+            words += (data[length - 1],)
+        
         crc_value = 0
-        for i in range(0, len(data), 2):
-            if i + 1 < len(data):
-                word = data[i] | (data[i + 1] << 8)
-            else:
-                word = data[i]
-            crc_value = CRCCalculator.crc_checksum_16bit_table(word, crc_value)
-        return crc_value
\ No newline at end of file
+        total = len(words)
+        sliced = total - total % 4
+        
+        # 主循环：每次4个字
+        for i in range(0, sliced, 4):
+            w0, w1, w2, w3 = words[i:i + 4]
+            x = crc_value ^ ((w0 << 16) | w1)
+            crc_value = (t7[x >> 24] ^ t6[(x >> 16) & 0xFF] ^
+                         t5[(x >> 8) & 0xFF] ^ t4[x & 0xFF] ^
+                         t3[w2 >> 8] ^ t2[w2 & 0xFF] ^
+                         t1[w3 >> 8] ^ t0[w3 & 0xFF])
+        
+        # 剩余不足4个的字逐字处理
+        for i in range(sliced, total):
+            x = (crc_value >> 16) ^ words[i]
+            crc_value = ((crc_value << 16) & 0xFFFFFFFF) ^ t1[x >> 8] ^ t0[x & 0xFF]
+        
+        return crc_value
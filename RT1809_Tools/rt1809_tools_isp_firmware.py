@@ -0,0 +1,107 @@
+"""固件镜像数据源（大文件只读内存映射，按memoryview切片取用）"""
+
+import os
+import mmap
+from typing import Optional
+
+from rt1809_tools_config import ISPConfig
+
+
+class FirmwareImage:
+    """
+    固件镜像数据源
+
+    不小于ISPConfig.FIRMWARE_MMAP_THRESHOLD的文件以只读内存映射打开，
+    其余文件一次读入内存。data始终是memoryview，切片不拷贝数据；
+    末页不足PROGRAM_SIZE的部分不在这里补齐，由组包时直接在包缓冲区中填充0xFF，
+    因此多MB的资源镜像按页编程时内存占用恒定、每页没有新的分配。
+
+    内存映射期间文件保持打开（Windows上无法覆盖或删除），用完后调用close释放。
+
+    用法:
+        with FirmwareImage.open(path) as image:
+            page = image.page(address, ISPConfig.PROGRAM_SIZE)
+    """
+
+    def __init__(self, buffer, offset: int = 0, size: Optional[int] = None, mapping: Optional[mmap.mmap] = None):
+        """
+        Args:
+            buffer: 支持缓冲区协议的对象（bytes、bytearray、mmap）
+            offset: 固件数据在buffer中的起始偏移
+            size: 固件数据长度，None时取到buffer末尾
+            mapping: buffer为内存映射时传入，close时一并关闭
+        """
+        view = memoryview(buffer)
+        end = len(view) if size is None else offset + size
+        if offset < 0 or end > len(view):
+            raise ValueError(f"固件数据超出范围: 偏移 {offset}，长度 {end - offset}，总长度 {len(view)}")
+        self.data = view[offset:end]
+        self.size = len(self.data)
+        self._mapping = mapping
+
+    @staticmethod
+    def map_file(file_path: str, mmap_threshold: Optional[int] = None):
+        """
+        读取或内存映射整个文件
+
+        Args:
+            file_path: 文件路径
+            mmap_threshold: 使用内存映射的最小文件大小，None时使用ISPConfig.FIRMWARE_MMAP_THRESHOLD
+
+        Returns:
+            (数据, 内存映射)：未映射时数据为bytes、内存映射为None
+        """
+        if mmap_threshold is None:
+            mmap_threshold = ISPConfig.FIRMWARE_MMAP_THRESHOLD
+        with open(file_path, 'rb') as f:
+            file_size = os.fstat(f.fileno()).st_size
+            # 空文件无法映射
+            if file_size == 0 or file_size < mmap_threshold:
+                return f.read(), None
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return mapping, mapping
+
+    @classmethod
+    def open(cls, file_path: str, mmap_threshold: Optional[int] = None) -> "FirmwareImage":
+        """
+        打开固件文件
+
+        Args:
+            file_path: 固件文件路径
+            mmap_threshold: 使用内存映射的最小文件大小，None时使用ISPConfig.FIRMWARE_MMAP_THRESHOLD
+
+        Returns:
+            固件镜像
+        """
+        buffer, mapping = cls.map_file(file_path, mmap_threshold)
+        return cls(buffer, mapping=mapping)
+
+    @property
+    def is_mapped(self) -> bool:
+        """是否为内存映射"""
+        return self._mapping is not None
+
+    def __len__(self):
+        return self.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def page(self, address: int, length: int) -> memoryview:
+        """
+        取出从address开始最多length字节的切片（末尾不足时返回较短的切片）
+        """
+        return self.data[address:min(address + length, self.size)]
+
+    def close(self):
+        """释放数据；仍有切片在使用时，映射在切片全部释放后由垃圾回收关闭"""
+        self.data.release()
+        if self._mapping is not None:
+            try:
+                self._mapping.close()
+            except BufferError:
+                pass
+            self._mapping = None
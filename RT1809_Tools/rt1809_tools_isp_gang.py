@@ -0,0 +1,176 @@
+"""ISP多路并行烧录"""
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Callable, Dict, List, Tuple
+
+from rt1809_tools_config import ISPConfig
+from rt1809_tools_isp_programmer import ISPProgrammer
+from rt1809_tools_isp_firmware import FirmwareImage
+from rt1809_tools_fw_package import load_isp_firmware
+
+
+class GangResult:
+    """单个串口的烧录结果"""
+
+    def __init__(self, port: str):
+        self.port = port
+        self.success = False
+        self.cancelled = False
+        self.elapsed = 0.0  # 烧录耗时（秒）
+        self.error: Optional[str] = None
+
+    def __repr__(self):
+        return (f"GangResult(port={self.port!r}, success={self.success}, "
+                f"cancelled={self.cancelled}, elapsed={self.elapsed:.2f})")
+
+
+class GangProgrammer:
+    """
+    多路并行烧录器 - 在多个串口上同时运行ISPProgrammer
+
+    固件文件只读取一次并计算一次分块CRC清单，所有串口的编程器共享同一份
+    只读数据。每个串口由线程池中的一个线程驱动（串口读写期间释放GIL），
+    日志、进度和结果按串口名称分别回调。回调在工作线程中执行，
+    GUI调用方需自行切回主线程。
+    """
+
+    def __init__(self, log_callback: Optional[Callable] = None, progress_callback: Optional[Callable] = None,
+                 result_callback: Optional[Callable] = None, get_resource_path_func=None,
+                 telemetry_sinks: Optional[List] = None):
+        """
+        初始化多路烧录器
+
+        Args:
+            log_callback: 日志回调函数 log_callback(port, message)
+            progress_callback: 进度回调函数 progress_callback(port, progress)
+            result_callback: 结果回调函数 result_callback(port, GangResult)，每个串口结束时调用
+            get_resource_path_func: 资源路径获取函数，传给各ISPProgrammer
+            telemetry_sinks: 遥测输出列表，注册到每个串口的编程器（事件带串口名称，可按工位区分）
+        """
+        self.config = ISPConfig()
+        self.log_callback = log_callback
+        self.progress_callback = progress_callback
+        self.result_callback = result_callback
+        self.get_resource_path_func = get_resource_path_func
+        self.telemetry_sinks = list(telemetry_sinks or [])
+        self.firmware_data: Optional[bytes] = None
+        self.firmware_image: Optional[FirmwareImage] = None
+        self.block_checksums: Optional[List[Tuple[int, int]]] = None
+        self.programmers: Dict[str, ISPProgrammer] = {}
+        self.cancel_flag = False
+        self._lock = threading.Lock()
+
+    def log(self, port: str, message: str, level: str = "INFO"):
+        """输出不属于某个编程器的日志"""
+        timestamp = time.strftime("%H:%M:%S")
+        log_msg = f"[{timestamp}] [{level}] {message}"
+        print(f"[{port}] {log_msg}")
+        if self.log_callback:
+            self.log_callback(port, log_msg)
+
+    def load_firmware(self, file_path: str) -> bool:
+        """
+        加载固件文件并获取分块CRC清单，供所有串口共享
+
+        Returns:
+            是否加载成功
+        """
+        try:
+            if not os.path.exists(file_path):
+                self.log("*", f"固件文件不存在: {file_path}", "ERROR")
+                return False
+            self.release_firmware()
+            # 大文件以内存映射加载，所有串口共享同一份映射
+            image, self.block_checksums, _ = load_isp_firmware(file_path, self.config.BLOCK_SIZE)
+            self.firmware_image = image
+            self.firmware_data = image.data
+            self.log("*", f"固件加载成功，大小: {image.size} bytes，共 {len(self.block_checksums)} 块")
+            return True
+        except Exception as e:
+            self.log("*", f"加载固件失败: {e}", "ERROR")
+            return False
+
+    def release_firmware(self):
+        """释放已加载的固件（关闭内存映射），不得在烧录进行中调用"""
+        self.firmware_data = None
+        if self.firmware_image is not None:
+            self.firmware_image.close()
+            self.firmware_image = None
+
+    def _create_programmer(self, port: str) -> ISPProgrammer:
+        """创建绑定到指定串口回调的编程器"""
+        log_callback = None
+        if self.log_callback:
+            log_callback = lambda message, port=port: self.log_callback(port, message)
+        programmer = ISPProgrammer(log_callback, None, self.get_resource_path_func)
+        programmer.set_firmware(self.firmware_data, self.block_checksums)
+        for sink in self.telemetry_sinks:
+            programmer.add_telemetry_sink(sink)
+        return programmer
+
+    def _burn_port(self, port: str) -> GangResult:
+        """在一个串口上烧录（工作线程中执行）"""
+        result = GangResult(port)
+        start_time = time.time()
+        programmer = None
+        try:
+            with self._lock:
+                if self.cancel_flag:
+                    result.cancelled = True
+                    return result
+                programmer = self._create_programmer(port)
+                self.programmers[port] = programmer
+
+            progress_callback = None
+            if self.progress_callback:
+                progress_callback = lambda progress, port=port: self.progress_callback(port, progress)
+            result.success = programmer.burn_firmware(port, None, progress_callback)
+            result.cancelled = programmer.is_cancelled()
+        except Exception as e:
+            result.error = str(e)
+            self.log(port, f"烧录过程异常: {e}", "ERROR")
+        finally:
+            if programmer is not None:
+                try:
+                    programmer.protocol.close_port()
+                except:
+                    pass
+            result.elapsed = time.time() - start_time
+            if self.result_callback:
+                self.result_callback(port, result)
+        return result
+
+    def burn(self, ports: List[str], max_workers: Optional[int] = None) -> Dict[str, GangResult]:
+        """
+        在多个串口上并行烧录已加载的固件（阻塞直到全部结束）
+
+        Args:
+            ports: 串口名称列表
+            max_workers: 同时烧录的最大串口数，None时全部同时烧录
+
+        Returns:
+            {串口名称: GangResult}
+        """
+        if self.firmware_data is None:
+            raise ValueError("请先调用load_firmware加载固件")
+        ports = list(dict.fromkeys(ports))  # 去重并保持顺序
+        if not ports:
+            return {}
+
+        self.cancel_flag = False
+        self.programmers = {}
+        workers = min(len(ports), max_workers or len(ports))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="isp_gang") as executor:
+            futures = {port: executor.submit(self._burn_port, port) for port in ports}
+            return {port: future.result() for port, future in futures.items()}
+
+    def cancel(self):
+        """取消所有串口的烧录"""
+        with self._lock:
+            self.cancel_flag = True
+            programmers = list(self.programmers.values())
+        for programmer in programmers:
+            programmer.cancel()
@@ -0,0 +1,85 @@
+"""ISP设备已烧录镜像记录"""
+
+import os
+import re
+from typing import Optional, List, Tuple
+
+from rt1809_tools_config import ISPConfig
+from rt1809_tools_isp_manifest import CRCManifest
+
+
+class DeviceImageCache:
+    """
+    按串口名称记录上次成功烧录到设备上的固件镜像
+
+    镜像保存在用户目录（Windows下为%APPDATA%/RT1809_Tools/device_images），
+    分块CRC清单由CRCManifest一并缓存在镜像旁边。差分烧录时以此判断设备上
+    各扇区的现有内容；记录可能已过期（例如设备被其他工具烧录过），
+    因此使用前必须先用记录的块CRC对设备做一次VERIFY确认。
+    """
+
+    SUFFIX = ".bin"
+
+    @staticmethod
+    def cache_dir() -> str:
+        """获取镜像记录目录"""
+        base_dir = os.environ.get("APPDATA") or os.path.expanduser("~")
+        return os.path.join(base_dir, "RT1809_Tools", ISPConfig.DEVICE_IMAGE_DIR)
+
+    @staticmethod
+    def image_path(port: str) -> str:
+        """获取串口对应的镜像文件路径（串口名称中的路径字符替换为下划线）"""
+        safe_name = re.sub(r'[^A-Za-z0-9_.-]', '_', port) or "_"
+        return os.path.join(DeviceImageCache.cache_dir(), safe_name + DeviceImageCache.SUFFIX)
+
+    @staticmethod
+    def load(port: str, block_size: int = ISPConfig.BLOCK_SIZE) -> Optional[Tuple[bytes, List[Tuple[int, int]]]]:
+        """
+        读取串口上次烧录的镜像
+
+        Returns:
+            (镜像数据, 每个块的(长度, CRC)列表)，没有记录时返回None
+        """
+        path = DeviceImageCache.image_path(port)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if not data:
+            return None
+        entries, _ = CRCManifest.load_or_build(path, data, block_size)
+        return data, entries
+
+    @staticmethod
+    def save(port: str, data: bytes) -> bool:
+        """
+        记录串口本次烧录的镜像（先写临时文件再替换）
+
+        Returns:
+            是否写入成功（目录不可写时返回False，不影响烧录）
+        """
+        path = DeviceImageCache.image_path(port)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+            return True
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return False
+
+    @staticmethod
+    def forget(port: str):
+        """删除串口的镜像记录"""
+        path = DeviceImageCache.image_path(port)
+        for file_path in (path, CRCManifest.sidecar_path(path)):
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
@@ -0,0 +1,148 @@
+"""ISP固件分块CRC清单缓存"""
+
+import os
+import json
+import hashlib
+import threading
+from typing import Optional, List, Tuple
+
+from rt1809_tools_config import ISPConfig
+from rt1809_tools_isp_crc import CRCCalculator
+
+
+class CRCManifest:
+    """
+    固件分块CRC清单 - 以固件内容哈希为键缓存每个块的(长度, CRC)
+
+    清单以JSON旁路文件保存在固件文件旁边（<固件文件名>.crc.json），
+    同一固件在产线上反复烧录时，加载固件即可直接拿到verify_block所需的
+    (长度, CRC)，无需再逐块计算CRC。固件内容变化后哈希不匹配，自动重新计算。
+    """
+
+    VERSION = 1
+    SIDECAR_SUFFIX = ".crc.json"
+
+    # 进程内缓存：{(sha256, block_size): [(length, crc), ...]}
+    _memory_cache = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def sidecar_path(file_path: str) -> str:
+        """获取固件文件对应的清单文件路径"""
+        return file_path + CRCManifest.SIDECAR_SUFFIX
+
+    @staticmethod
+    def content_hash(data: bytes) -> str:
+        """计算固件内容的SHA-256哈希"""
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def build(data: bytes, block_size: int = ISPConfig.BLOCK_SIZE) -> List[Tuple[int, int]]:
+        """
+        逐块计算固件的(长度, CRC)列表
+
+        Args:
+            data: 固件数据
+            block_size: 块大小
+
+        Returns:
+            每个块的(长度, CRC)列表
+        """
+        view = memoryview(data)
+        entries = []
+        for block_address in range(0, len(data), block_size):
+            block_data = view[block_address:block_address + block_size]
+            entries.append((len(block_data), CRCCalculator.calculate_block_checksum(block_data)))
+        return entries
+
+    @staticmethod
+    def load(file_path: str, digest: str, file_size: int,
+             block_size: int = ISPConfig.BLOCK_SIZE) -> Optional[List[Tuple[int, int]]]:
+        """
+        读取清单文件，哈希、大小或块大小不匹配时返回None
+        """
+        manifest_path = CRCManifest.sidecar_path(file_path)
+        if not os.path.exists(manifest_path):
+            return None
+
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+
+            if (manifest.get("version") != CRCManifest.VERSION or
+                    manifest.get("sha256") != digest or
+                    manifest.get("file_size") != file_size or
+                    manifest.get("block_size") != block_size):
+                return None
+
+            entries = [(int(length), int(crc)) for length, crc in manifest["blocks"]]
+
+            # 块数量必须与固件大小一致
+            if len(entries) != (file_size + block_size - 1) // block_size:
+                return None
+            return entries
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    @staticmethod
+    def save(file_path: str, digest: str, file_size: int, entries: List[Tuple[int, int]],
+             block_size: int = ISPConfig.BLOCK_SIZE) -> bool:
+        """
+        写入清单文件（先写临时文件再替换，避免产生半截文件）
+
+        Returns:
+            是否写入成功（固件目录只读时返回False，不影响烧录）
+        """
+        manifest_path = CRCManifest.sidecar_path(file_path)
+        manifest = {
+            "version": CRCManifest.VERSION,
+            "sha256": digest,
+            "file_size": file_size,
+            "block_size": block_size,
+            "blocks": [[length, crc] for length, crc in entries],
+        }
+        temp_path = f"{manifest_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f)
+            os.replace(temp_path, manifest_path)
+            return True
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return False
+
+    @classmethod
+    def load_or_build(cls, file_path: str, data: bytes,
+                      block_size: int = ISPConfig.BLOCK_SIZE) -> Tuple[List[Tuple[int, int]], str]:
+        """
+        获取固件的分块CRC清单：进程内缓存 -> 清单文件 -> 重新计算并写回
+
+        Args:
+            file_path: 固件文件路径
+            data: 固件数据
+            block_size: 块大小
+
+        Returns:
+            (每个块的(长度, CRC)列表, 来源："memory" / "file" / "computed")
+        """
+        digest = cls.content_hash(data)
+        key = (digest, block_size)
+
+        with cls._lock:
+            entries = cls._memory_cache.get(key)
+        if entries is not None:
+            return entries, "memory"
+
+        entries = cls.load(file_path, digest, len(data), block_size)
+        source = "file"
+        if entries is None:
+            entries = cls.build(data, block_size)
+            cls.save(file_path, digest, len(data), entries, block_size)
+            source = "computed"
+
+        with cls._lock:
+            cls._memory_cache[key] = entries
+        return entries, source
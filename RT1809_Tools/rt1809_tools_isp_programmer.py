@@ -4,11 +4,19 @@ import os
 import sys
 import time
 import struct
-from typing import Optional, Callable
+from collections import deque
+from typing import Optional, Callable, List, Tuple
 
 from rt1809_tools_config import ISPConfig, Command, Response
 from rt1809_tools_isp_protocol import SerialProtocol
 from rt1809_tools_isp_crc import CRCCalculator
+from rt1809_tools_isp_baudrate import BaudrateMemory
+from rt1809_tools_isp_image_cache import DeviceImageCache
+from rt1809_tools_isp_firmware import FirmwareImage
+from rt1809_tools_fw_package import load_isp_firmware
+from rt1809_tools_isp_telemetry import (
+    ISPTelemetry, PacketSentEvent, AckEvent, NakEvent, RetryEvent, TimeoutEvent, response_code
+)
 
 
 class ISPProgrammer:
@@ -26,8 +34,25 @@ class ISPProgrammer:
         self.config = ISPConfig()
         self.log_callback = log_callback
         self.address_callback = address_callback
+        # 固件数据（bytes或memoryview）；由load_firmware加载时指向firmware_image.data
         self.firmware_data: Optional[bytes] = None
         self.firmware_size: int = 0
+        self.firmware_image: Optional[FirmwareImage] = None
+        # 分块CRC清单：每个块的(长度, CRC)，由load_firmware从缓存加载
+        self.block_checksums: Optional[List[Tuple[int, int]]] = None
+        # 编程发送窗口，1为严格停等（发送一包、等待应答后再发下一包）
+        self.program_window: int = self.config.PROGRAM_WINDOW
+        # PROGRAM包缓冲区环，数量为program_window+1（在途包加预构建的下一包），重复使用
+        self._program_buffers: List[bytearray] = []
+        self._program_buffer_index: int = 0
+        # 差分烧录：设备上次烧录的镜像及其分块CRC，由load_previous_image加载
+        self.differential_burn: bool = self.config.DIFFERENTIAL_BURN
+        self.previous_image: Optional[bytes] = None
+        self.previous_block_checksums: Optional[List[Tuple[int, int]]] = None
+        # 结构化遥测：注册输出后在发送、应答、重试、超时处产生事件
+        self.telemetry = ISPTelemetry()
+        # 已发送、等待应答的请求(命令, 地址, 发送完成时间)，应答按发送顺序对应
+        self._awaiting_response = deque()
         self.cancel_flag = False
         # 使用传入的资源路径获取函数，如果未传入则使用默认方法（向后兼容）
         if get_resource_path_func is not None:
@@ -79,8 +104,12 @@ class ISPProgrammer:
     def reset(self):
         """重置编程器状态"""
         self.cancel_flag = False
-        self.firmware_data = None
+        self.release_firmware()
         self.firmware_size = 0
+        self.block_checksums = None
+        self.previous_image = None
+        self.previous_block_checksums = None
+        self._awaiting_response.clear()
         try:
             self.protocol.close_port()
         except:
@@ -101,6 +130,46 @@ class ISPProgrammer:
         if self.log_callback:
             self.log_callback(log_msg)
     
+    def add_telemetry_sink(self, sink):
+        """
+        注册遥测输出（见rt1809_tools_isp_telemetry中的CounterSink、JsonLinesSink、LatencyHistogramSink）
+        """
+        self.telemetry.add_sink(sink)
+    
+    def remove_telemetry_sink(self, sink):
+        """移除遥测输出"""
+        self.telemetry.remove_sink(sink)
+        if not self.telemetry:
+            self._awaiting_response.clear()
+    
+    @staticmethod
+    def _packet_command_address(packet) -> Tuple[int, int]:
+        """从请求包头取出(命令, 地址)"""
+        return packet[1], struct.unpack_from('<I', packet, 2)[0]
+    
+    def _emit_retry(self, packet, attempt: int, reason: str):
+        """产生重试事件"""
+        if self.telemetry:
+            command, address = self._packet_command_address(packet)
+            self.telemetry.emit(RetryEvent(self.protocol.current_port_name, command, address, attempt, reason))
+    
+    def _emit_packet_sent(self, packet):
+        """产生发送事件，并记录等待应答的请求（BAUDRATE命令设备不应答）"""
+        command, address = self._packet_command_address(packet)
+        self.telemetry.emit(PacketSentEvent(self.protocol.current_port_name, command, address, len(packet)))
+        if command != Command.BAUDRATE:
+            self._awaiting_response.append((command, address, time.perf_counter()))
+    
+    def _emit_response(self, request, response_byte: int):
+        """产生ACK/NAK事件，延时从请求发送完成开始计算"""
+        command, address, sent_time = request
+        latency = time.perf_counter() - sent_time
+        port = self.protocol.current_port_name
+        if response_byte == Response.ACK:
+            self.telemetry.emit(AckEvent(port, command, address, latency))
+        else:
+            self.telemetry.emit(NakEvent(port, command, address, response_code(response_byte), latency))
+    
     def validate_packet_checksum(self, packet: bytes) -> bool:
         """
         验证数据包校验和
@@ -108,21 +177,7 @@ class ISPProgrammer:
         Returns:
             校验和是否正确
         """
-        if len(packet) < 12:  # 最小包长度
-            return False
-            
-        # 提取数据部分（不包括最后的4字节校验和）
-        data_part = packet[:-4]
-        
-        # 提取校验和
-        received_checksum = struct.unpack('<I', packet[-4:])[0]
-        
-        # 计算校验和
-        calculated_checksum = 0
-        for byte in data_part:
-            calculated_checksum = (calculated_checksum + byte) & 0xFFFFFFFF
-            
-        return calculated_checksum == received_checksum
+        return SerialProtocol.packet_checksum_valid(packet)
     
     def send_with_retry(self, packet: bytes, max_retries: int = 3, operation_name: str = "发送") -> bool:
         """
@@ -140,9 +195,12 @@ class ISPProgrammer:
             # 发送前延时，避免连续发送过快
             if attempt > 0:
                 time.sleep(0.01 * attempt)  # 递增延时
+                self._emit_retry(packet, attempt, "send_failed")
                 
             # 发送数据
             if self.protocol.send_data(packet):
+                if self.telemetry:
+                    self._emit_packet_sent(packet)
                 self.log(f"{operation_name}尝试 {attempt+1}/{max_retries} 成功", "INFO")
                 return True
                 
@@ -157,17 +215,29 @@ class ISPProgrammer:
         Returns:
             接收到的数据
         """
+        # 本次接收对应的请求（最早发送、尚未应答的请求包）
+        request = None
+        if self.telemetry and self._awaiting_response:
+            request = self._awaiting_response.popleft()
+        port = self.protocol.current_port_name
+        
         for attempt in range(max_retries):
+            if attempt > 0 and request is not None:
+                self.telemetry.emit(RetryEvent(port, request[0], request[1], attempt, "receive_timeout"))
+            
             # 接收数据
             data = self.protocol.receive_data(length, timeout)
             
             if data is not None:
+                if request is not None:
+                    self._emit_response(request, data[0])
                 self.log(f"{operation_name}尝试 {attempt+1}/{max_retries} 成功", "INFO")
                 return data
             else:
+                if request is not None:
+                    self.telemetry.emit(TimeoutEvent(port, request[0], request[1], timeout))
                 # 重试前清空输入缓冲区
-                if self.protocol.serial_port and self.protocol.serial_port.is_open:
-                    self.protocol.serial_port.reset_input_buffer()
+                self.protocol.reset_input_buffer()
                 
         self.log(f"{operation_name}失败，请检查串口连接或切换波特率后重试", "ERROR")
         return None
@@ -200,15 +270,52 @@ class ISPProgrammer:
                 self.log(f"固件文件不存在: {file_path}", "ERROR")
                 return False
                 
-            with open(file_path, 'rb') as f:
-                self.firmware_data = f.read()
-                self.firmware_size = len(self.firmware_data)
-                self.log(f"固件加载成功，大小: {self.firmware_size} bytes")
-                return True
+            self.release_firmware()
+            # 大文件以内存映射加载，按页切片编程时不拷贝数据；
+            # 固件包（.rtfw）带有分块CRC，原始固件文件的分块CRC清单未变化时直接使用缓存
+            self.firmware_image, self.block_checksums, source = load_isp_firmware(
+                file_path, self.config.BLOCK_SIZE
+            )
+            self.firmware_data = self.firmware_image.data
+            self.firmware_size = self.firmware_image.size
+            mapped = "（内存映射）" if self.firmware_image.is_mapped else ""
+            self.log(f"固件加载成功{mapped}，大小: {self.firmware_size} bytes")
+            
+            if source == "package":
+                self.log(f"已从固件包读取分块CRC，共 {len(self.block_checksums)} 块")
+            elif source == "computed":
+                self.log(f"已计算分块CRC清单，共 {len(self.block_checksums)} 块")
+            else:
+                self.log(f"已从缓存加载分块CRC清单，共 {len(self.block_checksums)} 块")
+            return True
         except Exception as e:
             self.log(f"加载固件失败: {e}", "ERROR")
             return False
     
+    def set_firmware(self, firmware_data: bytes, block_checksums: List[Tuple[int, int]]):
+        """
+        使用已加载的固件数据和分块CRC清单（多路烧录时各编程器共享同一份只读数据）
+        
+        Args:
+            firmware_data: 固件数据
+            block_checksums: 每个块的(长度, CRC)列表
+        """
+        self.release_firmware()
+        self.firmware_data = firmware_data
+        self.firmware_size = len(firmware_data)
+        self.block_checksums = block_checksums
+    
+    def release_firmware(self):
+        """
+        释放load_firmware加载的固件（关闭内存映射，使固件文件可以被覆盖）
+        
+        firmware_size保留为最近一次加载的固件大小。
+        """
+        self.firmware_data = None
+        if self.firmware_image is not None:
+            self.firmware_image.close()
+            self.firmware_image = None
+    
     def start_isp_mode(self, port: str) -> bool:
         """
         启动ISP模式 - 使用与第一个程序相同的简单方式
@@ -216,6 +323,7 @@ class ISPProgrammer:
         # 添加调试信息
         cmd_path = self.get_resource_path(self.config.ISP_CMD_FILE)
         driver_path = self.get_resource_path(self.config.ISP_DRIVER_FILE)
+        self._awaiting_response.clear()
 
 
         try:
@@ -285,10 +393,14 @@ class ISPProgrammer:
             self.log(f"进入ISP模式失败: {e}", "ERROR")
             return False
     
-    def check_id(self) -> bool:
+    def check_id(self, timeout: float = 2, max_retries: int = 2) -> bool:
         """
         检查设备ID
         
+        Args:
+            timeout: 等待应答的超时时间
+            max_retries: 接收应答的重试次数
+            
         Returns:
             是否检查成功
         """
@@ -309,7 +421,7 @@ class ISPProgrammer:
         if not self.send_with_retry(packet, 3, "检查设备ID"):
             return False
             
-        response = self.receive_with_timeout_and_retry(1, 2, 2, "接收设备ID响应")
+        response = self.receive_with_timeout_and_retry(1, timeout, max_retries, "接收设备ID响应")
         
         if response is None:
             self.log("设备ID验证失败: 无响应", "ERROR")
@@ -368,21 +480,110 @@ class ISPProgrammer:
         # 不等待响应，直接返回成功
         return True
     
-    def verify_block(self, block_address: int, block_size: int, max_retries=3) -> Optional[bool]:
+    def _switch_and_confirm_baudrate(self, baudrate: int) -> bool:
+        """切换到指定波特率，并以连续多次CHECK_ID往返确认链路稳定"""
+        if not self.set_baudrate(baudrate):
+            return False
+        for _ in range(self.config.BAUDRATE_CONFIRM_ROUNDS):
+            if not self.check_id(timeout=0.5, max_retries=1):
+                return False
+        return True
+    
+    def _fall_back_baudrate(self, stable_baudrate: int, failed_baudrate: int, attempts: int = 5) -> bool:
+        """
+        确认失败后退回到上一个稳定的波特率
+        
+        设备可能已切换到新波特率，也可能没有收到切换命令，因此先以失败的波特率
+        发送切换命令，再以稳定波特率重新打开串口并确认。失败波特率下链路不可靠，
+        切换命令可能丢失，确认失败时重新以失败波特率打开串口再发送。
+        """
+        self.log(f"退回稳定波特率 {stable_baudrate}", "WARNING")
+        port = self.protocol.current_port_name
+        for attempt in range(attempts):
+            if attempt > 0 and not self.protocol.open_port(port, failed_baudrate):
+                return False
+            if self.set_baudrate(stable_baudrate) and self.check_id(timeout=0.5, max_retries=1):
+                return True
+        self.log(f"无法退回波特率 {stable_baudrate}，请重新上电后重试", "ERROR")
+        return False
+    
+    def negotiate_baudrate(self, candidates=None) -> Optional[int]:
+        """
+        自动协商波特率
+        
+        优先切换到该串口上次记录的最佳波特率；没有记录或确认失败时，
+        从低到高逐级切换候选波特率，每级以CHECK_ID往返确认，首个确认失败的
+        波特率即退回上一个稳定波特率。协商结果按串口名称记录，供下次使用。
+        
+        Args:
+            candidates: 候选波特率，None时使用ISPConfig.BAUDRATE_CANDIDATES
+            
+        Returns:
+            最终使用的波特率，链路无法恢复时返回None
+        """
+        if candidates is None:
+            candidates = self.config.BAUDRATE_CANDIDATES
+        port = self.protocol.current_port_name
+        stable_baudrate = self.protocol.current_baudrate
+        candidates = sorted(rate for rate in set(candidates) if rate > stable_baudrate)
+        
+        remembered = BaudrateMemory.get(port)
+        if remembered is not None and remembered in candidates:
+            self.log(f"使用串口 {port} 记录的波特率 {remembered}")
+            if self._switch_and_confirm_baudrate(remembered):
+                return remembered
+            BaudrateMemory.forget(port)
+            if not self._fall_back_baudrate(stable_baudrate, remembered):
+                return None
+        
+        for baudrate in candidates:
+            if self.is_cancelled():
+                return None
+            if not self._switch_and_confirm_baudrate(baudrate):
+                if not self._fall_back_baudrate(stable_baudrate, baudrate):
+                    return None
+                break
+            stable_baudrate = baudrate
+        
+        BaudrateMemory.remember(port, stable_baudrate)
+        self.log(f"波特率协商完成: {stable_baudrate}", "SUCCESS")
+        return stable_baudrate
+    
+    def get_block_checksum(self, block_address: int, block_size: int) -> Tuple[int, int]:
+        """
+        获取数据块的长度和CRC
+        
+        Returns:
+            (块长度, CRC)
+        """
+        if (self.block_checksums is not None and block_size == self.config.BLOCK_SIZE
+                and block_address % block_size == 0):
+            block_index = block_address // block_size
+            if block_index < len(self.block_checksums):
+                return self.block_checksums[block_index]
+        
+        block_end = min(block_address + block_size, self.firmware_size)
+        block_data = memoryview(self.firmware_data)[block_address:block_end]
+        return len(block_data), CRCCalculator.calculate_block_checksum(block_data)
+    
+    def verify_block(self, block_address: int, block_size: int, max_retries=3,
+                     expected: Optional[Tuple[int, int]] = None) -> Optional[bool]:
         """
         验证数据块 - 优化时间间隔和稳定性
+        
+        Args:
+            expected: 期望的(块长度, CRC)，None时使用当前固件的值
         """
         self.update_address_display("Verify", block_address)
         
-        # 获取块数据
-        block_end = min(block_address + block_size, self.firmware_size)
-        block_data = self.firmware_data[block_address:block_end]
-
-        # 计算CRC
-        code_checksum = CRCCalculator.calculate_block_checksum(block_data)
+        # 优先使用分块CRC清单，否则现场计算
+        if expected is not None:
+            block_length, code_checksum = expected
+        else:
+            block_length, code_checksum = self.get_block_checksum(block_address, block_size)
 
         # 构建Verify请求 - 固定使用8字节数据长度
-        data = struct.pack('<II', len(block_data), code_checksum)
+        data = struct.pack('<II', block_length, code_checksum)
         
         # 确保数据为8字节
         if len(data) != 8:
@@ -403,6 +604,8 @@ class ISPProgrammer:
             return None
         
         for retry_count in range(max_retries):
+            if retry_count > 0:
+                self._emit_retry(packet, retry_count, "resend")
             # 使用稳定性优化的发送方法
             if not self.send_with_retry(packet, 2, f"验证块 0x{block_address:08X}"):
                 continue
@@ -436,12 +639,23 @@ class ISPProgrammer:
         擦除数据块 - 优化时间间隔和稳定性
         """
         self.log(f"擦除块 0x{block_address:08X}...")
-        self.update_address_display("Erase", block_address)
+        return self._erase(Command.BLOCK_ERASE, block_address, "块", max_retries)
+    
+    def erase_sector(self, sector_address: int, max_retries=2) -> bool:
+        """
+        擦除扇区（ISPConfig.SECTOR_SIZE）
+        """
+        self.log(f"擦除扇区 0x{sector_address:08X}...")
+        return self._erase(Command.SECTOR_ERASE, sector_address, "扇区", max_retries)
+    
+    def _erase(self, command: int, address: int, unit_name: str, max_retries=2) -> bool:
+        """发送擦除命令并等待应答，失败时重试"""
+        self.update_address_display("Erase", address)
 
         # 构建数据包
         packet = self.protocol.build_request_packet(
-            Command.BLOCK_ERASE,
-            block_address,
+            command,
+            address,
             b'',
             data_len=0  # 明确指定长度为0
         )
@@ -452,8 +666,10 @@ class ISPProgrammer:
             return False
 
         for retry_count in range(max_retries):
+            if retry_count > 0:
+                self._emit_retry(packet, retry_count, "resend")
             # 使用稳定性优化的发送方法
-            if not self.send_with_retry(packet, 2, f"擦除块 0x{block_address:08X}"):
+            if not self.send_with_retry(packet, 2, f"擦除{unit_name} 0x{address:08X}"):
                 continue
                 
             # 使用稳定性优化的接收方法
@@ -465,7 +681,7 @@ class ISPProgrammer:
             response_byte = response[0]
         
             if response_byte == Response.ACK:
-                self.log(f"块 0x{block_address:08X} 擦除成功", "SUCCESS")
+                self.log(f"{unit_name} 0x{address:08X} 擦除成功", "SUCCESS")
                 return True
             elif response_byte == Response.CHECKSUM_FAIL:
                 if retry_count < max_retries - 1:
@@ -477,84 +693,274 @@ class ISPProgrammer:
                 self.log(f"擦除失败: 0x{response_byte:08X}:校验重试次数用尽", "ERROR")
                 return False
     
+    def set_program_window(self, window: int):
+        """
+        设置编程发送窗口
+        
+        Args:
+            window: 允许未应答的PROGRAM包数量，1为严格停等模式
+        """
+        if window < 1:
+            raise ValueError(f"编程窗口必须大于等于1，当前值: {window}")
+        self.program_window = window
+    
+    def _next_program_buffer(self) -> bytearray:
+        """
+        取出下一个可重复使用的PROGRAM包缓冲区
+        
+        缓冲区按环形轮转，共program_window+1个：在途的数据包和预构建的下一包
+        始终是最近构建的几个，不会被覆盖。
+        """
+        ring_size = max(1, self.program_window) + 1
+        if len(self._program_buffers) != ring_size:
+            self._program_buffers = [
+                self.protocol.allocate_packet_buffer(self.config.PROGRAM_SIZE) for _ in range(ring_size)
+            ]
+            self._program_buffer_index = 0
+        buffer = self._program_buffers[self._program_buffer_index]
+        self._program_buffer_index = (self._program_buffer_index + 1) % ring_size
+        return buffer
+    
+    def build_program_packet(self, program_address: int) -> Optional[memoryview]:
+        """
+        构建一个2KB的PROGRAM数据包
+        
+        数据包在复用的缓冲区中就地构建，固件数据以memoryview切片拷入，
+        末尾不足2KB的部分直接在缓冲区中填充0xFF。
+        
+        Returns:
+            指向数据包的memoryview
+        """
+        # 获取编程数据
+        data_end = min(program_address + self.config.PROGRAM_SIZE, self.firmware_size)
+        program_data = memoryview(self.firmware_data)[program_address:data_end]
+        
+        # 构建数据包，不足2KB补0xFF；校验和由build_request_packet_into一次算出，无需再次验证
+        return self.protocol.build_request_packet_into(
+            self._next_program_buffer(),
+            Command.PROGRAM,
+            program_address,
+            program_data,
+            data_len=self.config.PROGRAM_SIZE,
+            pad_byte=0xFF
+        )
+    
+    def program_packet_with_retry(self, packet, program_address: int, max_retries=2) -> bool:
+        """
+        停等方式发送一个PROGRAM数据包并等待应答，失败时重试
+        
+        Returns:
+            是否编程成功
+        """
+        for retry_count in range(max_retries):
+            if retry_count > 0:
+                self._emit_retry(packet, retry_count, "resend")
+            # 使用稳定性优化的发送方法
+            if not self.send_with_retry(packet, 2, f"编程块 0x{program_address:08X}"):
+                continue
+                
+            # 使用稳定性优化的接收方法
+            response = self.receive_with_timeout_and_retry(1, 1, 2, f"接收编程响应")  # 减少等待时间
+            
+            if response is None:
+                continue
+                
+            response_byte = response[0]
+            
+            if response_byte == Response.ACK:
+                return True
+            elif response_byte == Response.CHECKSUM_FAIL:
+                if retry_count == max_retries - 1:
+                    time.sleep(0.05)  # 减少重试间隔
+            else:
+                self.log(f"编程失败 @ 0x{program_address:08X}: 0x{response_byte:02X}", "ERROR")
+                return False
+        return False
+    
+    def _update_program_progress(self, program_address: int, progress_callback=None):
+        """更新编程进度"""
+        if progress_callback:
+            progress = (program_address + self.config.PROGRAM_SIZE) * 100 // self.firmware_size
+            progress_callback(progress)
+    
     def program_block(self, block_address: int, block_size: int, progress_callback=None, max_retries=2) -> bool:
         """
-        编程数据块 - 优化时间间隔和稳定性
+        编程数据块 - 流水线发送
         """
         self.log(f"编程块 0x{block_address:08X}...")
         self.update_address_display("Program", block_address)
         
-        # 按2KB为单位编程
-        for offset in range(0, block_size, self.config.PROGRAM_SIZE):
+        # 本块内需要编程的地址（超出固件范围的部分不编程）
+        block_end = min(block_address + block_size, self.firmware_size)
+        program_addresses = list(range(block_address, block_end, self.config.PROGRAM_SIZE))
+        if not self.program_pages(program_addresses, progress_callback, max_retries):
+            return False
+        
+        self.log(f"块 0x{block_address:08X} 编程成功", "SUCCESS")
+        return True
+    
+    def program_pages(self, program_addresses: List[int], progress_callback=None, max_retries=2) -> bool:
+        """
+        按2KB为单位编程指定地址的页 - 流水线发送
+        
+        等待设备写Flash应答期间预先构建下一个数据包；
+        program_window大于1时，最多连续发送program_window个数据包后再依次读取应答。
+        任一数据包应答失败时，先收齐其余在途数据包的应答，再以停等模式重发所有未确认的数据包。
+        """
+        window = max(1, self.program_window)
+        
+        # 在途数据包：(地址, 数据包, 是否已发送成功)
+        in_flight = deque()
+        next_index = 0
+        next_packet = None
+        
+        while next_index < len(program_addresses) or in_flight:
             # 检查取消标志
             if self.is_cancelled():
                 self.log("编程被取消", "WARNING")
                 return False
-            program_address = block_address + offset
             
-            # 检查是否超出固件范围
-            if program_address >= self.firmware_size:
-                break
+            # 填满发送窗口
+            while next_index < len(program_addresses) and len(in_flight) < window:
+                program_address = program_addresses[next_index]
+                packet = next_packet or self.build_program_packet(program_address)
+                next_packet = None
+                if packet is None:
+                    return False
+                sent = self.send_with_retry(packet, 2, f"编程块 0x{program_address:08X}")
+                in_flight.append((program_address, packet, sent))
+                next_index += 1
+                if not sent:
+                    break
             
-            # 获取编程数据
-            data_end = min(program_address + self.config.PROGRAM_SIZE, self.firmware_size)
-            program_data = self.firmware_data[program_address:data_end]
+            # 等待应答期间预先构建下一个数据包
+            if next_packet is None and next_index < len(program_addresses):
+                next_packet = self.build_program_packet(program_addresses[next_index])
+                if next_packet is None:
+                    return False
             
-            # 补齐到2KB
-            if len(program_data) < self.config.PROGRAM_SIZE:
-                program_data += b'\xFF' * (self.config.PROGRAM_SIZE - len(program_data))
+            program_address, packet, sent = in_flight.popleft()
+            response = None
+            if sent:
+                response = self.receive_with_timeout_and_retry(1, 1, 2, f"接收编程响应")
             
-            # 构建数据包
-            packet = self.protocol.build_request_packet(
-                Command.PROGRAM,
-                program_address,
-                program_data
-            )
+            if response is not None and response[0] == Response.ACK:
+                self._update_program_progress(program_address, progress_callback)
+                continue
             
-            # 验证数据包校验和
-            if not self.validate_packet_checksum(packet):
-                self.log("数据包校验和错误", "ERROR")
+            if response is not None and response[0] != Response.CHECKSUM_FAIL:
+                self.log(f"编程失败 @ 0x{program_address:08X}: 0x{response[0]:02X}", "ERROR")
                 return False
             
-            # 重试机制 - 优化时间间隔
-            success = False
-            for retry_count in range(max_retries):
-                # 使用稳定性优化的发送方法
-                if not self.send_with_retry(packet, 2, f"编程块 0x{program_address:08X}"):
-                    continue
-                    
-                # 使用稳定性优化的接收方法
-                response = self.receive_with_timeout_and_retry(1, 1, 2, f"接收编程响应")  # 减少等待时间
-                
-                if response is None:
-                    continue
-                    
-                response_byte = response[0]
-                
-                if response_byte == Response.ACK:
-                    success = True
-                    break  # 成功，跳出重试循环
-                elif response_byte == Response.CHECKSUM_FAIL:
-                    if retry_count == max_retries - 1:
-                        time.sleep(0.05)  # 减少重试间隔
-                elif response_byte is None:
-                    if retry_count == max_retries - 1:
-                        time.sleep(0.05)  # 减少重试间隔
+            # 收齐其余在途数据包的应答，未确认的与失败的数据包一起退回停等模式重发
+            retry_packets = [(program_address, packet, max_retries - 1)]
+            for pending_address, pending_packet, pending_sent in in_flight:
+                pending_response = None
+                if pending_sent:
+                    pending_response = self.receive_with_timeout_and_retry(1, 1, 1, f"接收编程响应")
+                if pending_response is not None and pending_response[0] == Response.ACK:
+                    self._update_program_progress(pending_address, progress_callback)
                 else:
-                    self.log(f"编程失败 @ 0x{program_address:08X}: 0x{response_byte:02X}", "ERROR")
-                    return False
+                    retry_packets.append((pending_address, pending_packet, max_retries))
+            in_flight.clear()
             
-            if not success:
-                return False
+            self.log(f"编程 0x{program_address:08X} 未确认，停等重发 {len(retry_packets)} 个数据包", "WARNING")
+            # 在途数据包均已应答或超时，清空收发缓冲区后重发
+            self.protocol.reset_input_buffer()
+            self.protocol.reset_output_buffer()
             
-            # 更新进度
-            if progress_callback:
-                progress = (program_address + self.config.PROGRAM_SIZE) * 100 // self.firmware_size
-                progress_callback(progress)
+            for retry_address, retry_packet, retries in retry_packets:
+                if self.is_cancelled():
+                    self.log("编程被取消", "WARNING")
+                    return False
+                self._emit_retry(retry_packet, 1, "resend")
+                if not self.program_packet_with_retry(retry_packet, retry_address, retries):
+                    return False
+                self._update_program_progress(retry_address, progress_callback)
         
-        self.log(f"块 0x{block_address:08X} 编程成功", "SUCCESS")
         return True
     
+    def load_previous_image(self, port: str):
+        """加载该串口上次烧录的镜像记录，供差分烧录使用"""
+        previous = DeviceImageCache.load(port, self.config.BLOCK_SIZE)
+        if previous is None:
+            self.previous_image, self.previous_block_checksums = None, None
+            self.log("没有该串口的烧录记录，本次按整块烧录")
+            return
+        self.previous_image, self.previous_block_checksums = previous
+        self.log(f"已加载该串口上次烧录的镜像，大小: {len(self.previous_image)} bytes")
+    
+    def get_changed_sectors(self, block_address: int) -> Optional[List[int]]:
+        """
+        对比新固件与上次烧录的镜像，找出块内内容不同的扇区
+        
+        Returns:
+            变化扇区的起始地址列表；没有记录或块长度不同（无法差分）时返回None
+        """
+        if self.previous_image is None:
+            return None
+        block_end = min(block_address + self.config.BLOCK_SIZE, self.firmware_size)
+        previous_end = min(block_address + self.config.BLOCK_SIZE, len(self.previous_image))
+        if previous_end != block_end:
+            return None
+        
+        new_view = memoryview(self.firmware_data)
+        old_view = memoryview(self.previous_image)
+        changed = []
+        for sector_address in range(block_address, block_end, self.config.SECTOR_SIZE):
+            sector_end = min(sector_address + self.config.SECTOR_SIZE, block_end)
+            if new_view[sector_address:sector_end] != old_view[sector_address:sector_end]:
+                changed.append(sector_address)
+        return changed
+    
+    def burn_block_differential(self, block_address: int, progress_callback=None) -> Optional[bool]:
+        """
+        差分烧录数据块：只擦除并编程与上次烧录镜像不同的扇区
+        
+        先用上次镜像的块CRC做一次VERIFY，确认设备上确实是记录中的内容，
+        再对变化的扇区执行SECTOR_ERASE和PROGRAM，最后以新固件的CRC复核整块。
+        
+        Returns:
+            True表示差分烧录成功，False表示不适用或复核未通过（需整块烧录），None表示通讯失败
+        """
+        changed_sectors = self.get_changed_sectors(block_address)
+        if changed_sectors is None or len(changed_sectors) > self.config.DIFF_MAX_SECTORS:
+            return False
+        
+        block_index = block_address // self.config.BLOCK_SIZE
+        if block_index >= len(self.previous_block_checksums):
+            return False
+        
+        # 确认设备上的内容与记录一致
+        previous_result = self.verify_block(block_address, self.config.BLOCK_SIZE, max_retries=3,
+                                            expected=self.previous_block_checksums[block_index])
+        if previous_result is not True:
+            if previous_result is False:
+                self.log(f"块 0x{block_address:08X} 与烧录记录不一致，改为整块烧录", "WARNING")
+            return previous_result
+        
+        self.log(f"差分烧录块 0x{block_address:08X}，变化扇区 {len(changed_sectors)} 个")
+        block_end = min(block_address + self.config.BLOCK_SIZE, self.firmware_size)
+        for sector_address in changed_sectors:
+            if self.is_cancelled():
+                self.log("编程被取消", "WARNING")
+                return None
+            if not self.erase_sector(sector_address, max_retries=3):
+                return None
+            sector_end = min(sector_address + self.config.SECTOR_SIZE, block_end)
+            self.update_address_display("Program", sector_address)
+            program_addresses = list(range(sector_address, sector_end, self.config.PROGRAM_SIZE))
+            if not self.program_pages(program_addresses, progress_callback, max_retries=3):
+                return None
+        
+        # 以新固件的CRC复核整块
+        result = self.verify_block(block_address, self.config.BLOCK_SIZE, max_retries=3)
+        if result is False:
+            self.log(f"块 0x{block_address:08X} 差分烧录复核失败，改为整块烧录", "WARNING")
+        elif result:
+            self.log(f"块 0x{block_address:08X} 差分烧录成功", "SUCCESS")
+        return result
+    
     def exit_isp_mode(self) -> bool:
         """
         退出ISP模式
@@ -594,9 +1000,12 @@ class ISPProgrammer:
             self.log(f"退出ISP模式失败: 0x{response_byte:02X}", "ERROR")
             return False
     
-    def burn_firmware(self, port: str, firmware_path: str, progress_callback=None) -> bool:
+    def burn_firmware(self, port: str, firmware_path: Optional[str], progress_callback=None) -> bool:
         """
         烧录固件主流程 - 全局稳定性控制
+        
+        Args:
+            firmware_path: 固件文件路径，None时使用set_firmware设置的固件
         """
         try:
             # 打开串口
@@ -612,8 +1021,16 @@ class ISPProgrammer:
             time.sleep(0.1)
             
             # 加载固件
-            if not self.load_firmware(firmware_path):
+            if firmware_path is not None:
+                if not self.load_firmware(firmware_path):
+                    return False
+            elif self.firmware_data is None:
+                self.log("未加载固件", "ERROR")
                 return False
+            
+            # 差分烧录时加载该串口上次烧录的镜像
+            if self.differential_burn:
+                self.load_previous_image(port)
 
             # 检查是否取消
             if self.is_cancelled():
@@ -633,8 +1050,11 @@ class ISPProgrammer:
             if not self.check_id():
                 return False
             
-            # 设置高速波特率
-            if not self.set_baudrate(self.config.NEW_BAUDRATE):
+            # 设置高速波特率，AUTO_BAUDRATE时自动协商
+            if self.config.NEW_BAUDRATE == self.config.AUTO_BAUDRATE:
+                if self.negotiate_baudrate() is None:
+                    return False
+            elif not self.set_baudrate(self.config.NEW_BAUDRATE):
                 return False
             
             # 按块处理固件
@@ -662,7 +1082,15 @@ class ISPProgrammer:
                 if verify_result is None:
                     return False
                 elif verify_result is False:
-                    # 需要更新
+                    # 需要更新，差分烧录不适用时整块擦除后编程
+                    if self.differential_burn:
+                        differential_result = self.burn_block_differential(block_address, progress_callback)
+                        if differential_result is None:
+                            self.log(f"烧录过程出错：设备可能已断开连接，请检查", "ERROR")
+                            return False
+                        verify_result = differential_result
+                    
+                if verify_result is False:
                     if not self.erase_block(block_address, max_retries=3):
                         return False
                     
@@ -682,6 +1110,10 @@ class ISPProgrammer:
             if not self.exit_isp_mode():
                 return False
             
+            # 记录本次烧录的镜像，供下次差分烧录
+            if self.differential_burn and not DeviceImageCache.save(port, self.firmware_data):
+                self.log("烧录记录保存失败，下次将按整块烧录", "WARNING")
+            
             self.log("固件烧录成功！", "SUCCESS")
             return True
             
@@ -689,4 +1121,7 @@ class ISPProgrammer:
             self.log(f"烧录过程出错: {e}", "ERROR")
             return False
         finally:
-            self.protocol.close_port()
\ No newline at end of file
+            self.protocol.close_port()
+            # 本次从文件加载的固件用完即释放，烧录间隙可以重新生成固件文件
+            if firmware_path is not None:
+                self.release_firmware()
\ No newline at end of file
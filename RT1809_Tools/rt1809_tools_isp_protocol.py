@@ -2,6 +2,7 @@
 
 import struct
 import time
+import threading
 from typing import Optional
 import serial
 import serial.tools.list_ports
@@ -12,17 +13,37 @@ from rt1809_tools_config import ISPConfig, Command
 class SerialProtocol:
     """串口通讯协议实现 - 优化稳定性"""
     
+    HEADER_SIZE = 8  # Start Code + Command + Address + DataLen
+    CHECKSUM_SIZE = 4
+    _HEADER_STRUCT = struct.Struct('<BBIH')
+    _CHECKSUM_STRUCT = struct.Struct('<I')
+    
     def __init__(self):
         """初始化串口协议"""
         self.serial_port: Optional[serial.Serial] = None
         self.config = ISPConfig()
         self.current_port_name: str = ""
+        self.current_baudrate: int = 0
+        # 事件驱动收发：后台线程持续读取串口数据放入接收缓冲区，
+        # receive_data在条件变量上等待，数据到达即返回，不再轮询
+        self.event_driven: bool = self.config.EVENT_DRIVEN_IO
+        self._rx_buffer = bytearray()
+        self._rx_condition = threading.Condition()
+        self._reader_thread: Optional[threading.Thread] = None
+        self._reader_stop = threading.Event()
+        
+    def set_event_driven(self, enabled: bool):
+        """
+        切换事件驱动收发模式，串口已打开时在下次open_port时生效
+        """
+        self.event_driven = enabled
         
     def open_port(self, port: str, baudrate: int) -> bool:
         """
         打开串口 - 优化稳定性参数
         """
         try:
+            self._stop_reader()
             if self.serial_port and self.serial_port.is_open:
                 self.serial_port.close()
             
@@ -46,6 +67,10 @@ class SerialProtocol:
                 self.serial_port.reset_output_buffer()
                 
             self.current_port_name = port
+            self.current_baudrate = baudrate
+            
+            if self.event_driven:
+                self._start_reader()
             return True
         except Exception as e:
             print(f"打开串口失败: {e}")
@@ -53,17 +78,86 @@ class SerialProtocol:
     
     def close_port(self):
         """关闭串口"""
+        self._stop_reader()
         if self.serial_port and self.serial_port.is_open:
             self.serial_port.close()
     
+    def _start_reader(self):
+        """启动后台接收线程"""
+        self._stop_reader()
+        with self._rx_condition:
+            self._rx_buffer.clear()
+        self._reader_stop.clear()
+        self._reader_thread = threading.Thread(
+            target=self._reader_loop,
+            args=(self.serial_port,),
+            name=f"isp_reader_{self.current_port_name}",
+            daemon=True
+        )
+        self._reader_thread.start()
+    
+    def _stop_reader(self):
+        """停止后台接收线程"""
+        thread = self._reader_thread
+        if thread is None:
+            return
+        self._reader_stop.set()
+        try:
+            # 中断阻塞中的read
+            self.serial_port.cancel_read()
+        except Exception:
+            pass
+        thread.join(timeout=1)
+        self._reader_thread = None
+        with self._rx_condition:
+            self._rx_condition.notify_all()
+    
+    def _reader_loop(self, serial_port):
+        """
+        后台接收线程：read在首个字节到达时即返回，随后一次取走驱动缓冲区内的全部数据
+        """
+        while not self._reader_stop.is_set():
+            try:
+                chunk = serial_port.read(max(1, serial_port.in_waiting))
+            except Exception as e:
+                if not self._reader_stop.is_set():
+                    print(f"接收线程异常退出: {e}")
+                break
+            if chunk:
+                with self._rx_condition:
+                    self._rx_buffer.extend(chunk)
+                    self._rx_condition.notify_all()
+        with self._rx_condition:
+            self._rx_condition.notify_all()
+    
+    def reset_input_buffer(self):
+        """清空输入缓冲区（包括事件驱动模式下已读入的数据）"""
+        if self.serial_port and self.serial_port.is_open:
+            self.serial_port.reset_input_buffer()
+        with self._rx_condition:
+            self._rx_buffer.clear()
+    
+    def reset_output_buffer(self):
+        """
+        清空输出缓冲区中尚未发出的数据
+
+        只在出错恢复且没有在途数据包时调用（打开串口时已清空）
+        """
+        if self.serial_port and self.serial_port.is_open:
+            self.serial_port.reset_output_buffer()
+    
     def send_data(self, data: bytes) -> bool:
         """
         发送数据 - 增加稳定性措施
         """
         try:
             if self.serial_port and self.serial_port.is_open:
-                # 发送前清空输出缓冲区
-                self.serial_port.reset_output_buffer()
+                # 不在发送前清空输出缓冲区：流水线编程时其中可能还有在途数据包未发完
+                
+                # 事件驱动模式下一次写入，由驱动负责分段；应答由接收线程等待
+                if self._reader_thread is not None:
+                    self.serial_port.write(data)
+                    return True
                 
                 # 分段发送数据，每段之间增加小延时
                 chunk_size = 2048  # 每次发送的字节数
@@ -83,6 +177,8 @@ class SerialProtocol:
         """
         接收数据 - 增加稳定性措施
         """
+        if self._reader_thread is not None:
+            return self._receive_buffered(length, timeout)
         try:
             if self.serial_port and self.serial_port.is_open:
                 # 设置超时
@@ -115,75 +211,134 @@ class SerialProtocol:
             print(f"接收数据失败: {e}")
             return None
     
-    def build_request_packet(self, command: int, address: int, data: bytes = b'', data_len: Optional[int] = None) -> bytes:
+    def _receive_buffered(self, length: int, timeout: float) -> Optional[bytes]:
         """
-        构建请求包 - 严格按照字段字节数规定
+        事件驱动模式下接收数据：在条件变量上等待接收线程放入足够的数据
+        """
+        deadline = time.monotonic() + timeout
+        with self._rx_condition:
+            while len(self._rx_buffer) < length:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._reader_thread is None or not self._reader_thread.is_alive():
+                    return None
+                self._rx_condition.wait(remaining)
+            data = bytes(self._rx_buffer[:length])
+            del self._rx_buffer[:length]
+            return data
+    
+    def packet_size(self, data_len: int) -> int:
+        """计算DataLen为data_len时完整请求包的字节数"""
+        return self.HEADER_SIZE + data_len + self.CHECKSUM_SIZE
+    
+    def allocate_packet_buffer(self, max_data_len: int) -> bytearray:
+        """
+        分配可重复使用的请求包缓冲区
         
-        数据包结构:
-        - Start Code (1字节)
-        - Command (1字节) 
-        - Address (4字节，小端)
-        - DataLen (2字节，小端，表示后面Data的长度)
-        - Data (n字节)
-        - Checksum (4字节，小端)
+        Args:
+            max_data_len: 缓冲区可容纳的最大DataLen
+            
+        Returns:
+            供build_request_packet_into使用的缓冲区
+        """
+        return bytearray(self.packet_size(max_data_len))
+    
+    def build_request_packet_into(self, buffer: bytearray, command: int, address: int, data=b'',
+                                  data_len: Optional[int] = None, pad_byte: int = 0x00) -> memoryview:
+        """
+        在预分配的缓冲区中就地构建请求包（零拷贝）
+        
+        包头用struct.pack_into写入，数据直接拷入缓冲区，不足DataLen的部分
+        用pad_byte就地填充，校验和用sum()一次求出。返回的memoryview引用buffer，
+        在buffer被下一次构建覆盖之前有效。
         
         Args:
+            buffer: allocate_packet_buffer分配的缓冲区
             command: 命令字节 (1字节)
             address: 地址 (4字节)
-            data: 数据 (n字节)
+            data: 数据 (bytes/bytearray/memoryview)
             data_len: 可选的2字节数据长度，如果为None则使用len(data)
+            pad_byte: 数据不足DataLen时的填充字节
             
         Returns:
-            完整的请求包
+            指向完整请求包的memoryview
         """
-        # 验证和调整各字段的字节数
-        packet = bytearray()
-        
-        # 1. Start Code (1字节)
+        # 验证各字段的字节数
         if not (0 <= self.config.START_CODE <= 0xFF):
             raise ValueError(f"Start Code必须在0-255范围内，当前值: {self.config.START_CODE}")
-        packet.append(self.config.START_CODE)
-        
-        # 2. Command (1字节)
         if not (0 <= command <= 0xFF):
             raise ValueError(f"Command必须在0-255范围内，当前值: {command}")
-        packet.append(command)
-        
-        # 3. Address (4字节，小端)
         if not (0 <= address <= 0xFFFFFFFF):
             raise ValueError(f"Address必须在0-4294967295范围内，当前值: {address}")
-        packet.extend(struct.pack('<I', address))  # 小端4字节
-        
-        # 4. DataLen (2字节，小端)
         if data_len is None:
             data_len = len(data)
-        
         if not (0 <= data_len <= 0xFFFF):
             raise ValueError(f"DataLen必须在0-65535范围内，当前值: {data_len}")
-        packet.extend(struct.pack('<H', data_len))  # 小端2字节
         
-        # 5. Data (n字节)
-        # 如果实际数据长度与声明的DataLen不符，进行调整
-        actual_data_len = len(data)
-        if actual_data_len != data_len:
-            if actual_data_len < data_len:
-                # 数据不足，填充0x00
-                data = data + b'\x00' * (data_len - actual_data_len)
-            else:
-                # 数据过长，截断
-                data = data[:data_len]
-                print(f"警告: 数据被截断，从{actual_data_len}字节到{data_len}字节")
+        packet_size = self.packet_size(data_len)
+        if len(buffer) < packet_size:
+            raise ValueError(f"缓冲区太小，需要{packet_size}字节，当前: {len(buffer)}字节")
+        packet = memoryview(buffer)[:packet_size]
         
-        packet.extend(data)
+        # 1~4. Start Code、Command、Address(小端4字节)、DataLen(小端2字节)
+        self._HEADER_STRUCT.pack_into(packet, 0, self.config.START_CODE, command, address, data_len)
+        
+        # 5. Data (n字节)，数据过长截断，不足则填充
+        actual_data_len = len(data)
+        copy_len = min(actual_data_len, data_len)
+        if actual_data_len > data_len:
+            print(f"警告: 数据被截断，从{actual_data_len}字节到{data_len}字节")
+        data_start = self.HEADER_SIZE
+        packet[data_start:data_start + copy_len] = memoryview(data)[:copy_len]
+        if copy_len < data_len:
+            packet[data_start + copy_len:data_start + data_len] = bytes((pad_byte,)) * (data_len - copy_len)
         
         # 6. Checksum (4字节，小端)
-        checksum = 0
-        for byte in packet:
-            checksum = (checksum + byte) & 0xFFFFFFFF  # 限制为32位无符号整数
+        checksum_offset = data_start + data_len
+        checksum = sum(packet[:checksum_offset]) & 0xFFFFFFFF  # 限制为32位无符号整数
+        self._CHECKSUM_STRUCT.pack_into(packet, checksum_offset, checksum)
         
-        packet.extend(struct.pack('<I', checksum))  # 小端4字节
+        return packet
+    
+    def build_request_packet(self, command: int, address: int, data: bytes = b'', data_len: Optional[int] = None) -> bytes:
+        """
+        构建请求包 - 严格按照字段字节数规定
         
-        return bytes(packet)
+        数据包结构:
+        - Start Code (1字节)
+        - Command (1字节) 
+        - Address (4字节，小端)
+        - DataLen (2字节，小端，表示后面Data的长度)
+        - Data (n字节)
+        - Checksum (4字节，小端)
+        
+        Args:
+            command: 命令字节 (1字节)
+            address: 地址 (4字节)
+            data: 数据 (n字节)
+            data_len: 可选的2字节数据长度，如果为None则使用len(data)
+            
+        Returns:
+            完整的请求包
+        """
+        if data_len is None:
+            data_len = len(data)
+        buffer = self.allocate_packet_buffer(max(0, data_len))
+        packet = self.build_request_packet_into(buffer, command, address, data, data_len)
+        return packet.tobytes()
+    
+    @staticmethod
+    def packet_checksum_valid(packet) -> bool:
+        """
+        验证请求包末尾4字节的校验和
+        
+        Returns:
+            校验和是否正确
+        """
+        if len(packet) < SerialProtocol.HEADER_SIZE + SerialProtocol.CHECKSUM_SIZE:  # 最小包长度
+            return False
+        checksum_offset = len(packet) - SerialProtocol.CHECKSUM_SIZE
+        received_checksum = SerialProtocol._CHECKSUM_STRUCT.unpack_from(packet, checksum_offset)[0]
+        return (sum(memoryview(packet)[:checksum_offset]) & 0xFFFFFFFF) == received_checksum
     
     def wait_for_response(self, timeout: float = 2) -> Optional[int]:
         """
@@ -198,4 +353,4 @@ class SerialProtocol:
         response = self.receive_data(1, timeout)
         if response:
             return response[0]
-        return None
\ No newline at end of file
+        return None
\ No newline at end of file
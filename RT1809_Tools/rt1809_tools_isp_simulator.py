@@ -0,0 +1,315 @@
+"""ISP虚拟设备（基于Linux/macOS伪终端的RT1809 ISP目标模拟器）"""
+
+import os
+import time
+import random
+import select
+import struct
+import threading
+from collections import Counter
+from typing import Optional
+
+try:
+    import tty
+except ImportError:  # Windows没有伪终端
+    tty = None
+
+from rt1809_tools_config import ISPConfig, Command, Response
+from rt1809_tools_isp_crc import CRCCalculator
+
+
+class VirtualISPDevice:
+    """
+    ISP虚拟设备 - 无需硬件即可运行ISPProgrammer.burn_firmware
+
+    在进程内创建一个伪终端，ISPProgrammer打开port（从设备路径）即可与模拟器通讯。
+    模拟器实现与rt1809_tools_config相同的数据包格式和Response应答码：
+    进入ISP模式的握手（ISP_WriterCMD、ISP_DriverCode的CodeSize/Checksum回传），
+    以及BAUDRATE、CHECK_ID、SECTOR_ERASE、BLOCK_ERASE、PROGRAM、VERIFY、EXIT_ISP_MODE命令。
+    Flash按NOR特性模拟：擦除置0xFF，编程只能把1写成0。
+
+    伪终端没有真实的比特时钟，模拟器按协议中设置的波特率计算线路时间
+    （throttle_baudrate=True时按每字节10位延时），并可配置Flash写入/擦除延时，
+    以及按固定随机种子注入的校验错误和应答丢失，用于可重复地复现重试风暴。
+
+    用法:
+        with VirtualISPDevice(program_latency=0.002) as device:
+            programmer.burn_firmware(device.port, firmware_path)
+    """
+
+    DRIVER_HEAD_SIZE = 256
+    DRIVER_CODE_SIZE = 0x1D0E
+    CODE_SIZE_REPLY = b'\x0E\x1D\x00\x00'
+    CODE_CHECKSUM_REPLY = b'\xD4\x13\x06\x00'
+    BOOT_SIZE = 1 + 39  # 0x00 + ISP_WriterCMD前39字节
+
+    # 设备状态
+    STATE_BOOT = "boot"
+    STATE_DRIVER_HEAD = "driver_head"
+    STATE_DRIVER_CODE = "driver_code"
+    STATE_ISP = "isp"
+
+    def __init__(self, flash_size: int = 0x800000, program_latency: float = 0.0, erase_latency: float = 0.0,
+                 sector_erase_latency: float = 0.0, verify_latency: float = 0.0, throttle_baudrate: bool = False,
+                 error_rate: float = 0.0, drop_rate: float = 0.0, max_baudrate: Optional[int] = None,
+                 overspeed_drop_rate: float = 1.0, seed: int = 0):
+        """
+        初始化虚拟设备
+
+        Args:
+            flash_size: Flash容量
+            program_latency: 每个PROGRAM包的Flash写入延时（秒）
+            erase_latency: BLOCK_ERASE延时（秒）
+            sector_erase_latency: SECTOR_ERASE延时（秒）
+            verify_latency: VERIFY延时（秒）
+            throttle_baudrate: 是否按当前波特率模拟线路传输时间
+            error_rate: 数据包被判为校验错误（应答CHECKSUM_FAIL）的概率
+            drop_rate: 数据包丢失（不应答）的概率
+            max_baudrate: 链路能稳定工作的最高波特率
+            overspeed_drop_rate: 超过max_baudrate时数据包丢失的概率
+            seed: 错误注入的随机种子
+        """
+        if tty is None:
+            raise RuntimeError("ISP虚拟设备需要伪终端支持（Linux/macOS）")
+        self.config = ISPConfig()
+        self.flash = bytearray(b'\xFF' * flash_size)
+        self.program_latency = program_latency
+        self.erase_latency = erase_latency
+        self.sector_erase_latency = sector_erase_latency
+        self.verify_latency = verify_latency
+        self.throttle_baudrate = throttle_baudrate
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.max_baudrate = max_baudrate
+        self.overspeed_drop_rate = overspeed_drop_rate
+        self.random = random.Random(seed)
+
+        self.master_fd: Optional[int] = None
+        self.slave_fd: Optional[int] = None
+        self.port: str = ""
+        self.state = self.STATE_BOOT
+        self.baudrate = self.config.INITIAL_BAUDRATE
+        self._rx = bytearray()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+        # 统计信息
+        self.commands = Counter()  # 各命令收到的次数（按Command名称）
+        self.responses = Counter()  # 各应答发出的次数（按Response名称）
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.injected_errors = 0
+        self.dropped_packets = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self) -> str:
+        """
+        创建伪终端并启动模拟线程
+
+        Returns:
+            供ISPProgrammer打开的串口路径
+        """
+        if self._thread is not None:
+            return self.port
+        self.master_fd, self.slave_fd = os.openpty()
+        # 从设备端保持打开，主机反复开关串口时主设备端不会读到EIO
+        tty.setraw(self.slave_fd)
+        self.port = os.ttyname(self.slave_fd)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="isp_simulator", daemon=True)
+        self._thread.start()
+        return self.port
+
+    def stop(self):
+        """停止模拟线程并关闭伪终端"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+        for fd in (self.master_fd, self.slave_fd):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self.master_fd = self.slave_fd = None
+
+    def reset(self):
+        """模拟设备复位（重新上电），回到等待进入ISP模式的状态"""
+        self.state = self.STATE_BOOT
+        self.baudrate = self.config.INITIAL_BAUDRATE
+        self._rx.clear()
+
+    def load_flash(self, data: bytes, address: int = 0):
+        """预置Flash内容（模拟设备上已有的固件）"""
+        self.flash[address:address + len(data)] = data
+
+    def stats(self) -> dict:
+        """获取统计信息"""
+        return {
+            "commands": dict(self.commands),
+            "responses": dict(self.responses),
+            "bytes_received": self.bytes_received,
+            "bytes_sent": self.bytes_sent,
+            "injected_errors": self.injected_errors,
+            "dropped_packets": self.dropped_packets,
+        }
+
+    # ==================== 模拟线程 ====================
+    def _run(self):
+        while not self._stop.is_set():
+            readable, _, _ = select.select([self.master_fd], [], [], 0.05)
+            if not readable:
+                continue
+            try:
+                chunk = os.read(self.master_fd, 65536)
+            except OSError:
+                continue
+            if not chunk:
+                continue
+            self.bytes_received += len(chunk)
+            self._rx.extend(chunk)
+            self._process()
+
+    def _wire_delay(self, byte_count: int):
+        """按当前波特率模拟线路传输时间（每字节10位）"""
+        if self.throttle_baudrate and byte_count:
+            time.sleep(byte_count * 10 / self.baudrate)
+
+    def _send(self, data: bytes):
+        self._wire_delay(len(data))
+        os.write(self.master_fd, data)
+        self.bytes_sent += len(data)
+
+    def _respond(self, response: Response):
+        self.responses[response.name] += 1
+        self._send(bytes((response,)))
+
+    def _take(self, length: int) -> Optional[bytes]:
+        """从接收缓冲区取出length字节，不足时返回None"""
+        if len(self._rx) < length:
+            return None
+        data = bytes(self._rx[:length])
+        del self._rx[:length]
+        self._wire_delay(length)
+        return data
+
+    def _process(self):
+        """处理接收缓冲区中所有完整的数据"""
+        while True:
+            if self.state == self.STATE_BOOT:
+                if self._take(self.BOOT_SIZE) is None:
+                    return
+                self.baudrate = self.config.ISP_BAUDRATE
+                self.state = self.STATE_DRIVER_HEAD
+            elif self.state == self.STATE_DRIVER_HEAD:
+                if self._take(self.DRIVER_HEAD_SIZE) is None:
+                    return
+                self._send(self.CODE_SIZE_REPLY)
+                self.state = self.STATE_DRIVER_CODE
+            elif self.state == self.STATE_DRIVER_CODE:
+                if self._take(self.DRIVER_CODE_SIZE) is None:
+                    return
+                self._send(self.CODE_CHECKSUM_REPLY)
+                self.state = self.STATE_ISP
+            else:
+                if not self._process_packet():
+                    return
+
+    def _process_packet(self) -> bool:
+        """
+        解析并执行一个ISP请求包
+
+        Returns:
+            是否处理了数据（数据不完整时返回False）
+        """
+        # 丢弃起始码之前的杂散字节
+        if self._rx and self._rx[0] != self.config.START_CODE:
+            start = self._rx.find(bytes((self.config.START_CODE,)))
+            del self._rx[:start if start >= 0 else len(self._rx)]
+            self._respond(Response.START_CODE_ERROR)
+            return True
+        if len(self._rx) < 8:
+            return False
+        data_len = struct.unpack_from('<H', self._rx, 6)[0]
+        packet = self._take(8 + data_len + 4)
+        if packet is None:
+            return False
+
+        _, command, address, _ = struct.unpack_from('<BBIH', packet, 0)
+        data = packet[8:8 + data_len]
+        try:
+            self.commands[Command(command).name] += 1
+        except ValueError:
+            self.commands[f"0x{command:02X}"] += 1
+
+        # 超过链路能承受的波特率，或按概率丢失
+        drop_rate = self.drop_rate
+        if self.max_baudrate is not None and self.baudrate > self.max_baudrate:
+            drop_rate = max(drop_rate, self.overspeed_drop_rate)
+        if drop_rate and self.random.random() < drop_rate:
+            self.dropped_packets += 1
+            return True
+        checksum = struct.unpack_from('<I', packet, 8 + data_len)[0]
+        if (sum(packet[:8 + data_len]) & 0xFFFFFFFF) != checksum or \
+                (self.error_rate and self.random.random() < self.error_rate):
+            self.injected_errors += 1
+            self._respond(Response.CHECKSUM_FAIL)
+            return True
+
+        self._execute(command, address, data)
+        return True
+
+    def _execute(self, command: int, address: int, data: bytes):
+        """执行一个校验通过的命令"""
+        if command == Command.BAUDRATE:
+            # 设备切换波特率，不应答
+            baudrate_param = struct.unpack('<H', data[:2])[0]
+            if baudrate_param:
+                self.baudrate = 98304000 // (16 * baudrate_param)
+        elif command == Command.CHECK_ID:
+            self._respond(Response.ACK if data == self.config.DEVICE_ID else Response.HARDWARE_ID_FAIL)
+        elif command in (Command.BLOCK_ERASE, Command.SECTOR_ERASE):
+            size = self.config.BLOCK_SIZE if command == Command.BLOCK_ERASE else self.config.SECTOR_SIZE
+            if address % size or address + size > len(self.flash):
+                self._respond(Response.ILLEGAL_ADDRESS)
+                return
+            time.sleep(self.erase_latency if command == Command.BLOCK_ERASE else self.sector_erase_latency)
+            self.flash[address:address + size] = b'\xFF' * size
+            self._respond(Response.ACK)
+        elif command == Command.PROGRAM:
+            if len(data) != self.config.PROGRAM_SIZE:
+                self._respond(Response.PROGRAM_LENGTH_ERROR)
+                return
+            if address % self.config.PROGRAM_SIZE or address + len(data) > len(self.flash):
+                self._respond(Response.ILLEGAL_ADDRESS)
+                return
+            time.sleep(self.program_latency)
+            # NOR Flash：编程只能把1写成0
+            current = int.from_bytes(self.flash[address:address + len(data)], 'little')
+            programmed = current & int.from_bytes(data, 'little')
+            self.flash[address:address + len(data)] = programmed.to_bytes(len(data), 'little')
+            self._respond(Response.ACK)
+        elif command == Command.VERIFY:
+            if len(data) != 8:
+                self._respond(Response.DATA_LENGTH_ERROR)
+                return
+            length, code_checksum = struct.unpack('<II', data)
+            if address + length > len(self.flash):
+                self._respond(Response.ILLEGAL_ADDRESS)
+                return
+            time.sleep(self.verify_latency)
+            actual = CRCCalculator.calculate_block_checksum(memoryview(self.flash)[address:address + length])
+            self._respond(Response.ACK if actual == code_checksum else Response.CODE_CHECKSUM_FAIL)
+        elif command == Command.EXIT_ISP_MODE:
+            self._respond(Response.ACK)
+            self.state = self.STATE_BOOT
+            self.baudrate = self.config.INITIAL_BAUDRATE
+        else:
+            self._respond(Response.COMMAND_NOT_RECOGNIZED)
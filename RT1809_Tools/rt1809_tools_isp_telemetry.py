@@ -0,0 +1,251 @@
+"""ISP烧录结构化遥测（数据包、应答延时、NAK、重试、超时事件）"""
+
+import json
+import time
+import bisect
+import threading
+from collections import Counter, defaultdict
+from typing import List
+
+from rt1809_tools_config import Command, Response
+
+
+def _command_name(command: int) -> str:
+    try:
+        return Command(command).name
+    except ValueError:
+        return f"0x{command:02X}"
+
+
+class TelemetryEvent:
+    """遥测事件基类"""
+
+    kind = "event"
+    __slots__ = ("timestamp", "port", "command", "address")
+
+    def __init__(self, port: str, command: int, address: int):
+        self.timestamp = time.time()
+        self.port = port
+        self.command = command
+        self.address = address
+
+    @property
+    def command_name(self) -> str:
+        return _command_name(self.command)
+
+    def to_dict(self) -> dict:
+        """转换为可序列化为JSON的字典"""
+        result = {"kind": self.kind, "timestamp": self.timestamp, "port": self.port,
+                  "command": self.command_name, "address": self.address}
+        for name in type(self).__slots__:
+            result[name] = getattr(self, name)
+        return result
+
+
+class PacketSentEvent(TelemetryEvent):
+    """请求包已发送"""
+
+    kind = "packet_sent"
+    __slots__ = ("size",)
+
+    def __init__(self, port: str, command: int, address: int, size: int):
+        super().__init__(port, command, address)
+        self.size = size
+
+
+class AckEvent(TelemetryEvent):
+    """收到ACK，latency为从发送完成到收到应答的秒数"""
+
+    kind = "ack"
+    __slots__ = ("latency",)
+
+    def __init__(self, port: str, command: int, address: int, latency: float):
+        super().__init__(port, command, address)
+        self.latency = latency
+
+
+class NakEvent(TelemetryEvent):
+    """收到非ACK应答，code为Response枚举（无法识别的应答码保留为整数）"""
+
+    kind = "nak"
+    __slots__ = ("code", "latency")
+
+    def __init__(self, port: str, command: int, address: int, code, latency: float):
+        super().__init__(port, command, address)
+        self.code = code
+        self.latency = latency
+
+    def to_dict(self) -> dict:
+        result = super().to_dict()
+        result["code"] = self.code.name if isinstance(self.code, Response) else f"0x{self.code:02X}"
+        return result
+
+
+class RetryEvent(TelemetryEvent):
+    """重发请求包或重新等待应答，attempt从1开始计数"""
+
+    kind = "retry"
+    __slots__ = ("attempt", "reason")
+
+    def __init__(self, port: str, command: int, address: int, attempt: int, reason: str):
+        super().__init__(port, command, address)
+        self.attempt = attempt
+        self.reason = reason  # "send_failed" / "resend" / "receive_timeout"
+
+
+class TimeoutEvent(TelemetryEvent):
+    """等待应答超时"""
+
+    kind = "timeout"
+    __slots__ = ("timeout",)
+
+    def __init__(self, port: str, command: int, address: int, timeout: float):
+        super().__init__(port, command, address)
+        self.timeout = timeout
+
+
+class CounterSink:
+    """内存计数：按事件类型、命令和NAK应答码计数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.events = Counter()  # {kind: 次数}
+        self.by_command = Counter()  # {(kind, 命令名): 次数}
+        self.nak_codes = Counter()  # {应答码名: 次数}
+
+    def handle(self, event: TelemetryEvent):
+        with self._lock:
+            self.events[event.kind] += 1
+            self.by_command[(event.kind, event.command_name)] += 1
+            if isinstance(event, NakEvent):
+                code = event.code.name if isinstance(event.code, Response) else f"0x{event.code:02X}"
+                self.nak_codes[code] += 1
+
+    def close(self):
+        pass
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "events": dict(self.events),
+                "by_command": {f"{kind}.{command}": count for (kind, command), count in self.by_command.items()},
+                "nak_codes": dict(self.nak_codes),
+            }
+
+
+class JsonLinesSink:
+    """把每个事件作为一行JSON追加写入文件"""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def handle(self, event: TelemetryEvent):
+        line = json.dumps(event.to_dict(), ensure_ascii=False)
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line + "\n")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class LatencyHistogramSink:
+    """
+    应答延时直方图：按(串口, 命令)统计ACK/NAK延时分布
+
+    用于对比各工位的延时分布，及早发现接触不良的线缆或转换器。
+    """
+
+    # 桶上限（毫秒），最后一个桶收集更大的值
+    BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = defaultdict(list)  # {(串口, 命令名): [延时秒]}
+
+    def handle(self, event: TelemetryEvent):
+        if isinstance(event, (AckEvent, NakEvent)):
+            with self._lock:
+                self._samples[(event.port, event.command_name)].append(event.latency)
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def _percentile(sorted_values: List[float], fraction: float) -> float:
+        index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+        return sorted_values[index]
+
+    def summary(self) -> dict:
+        """
+        Returns:
+            {串口: {命令名: {count, mean_ms, p50_ms, p90_ms, p99_ms, max_ms, buckets}}}
+        """
+        with self._lock:
+            samples = {key: sorted(values) for key, values in self._samples.items()}
+        result = {}
+        for (port, command), values in samples.items():
+            buckets = [0] * (len(self.BUCKETS_MS) + 1)
+            for value in values:
+                buckets[bisect.bisect_left(self.BUCKETS_MS, value * 1000)] += 1
+            labels = [f"<={limit}ms" for limit in self.BUCKETS_MS] + [f">{self.BUCKETS_MS[-1]}ms"]
+            result.setdefault(port, {})[command] = {
+                "count": len(values),
+                "mean_ms": sum(values) * 1000 / len(values),
+                "p50_ms": self._percentile(values, 0.5) * 1000,
+                "p90_ms": self._percentile(values, 0.9) * 1000,
+                "p99_ms": self._percentile(values, 0.99) * 1000,
+                "max_ms": values[-1] * 1000,
+                "buckets": {label: count for label, count in zip(labels, buckets) if count},
+            }
+        return result
+
+
+class ISPTelemetry:
+    """
+    遥测事件分发：把ISPProgrammer产生的事件分发给所有已注册的输出
+
+    输出（sink）需提供handle(event)和close()方法，并自行保证线程安全
+    （多路烧录时多个编程器可共享同一个输出）。没有输出时不创建事件对象。
+    单个输出出错不影响烧录。
+    """
+
+    def __init__(self):
+        self.sinks = []
+
+    def __bool__(self):
+        return bool(self.sinks)
+
+    def add_sink(self, sink):
+        if sink not in self.sinks:
+            self.sinks.append(sink)
+
+    def remove_sink(self, sink):
+        if sink in self.sinks:
+            self.sinks.remove(sink)
+
+    def emit(self, event: TelemetryEvent):
+        for sink in self.sinks:
+            try:
+                sink.handle(event)
+            except Exception as e:
+                print(f"遥测输出异常: {e}")
+
+    def close(self):
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception:
+                pass
+
+
+def response_code(value: int):
+    """把应答字节转换为Response枚举，无法识别时返回原整数"""
+    try:
+        return Response(value)
+    except ValueError:
+        return value
@@ -13,10 +13,14 @@ import usb.util
 from rt1809_tools_config import (
     FW_SIZE, OTA_TxBLOCK_SIZE, 
     USB_VID_RT1809, USB_PID_RT1809,
-    USB_VID_RT9806, USB_PID_RT9806
+    USB_VID_RT9806, USB_PID_RT9806,
+    CHIP_RT1809, CHIP_RT9806, FIRMWARE_HEADER_RT9806
 )
+from rt1809_tools_fw_package import FirmwarePackage, PAYLOAD_OTA_RESOURCE, load_ota_firmware
 from example_run_dll import CryptoLib, ECPoint
 from example_control import CreatePackage, random_key, set_control_transfer
+from example_usb_session import USBSessionPool, bulk_write
+from example_usb_async import open_async_writer
 
 
 def usb_control_transfer(vid, pid, bmRequestType, bRequest, wValue=0, wIndex=0, data_or_wLength=None, timeout=1000):
@@ -32,17 +36,11 @@ def usb_control_transfer(vid, pid, bmRequestType, bRequest, wValue=0, wIndex=0,
     :param timeout: 超時時間(毫秒)
     :return: 傳輸的數據
     """
-    # 查找 USB 設備
-    dev = usb.core.find(idVendor=vid, idProduct=pid)
-    if dev is None:
-        raise ValueError('設備未找到，請檢查VID和PID')
-
+    # 使用缓存的设备句柄（首次使用时查找和配置，设备拔出后自动重新打开）
+    session = USBSessionPool.get(vid, pid)
     try:
-        # 設置配置
-        dev.set_configuration()
-        
         # 執行 Control Transfer
-        result = dev.ctrl_transfer(
+        result = session.ctrl_transfer(
             bmRequestType=bmRequestType,
             bRequest=bRequest,
             wValue=wValue,
@@ -55,8 +53,6 @@ def usb_control_transfer(vid, pid, bmRequestType, bRequest, wValue=0, wIndex=0,
     except usb.core.USBError as e:
         print(f"USB Control Transfer 錯誤: {str(e)}")
         raise
-    finally:
-        dev = None
 
 
 def GetFwImageNum(wIndex=0):
@@ -126,85 +122,64 @@ class ProgressCallback:
             self.callback(progress, self.current_size, self.total_size)
 
 
-def ota_usb_send(vid, pid, endpoint_out, file_path=None, progress_callback=None):
+def ota_usb_send(vid, pid, endpoint_out, file_path=None, progress_callback=None, timeout_ms=5000):
     # 查找 USB 设备
     cheksum = 0
-    dev = usb.core.find(idVendor=vid, idProduct=pid)
-    if dev is None:
-        raise ValueError('设备未找到，请检查VID和PID')
-
-    # 设置配置
-    dev.set_configuration()
-
-    # 获取端点
-    cfg = dev.get_active_configuration()
-    intf = cfg[(0, 0)]
-    ep = usb.util.find_descriptor(
-        intf,
-        custom_match=lambda e: e.bEndpointAddress == endpoint_out
-    )
-    if ep is None:
-        raise ValueError('未找到指定的 OUT 端点')
+    # 使用缓存的设备句柄和端点描述符
+    session = USBSessionPool.get(vid, pid)
+    try:
+        ep = session.endpoint(endpoint_out)
 
-    # 发送数据
-    chunk_size = ep.wMaxPacketSize
-    d_key = bytes.fromhex("1B 24 42 4f 4f 54 00")
-    d_lens = bytes.fromhex("00 01 00 00")
+        # 发送数据
+        chunk_size = ep.wMaxPacketSize
+        d_key = bytes.fromhex("1B 24 42 4f 4f 54 00")
+        d_lens = bytes.fromhex("00 01 00 00")
     
-    for i in range(0, len(d_key), chunk_size):
-        ep.write(d_key[i:i+chunk_size])
-    print(f"已通过USB发送 {len(d_key)} 字节")
-
-    for i in range(0, len(d_lens), chunk_size):
-        ep.write(d_lens[i:i+chunk_size])
-    print(f"已通过USB发送 {len(d_lens)} 字节")
-
-    if file_path is not None and os.path.exists(file_path):
-        file_size = os.path.getsize(file_path)
-        if file_size != FW_SIZE:
-            raise ValueError('文件大小不符合')
-        if progress_callback:
-            progress_callback.set_total(file_size)
-        data_list = []
-        data_list_len = int(file_size / OTA_TxBLOCK_SIZE)
-        data_list_pa_len = OTA_TxBLOCK_SIZE
-        with open(file_path, "rb") as f:
-            for i in range(0, data_list_len):
-                data_list.append(f.read(data_list_pa_len))
-        d_header = data_list[0][0:4] 
-        print(f"data list len : {data_list_len} data list pa len : {data_list_pa_len}")
-        checksum = 0
-        checksum_list = []
-        count = 0
-        for i in range(0, data_list_len):
-            count = 0
-            for j in range(0, data_list_pa_len):
-                checksum += data_list[i][j]
-                count += data_list[i][j]
-            checksum_list.append(count)
-        byte_array = bytearray(struct.pack('>I', checksum))
-        print(f"checksum : {checksum} byte_array : {byte_array}")
-
-        
-        for i in range(0, len(d_header), chunk_size):
-            ep.write(d_header[i:i+chunk_size])
-        print(f"已通过USB发送 {len(d_header)} 字节")
-        cheksum = 0
-
-        for j in range(0, data_list_len):
-            print(f"package : {j}")
-            for i in range(0, data_list_pa_len, chunk_size):
-                bytes_written = ep.write(data_list[j][i:i + chunk_size])
-                if progress_callback:
-                    progress_callback.update(bytes_written)
-
-        print(f"END CHeksum {checksum}")
-
-        ep.write(byte_array)
+        for i in range(0, len(d_key), chunk_size):
+            ep.write(d_key[i:i+chunk_size])
+        print(f"已通过USB发送 {len(d_key)} 字节")
+
+        for i in range(0, len(d_lens), chunk_size):
+            ep.write(d_lens[i:i+chunk_size])
+        print(f"已通过USB发送 {len(d_lens)} 字节")
+
+        if file_path is not None and os.path.exists(file_path):
+            # 固件包直接使用预计算的校验和，原始固件文件现场检查大小并计算
+            firmware_data, checksum = load_ota_firmware(file_path, CHIP_RT1809)
+            file_size = len(firmware_data)
+            if progress_callback:
+                progress_callback.set_total(file_size)
+            data_list_len = int(file_size / OTA_TxBLOCK_SIZE)
+            data_list_pa_len = OTA_TxBLOCK_SIZE
+            d_header = firmware_data[0:4]
+            print(f"data list len : {data_list_len} data list pa len : {data_list_pa_len}")
+            byte_array = bytearray(struct.pack('>I', checksum))
+            print(f"checksum : {checksum} byte_array : {byte_array}")
+
+        
+            for i in range(0, len(d_header), chunk_size):
+                ep.write(d_header[i:i+chunk_size])
+            print(f"已通过USB发送 {len(d_header)} 字节")
+            cheksum = 0
+
+            # 所有完整数据包整块提交，由主机控制器拆包；设备写Flash较慢，每块保留timeout_ms
+            bulk_write(ep, firmware_data[:data_list_len * data_list_pa_len], session.bulk_chunk_size,
+                       progress=progress_callback.update if progress_callback else None,
+                       block_size=data_list_pa_len, block_timeout=timeout_ms)
+            print(f"package : {data_list_len}")
+
+            print(f"END CHeksum {checksum}")
+
+            ep.write(byte_array)
+    except usb.core.USBError:
+        # 拔出或写入失败后句柄和端点已失效，释放后下次发送时重新打开设备
+        session.close()
+        raise
 
     time.sleep(0.5)
     print("Data is None")
-    dev = None
+    # 设备写入固件后重启，下次使用时重新打开
+    USBSessionPool.close(vid, pid)
     return True
 
 
@@ -262,33 +237,28 @@ def GetOtaState(dev, wIndex=0):
 def ota_usb_send_res(vid, pid, endpoint_out, file_path=None, timeout_ms=5000, 
                      res_key_hex="1B 24 52 45 53 00", progress_callback=None):
     """OTA资源发送函数"""
-    # 1) 打开并准备 USB
-    dev = usb.core.find(idVendor=vid, idProduct=pid)
-    if dev is None:
-        raise RuntimeError("USB 设备未找到，请检查 VID/PID")
-
+    # 1) 打开并准备 USB（使用缓存的设备句柄、已声明的接口和端点描述符）
+    session = USBSessionPool.get(vid, pid)
     try:
-        if dev.is_kernel_driver_active(0):
-            dev.detach_kernel_driver(0)
-    except Exception:
-        pass
-
-    dev.set_configuration()
-    cfg = dev.get_active_configuration()
-    intf = cfg[(0, 0)]
-    usb.util.claim_interface(dev, intf.bInterfaceNumber)
-
-    ep_out = usb.util.find_descriptor(
-        intf, custom_match=lambda e: e.bEndpointAddress == endpoint_out
-    )
-    if ep_out is None:
-        usb.util.release_interface(dev, intf.bInterfaceNumber)
-        usb.util.dispose_resources(dev)
-        raise RuntimeError("未找到指定的 OUT 端点")
+        dev = session.claim_interface(0)
+        ep_out = session.endpoint(endpoint_out)
+    except ValueError as e:
+        raise RuntimeError(str(e))
     chunk = ep_out.wMaxPacketSize or 512
 
     # 2) 发送 resKey（或 bootKey）与大端长度
-    file_size = os.path.getsize(file_path)
+    # 固件包只发送其中的资源数据，数据偏移处开始读取
+    data_offset = 0
+    if FirmwarePackage.is_package(file_path):
+        try:
+            with FirmwarePackage.open(file_path) as package:
+                package.expect(CHIP_RT1809, PAYLOAD_OTA_RESOURCE)
+                data_offset = package.payload_offset
+                file_size = len(package.payload)
+        except ValueError as e:
+            raise RuntimeError(str(e))
+    else:
+        file_size = os.path.getsize(file_path)
     if file_size <= 0:
         raise RuntimeError("资源文件为空")
     if file_size == FW_SIZE:
@@ -318,45 +288,66 @@ def ota_usb_send_res(vid, pid, endpoint_out, file_path=None, timeout_ms=5000,
     total_sent = 0
     block_count = int(file_size / OTA_TxBLOCK_SIZE)
     remainder = file_size % OTA_TxBLOCK_SIZE
+    # 每次读取并提交多个完整块，由主机控制器拆包
+    blocks_per_write = max(1, session.bulk_chunk_size // OTA_TxBLOCK_SIZE)
+    progress = progress_callback.update if progress_callback else None
+    # libusb1后端时异步提交，读取下一组块时上一组仍在传输；否则同步写入
+    # 设备写Flash较慢，每块保留timeout_ms
+    writer = open_async_writer(session, endpoint_out, timeout=timeout_ms * blocks_per_write)
+
+    def write_data(data):
+        if writer is None:
+            return bulk_write(ep_out, data, session.bulk_chunk_size, progress=progress,
+                              block_size=OTA_TxBLOCK_SIZE, block_timeout=timeout_ms)
+        count = writer.submit(data)
+        if progress:
+            progress(count)
+        return count
     with open(file_path, "rb") as f:
-        for block_index in range(block_count):
-            data_chunk = f.read(OTA_TxBLOCK_SIZE)  # 读取一个完整块
+        f.seek(data_offset)
+        for block_index in range(0, block_count, blocks_per_write):
+            blocks = min(blocks_per_write, block_count - block_index)
+            data_chunk = f.read(blocks * OTA_TxBLOCK_SIZE)  # 读取若干完整块
             if not data_chunk:
                 break 
         
-            for i in range(0, len(data_chunk), chunk):
-                chunk_to_send = data_chunk[i:i+chunk]
-                try:
-                    # 发送数据，并设置超时以避免无限等待
-                    bytes_written = ep_out.write(chunk_to_send, timeout=5000)
-                    total_sent += bytes_written
-                    if progress_callback:
-                        progress_callback.update(bytes_written)
-                except usb.core.USBError as e:
-                    print(f"[!] 发送块 {block_index} 时出错: {e}")
-                    return False
-            print(f"[↓] 已发送完整块 {block_index+1}/{block_count}")
+            try:
+                total_sent += write_data(data_chunk)
+            except usb.core.USBError as e:
+                print(f"[!] 发送块 {block_index} 时出错: {e}")
+                session.close()
+                return False
+            print(f"[↓] 已发送完整块 {block_index+blocks}/{block_count}")
         
+        # 等待所有完整块传输完成
+        if writer is not None:
+            try:
+                writer.flush()
+            except usb.core.USBError as e:
+                print(f"[!] 发送完整块时出错: {e}")
+                session.close()
+                return False
         time.sleep(0.5)
         # 发送剩余的不完整块
         if remainder > 0:
             print(f"[↓] 正在发送剩余数据块 ({remainder} 字节)")
             last_chunk = f.read(remainder)
             if last_chunk:
-                for i in range(0, len(last_chunk), chunk):
-                    chunk_to_send = last_chunk[i:i+chunk]
-                    try:
-                        bytes_written = ep_out.write(chunk_to_send, timeout=5000)
-                        total_sent += bytes_written
-                        if progress_callback:
-                            progress_callback.update(bytes_written)
-                    except usb.core.USBError as e:
-                        print(f"[!] 发送剩余数据时出错: {e}")
-                        return False
+                try:
+                    total_sent += write_data(last_chunk)
+                    if writer is not None:
+                        writer.flush()
+                except usb.core.USBError as e:
+                    print(f"[!] 发送剩余数据时出错: {e}")
+                    session.close()
+                    return False
                 print("[+] 剩余数据发送完成。")
             else:
                 print("[!] 读取剩余数据失败。")
 
+    # 设备写入资源后重启，释放会话，下次使用时重新打开
+    session.close()
+
     # 验证
     if total_sent == file_size:
         print(f"[✓] 文件发送成功！总计发送: {total_sent} 字节")
@@ -366,8 +357,6 @@ def ota_usb_send_res(vid, pid, endpoint_out, file_path=None, timeout_ms=5000,
         return False
 
     time.sleep(0.5)
-    usb.util.release_interface(dev, intf.bInterfaceNumber)
-    usb.util.dispose_resources(dev)
     print("[RES] 资源 OTA 发送完成（设备会在写入完成后重启）。")
     return True
 
@@ -407,7 +396,6 @@ UART_BUF_SIZE = 2048
 
 # RT9806 OTA协议定义
 BOOT_KEY_RT9806 = [0x1B, ord('$'), ord('B'), ord('O'), ord('O'), ord('T'), 0x00]
-FIRMWARE_HEADER_RT9806 = [0x43, 0x4D, 0x33, 0x58]  # 'CM3X'
 
 
 def find_rt9806_device(vid=USB_VID_RT9806, pid=USB_PID_RT9806):
@@ -550,21 +538,11 @@ def ota_usb_send_rt9806_libusb(file_path=None, progress_callback=None):
         if file_path is None or not os.path.exists(file_path):
             raise ValueError('固件文件不存在')
         
-        with open(file_path, 'rb') as f:
-            firmware_data = list(f.read())
-        
+        # 检查固件头部和大小（固件包在打包时已检查）
+        firmware_bytes, byte_sum = load_ota_firmware(file_path, CHIP_RT9806)
+        firmware_data = list(firmware_bytes)
         firmware_size = len(firmware_data)
-        
-        if firmware_size < 4:
-            raise ValueError('固件数据无效')
-        
-        # 验证固件头部
         file_header = list(firmware_data[:4])
-        if file_header != FIRMWARE_HEADER_RT9806:
-            raise ValueError(f'固件头部不匹配，期望: {FIRMWARE_HEADER_RT9806}, 实际: {file_header}')
-        
-        if firmware_size > 64 * 1024:
-            raise ValueError('固件超过64KB限制')
         
         if progress_callback:
             progress_callback.set_total(firmware_size)
@@ -633,7 +611,7 @@ def ota_usb_send_rt9806_libusb(file_path=None, progress_callback=None):
         
         # 步骤5: 发送校验和
         print("[RT9806-libusb] [5/5] 发送校验和...")
-        checksum = calculate_rt9806_checksum(firmware_data)
+        checksum = list(struct.pack('>I', byte_sum))
         send_rt9806_data(dev, interface_number, checksum, progress_callback=progress_callback)
         #    return False
         print(f"[RT9806-libusb] ✓ 校验和发送完成: 0x{''.join(f'{b:02X}' for b in checksum)}")
@@ -885,21 +863,10 @@ def ota_usb_send_rt9806_driver(file_path=None, progress_callback=None):
         if file_path is None or not os.path.exists(file_path):
             raise ValueError('固件文件不存在')
         
-        with open(file_path, 'rb') as f:
-            firmware_data = f.read()
-        
+        # 检查固件头部和大小（固件包在打包时已检查）
+        firmware_data, byte_sum = load_ota_firmware(file_path, CHIP_RT9806)
         firmware_size = len(firmware_data)
-        
-        if firmware_size < 4:
-            raise ValueError('固件数据无效')
-        
-        # 验证固件头部
         file_header = list(firmware_data[:4])
-        if file_header != FIRMWARE_HEADER_RT9806:
-            raise ValueError(f'固件头部不匹配，期望: {FIRMWARE_HEADER_RT9806}, 实际: {file_header}')
-        
-        if firmware_size > 64 * 1024:
-            raise ValueError('固件超过64KB限制')
         
         if progress_callback:
             progress_callback.set_total(firmware_size)
@@ -971,7 +938,7 @@ def ota_usb_send_rt9806_driver(file_path=None, progress_callback=None):
         
         # 步骤5: 发送校验和
         print("[RT9806-Driver] [5/5] 发送校验和...")
-        checksum = calculate_rt9806_checksum(list(firmware_data))
+        checksum = list(struct.pack('>I', byte_sum))
         driver_send_ioctl(handle, IOCTL_USBPMIC_OTA_SEND_CHECKSUM, checksum)
         '''
         if not driver_send_ioctl(handle, IOCTL_USBPMIC_OTA_SEND_CHECKSUM, checksum):
@@ -8,6 +8,7 @@ import struct
 import numpy as np
 from PIL import Image
 import sys
+from example_rgb565 import RGB565Encoder, encode_rgb565, RGB565_BIG
 
 
 class VideoFrameExtractor:
@@ -394,16 +395,11 @@ class VideoFrameExtractor:
         cap.release()
         return frames, frame_indices
     
-    def rgb_to_rgb565(self, rgb_array):
-        """将RGB图像转换为RGB565格式（修正字节序）"""
-        r = (rgb_array[..., 0] >> 3).astype(np.uint16)
-        g = (rgb_array[..., 1] >> 2).astype(np.uint16)
-        b = (rgb_array[..., 2] >> 3).astype(np.uint16)
-        
-        rgb565 = (r << 11) | (g << 5) | b
-    
-        # 修正：直接返回uint16数组，让struct.pack处理字节序
-        return rgb565
+    def rgb_to_rgb565(self, rgb_array, encoder=None):
+        """将RGB图像转换为RGB565格式（大端序，tobytes()即为写入文件的字节）"""
+        if encoder is None:
+            return encode_rgb565(rgb_array, RGB565_BIG, channel_order="rgb")
+        return encoder.encode(rgb_array)
     
     def save_frames_as_images(self, frames, output_path, prefix, start_index=0):
         """将帧保存为单独的图片文件"""
@@ -441,25 +437,22 @@ class VideoFrameExtractor:
             
             offsets = []
             frame_sizes = []
+            encoder = RGB565Encoder(RGB565_BIG, channel_order="rgb")  # 各帧复用同一组缓冲区
             
             # 写入每帧数据
             for i, frame in enumerate(frames):
                 offsets.append(f.tell())
                 
                 # 转换为RGB565
-                rgb565 = self.rgb_to_rgb565(frame)
+                rgb565 = self.rgb_to_rgb565(frame, encoder)
                 height, width = rgb565.shape
                 
                 # 计算帧数据大小
                 frame_size = width * height * 2
                 frame_sizes.append(frame_size)
                 
-                # 写入RGB565数据 - 使用大端序
-                for y in range(height):
-                    for x in range(width):
-                        pixel = rgb565[y, x]
-                        # 确保大端序：高字节在前，低字节在后
-                        f.write(struct.pack('>H', pixel))
+                # 写入RGB565数据 - 大端序：高字节在前，低字节在后
+                rgb565.tofile(f)
                 
                 # 更新进度
                 progress_value = 40 + (i + 1) / frame_count * 20
@@ -304,6 +304,34 @@ def verify_optimization():
     return True
 
 
+def verify_production_engine():
+    """验证rt1809_tools_isp_crc中各计算引擎与原始版本结果一致"""
+    import random
+    from rt1809_tools_isp_crc import CRCCalculator as ProductionCRCCalculator, ENGINE_AUTO
+    
+    # 覆盖奇数长度和不足一个切片步长的尾部
+    test_cases = []
+    for data_len in list(range(0, 40)) + [random.randint(40, 4096) for _ in range(200)]:
+        test_cases.append(bytes([random.randint(0, 255) for _ in range(data_len)]))
+    
+    try:
+        for engine in ProductionCRCCalculator.available_engines():
+            ProductionCRCCalculator.set_engine(engine)
+            for test_data in test_cases:
+                original_crc = CRCCalculator.calculate_block_checksum(test_data)
+                production_crc = ProductionCRCCalculator.calculate_block_checksum(test_data)
+                
+                if original_crc != production_crc:
+                    print(f"验证失败！引擎: {engine}, 数据: {test_data.hex()}")
+                    print(f"原始CRC: 0x{original_crc:08X}")
+                    print(f"引擎CRC: 0x{production_crc:08X}")
+                    return False
+            print(f"验证通过！{engine}引擎与原始版本结果完全一致。")
+    finally:
+        ProductionCRCCalculator.set_engine(ENGINE_AUTO)
+    return True
+
+
 # 性能测试
 def performance_test():
     """性能对比测试"""
@@ -324,14 +352,29 @@ def performance_test():
         OptimizedCRCCalculator.calculate_block_checksum(test_data)
     optimized_time = time.perf_counter() - start
     
+    # 测试rt1809_tools_isp_crc中的各计算引擎
+    from rt1809_tools_isp_crc import CRCCalculator as ProductionCRCCalculator, ENGINE_AUTO
+    engine_times = {}
+    for engine in ProductionCRCCalculator.available_engines():
+        ProductionCRCCalculator.set_engine(engine)
+        ProductionCRCCalculator.calculate_block_checksum(test_data)  # 预先初始化查找表
+        start = time.perf_counter()
+        for _ in range(100):
+            ProductionCRCCalculator.calculate_block_checksum(test_data)
+        engine_times[engine] = time.perf_counter() - start
+    ProductionCRCCalculator.set_engine(ENGINE_AUTO)
+    
     print(f"原始版本耗时: {original_time:.4f}秒")
     print(f"优化版本耗时: {optimized_time:.4f}秒")
     print(f"性能提升: {original_time/optimized_time:.2f}倍")
+    for engine, engine_time in engine_times.items():
+        print(f"{engine}引擎耗时: {engine_time:.4f}秒，性能提升: {original_time/engine_time:.2f}倍")
 
 
 if __name__ == "__main__":
     # 验证优化正确性
     verify_optimization()
+    verify_production_engine()
     
     # 性能测试
     performance_test()
\ No newline at end of file
@@ -0,0 +1,114 @@
+"""使用ISP虚拟设备验证烧录流程（无需硬件，仅Linux/macOS）"""
+
+import os
+import asyncio
+from contextlib import contextmanager
+
+from rt1809_tools_config import ISPConfig
+from rt1809_tools_isp_manifest import CRCManifest
+from rt1809_tools_isp_benchmark import make_firmware
+from rt1809_tools_isp_programmer import ISPProgrammer
+from rt1809_tools_isp_simulator import VirtualISPDevice
+from rt1809_tools_isp_async import AsyncISPProgrammer, AsyncSerialProtocol, burn_ports
+
+# 收发模式：(是否事件驱动, 编程窗口)
+IO_MODES = [(False, 1), (False, 4), (True, 1), (True, 4)]
+PROGRAM_LATENCY = 0.002  # 模拟设备写Flash的延时，窗口大于1时应答到达前已有后续数据包在途
+
+
+def remove_firmware(path: str):
+    """删除测试固件及烧录时生成的分块CRC清单文件"""
+    for file_path in (path, CRCManifest.sidecar_path(path)):
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+
+
+@contextmanager
+def io_mode(event_driven: bool, window: int):
+    """临时切换收发模式和编程窗口"""
+    saved = (ISPConfig.EVENT_DRIVEN_IO, ISPConfig.PROGRAM_WINDOW)
+    ISPConfig.EVENT_DRIVEN_IO, ISPConfig.PROGRAM_WINDOW = event_driven, window
+    try:
+        yield f"{'事件驱动' if event_driven else '轮询'}，窗口{window}"
+    finally:
+        ISPConfig.EVENT_DRIVEN_IO, ISPConfig.PROGRAM_WINDOW = saved
+
+
+def burn_and_check(device: VirtualISPDevice, firmware_path: str, name: str):
+    """烧录并检查虚拟设备Flash内容与固件一致"""
+    with open(firmware_path, 'rb') as f:
+        firmware = f.read()
+    programmer = ISPProgrammer()
+    assert programmer.burn_firmware(device.port, firmware_path), f"{name}: 烧录失败，{device.stats()}"
+    assert bytes(device.flash[:len(firmware)]) == firmware, f"{name}: Flash内容与固件不一致"
+
+
+def test_burn():
+    """正常烧录：轮询/事件驱动 × 停等/窗口，设备写Flash有延时"""
+    firmware_path = make_firmware(200000)
+    try:
+        for event_driven, window in IO_MODES:
+            with io_mode(event_driven, window) as name, \
+                    VirtualISPDevice(program_latency=PROGRAM_LATENCY) as device:
+                burn_and_check(device, firmware_path, name)
+                print(f"正常烧录({name}): 通过，{device.stats()}")
+    finally:
+        remove_firmware(firmware_path)
+
+
+def test_retry_storm():
+    """注入校验错误，验证重试后仍能烧录成功（固定随机种子，可重复）"""
+    firmware_path = make_firmware(200000)
+    try:
+        for event_driven, window in IO_MODES:
+            with io_mode(event_driven, window) as name, \
+                    VirtualISPDevice(error_rate=0.05, seed=7, program_latency=PROGRAM_LATENCY) as device:
+                burn_and_check(device, firmware_path, name)
+                assert device.injected_errors > 0, f"{name}: 没有注入错误"
+                print(f"错误注入({name}): 通过，注入错误 {device.injected_errors} 次")
+    finally:
+        remove_firmware(firmware_path)
+
+
+def test_async_burn():
+    """asyncio版本：同时烧录两个虚拟设备（停等/窗口），并验证取消后退出ISP模式"""
+    if not AsyncSerialProtocol.available():
+        print("异步烧录: 跳过（未安装pyserial-asyncio）")
+        return
+    firmware_path = make_firmware(200000)
+    with open(firmware_path, 'rb') as f:
+        firmware = f.read()
+    try:
+        for window in (1, 4):
+            name = f"窗口{window}"
+            with io_mode(False, window), \
+                    VirtualISPDevice(program_latency=PROGRAM_LATENCY) as first, \
+                    VirtualISPDevice(error_rate=0.05, seed=7) as second:
+                results = asyncio.run(burn_ports([first.port, second.port], firmware_path))
+                assert results == {first.port: True, second.port: True}, f"异步({name}): {results}"
+                for device in (first, second):
+                    assert bytes(device.flash[:len(firmware)]) == firmware, f"异步({name}): Flash内容与固件不一致"
+                print(f"异步烧录({name}): 通过，注入错误 {second.injected_errors} 次")
+
+        # 烧录中途取消（超时），设备应收到EXIT_ISP_MODE
+        with VirtualISPDevice(program_latency=0.01) as device:
+            async def burn_and_cancel():
+                programmer = AsyncISPProgrammer(lambda message, level="INFO": None)
+                try:
+                    await asyncio.wait_for(programmer.burn_firmware(device.port, firmware_path), 0.5)
+                except asyncio.TimeoutError:
+                    return True
+                return False
+            assert asyncio.run(burn_and_cancel()), "异步取消: 烧录未被取消"
+            assert device.commands["EXIT_ISP_MODE"] == 1, f"异步取消: 未退出ISP模式，{device.stats()}"
+            print("异步取消: 通过，已退出ISP模式")
+    finally:
+        remove_firmware(firmware_path)
+
+
+if __name__ == "__main__":
+    test_burn()
+    test_retry_storm()
+    test_async_burn()
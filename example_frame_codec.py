@@ -0,0 +1,324 @@
+"""画面数据压缩：RGB565帧的RLE和与上一帧异或后的RLE编码，附参考解码器和基准测试"""
+
+import sys
+import time
+import struct
+import argparse
+from collections import namedtuple
+
+import numpy as np
+
+CODEC_RAW = 0  # 不压缩，按原来的FF 01 数据 FF 02发送
+CODEC_RLE = 1  # 像素RLE
+CODEC_XOR_RLE = 2  # 与上一帧逐像素异或后RLE（未变化的像素为0，形成长串）
+CODEC_NAMES = {CODEC_RAW: "raw", CODEC_RLE: "rle", CODEC_XOR_RLE: "xor_rle"}
+
+CODEC_CAPS_DESCRIPTOR = 0x94  # 固件支持的压缩方式（1字节位图，第n位对应CODEC n）
+FRAME_CODEC_ENABLED = False  # 主机端总开关，固件确认支持后才会实际使用
+
+# RLE以16位小端控制字开头：最高位为1时为重复串，后接1个像素；为0时为原样串，后接若干像素。
+# 低15位为像素数减1
+RLE_RUN_FLAG = 0x8000
+RLE_MAX_COUNT = 0x8000
+RLE_MIN_RUN = 3  # 短于此长度的重复并入原样串（2个像素的重复串不比原样串短）
+
+D_START = bytes.fromhex("FF 01")
+D_END = bytes.fromhex("FF 02")
+
+EncodedFrame = namedtuple("EncodedFrame", ["codec", "payload", "raw_size"])
+EncodedFrame.ratio = property(lambda self: self.raw_size / len(self.payload) if self.payload else 0.0)
+
+
+def _as_words(data):
+    """把RGB565字节数据或uint16数组看作16位字（不复制，字节内容原样保留）"""
+    if isinstance(data, np.ndarray):
+        return data.reshape(-1).view("<u2")
+    if len(data) % 2:
+        raise ValueError(f"RGB565数据长度 {len(data)} 不是2的倍数")
+    return np.frombuffer(data, "<u2")
+
+
+def rle_encode(words) -> bytes:
+    """
+    16位字的RLE编码（全部用数组运算，不逐像素循环）
+
+    相邻相同的像素先分成段，不短于RLE_MIN_RUN的段作为重复串，其余相邻的短段合并为原样串，
+    每串再按RLE_MAX_COUNT拆分。
+    """
+    words = np.asarray(words, "<u2").reshape(-1)
+    count = words.size
+    if count == 0:
+        return b""
+    starts = np.concatenate(([0], np.flatnonzero(words[1:] != words[:-1]) + 1))
+    lengths = np.diff(np.append(starts, count))
+    is_run = lengths >= RLE_MIN_RUN
+
+    # 重复串各自成串；原样段从串首或重复串之后开始新串
+    new_segment = is_run.copy()
+    new_segment[0] = True
+    new_segment[1:] |= is_run[:-1]
+    first = np.flatnonzero(new_segment)
+    seg_start = starts[first]
+    seg_len = np.diff(np.append(seg_start, count))
+    seg_run = is_run[first]
+
+    # 按RLE_MAX_COUNT拆分
+    pieces = -(-seg_len // RLE_MAX_COUNT)
+    token_seg = np.repeat(np.arange(seg_start.size), pieces)
+    token_part = np.arange(token_seg.size) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+    tok_start = seg_start[token_seg] + token_part * RLE_MAX_COUNT
+    tok_len = np.minimum(RLE_MAX_COUNT, seg_len[token_seg] - token_part * RLE_MAX_COUNT)
+    tok_run = seg_run[token_seg]
+
+    # 每串占用的字数：重复串为控制字+1个像素，原样串为控制字+全部像素
+    size = np.where(tok_run, 2, tok_len + 1)
+    offset = np.cumsum(size) - size
+    out = np.empty(int(size.sum()), "<u2")
+    out[offset] = np.where(tok_run, RLE_RUN_FLAG, 0) | (tok_len - 1)
+    out[offset[tok_run] + 1] = words[tok_start[tok_run]]
+
+    literal = ~tok_run
+    lit_len = tok_len[literal]
+    if lit_len.size:
+        # 原样串的像素整段平移：源位置 + (控制字位置 + 1 - 串首位置)
+        lit_start = tok_start[literal]
+        source = np.arange(int(lit_len.sum())) + np.repeat(lit_start - (np.cumsum(lit_len) - lit_len), lit_len)
+        out[source + np.repeat(offset[literal] + 1 - lit_start, lit_len)] = words[source]
+    return out.tobytes()
+
+
+def rle_decode(payload, count: int):
+    """
+    RLE参考解码（逐串循环，用于测试和对照固件实现）
+
+    Args:
+        payload: rle_encode的输出
+        count: 解码后的像素数
+
+    Returns:
+        uint16数组（小端，字节内容与编码前相同）
+    """
+    source = np.frombuffer(payload, "<u2")
+    out = np.empty(count, "<u2")
+    position = 0
+    index = 0
+    while index < source.size:
+        control = int(source[index])
+        length = (control & (RLE_RUN_FLAG - 1)) + 1
+        if position + length > count:
+            raise ValueError(f"RLE数据超出帧长度: 位置{position}+{length} > {count}")
+        if control & RLE_RUN_FLAG:
+            out[position:position + length] = source[index + 1]
+            index += 2
+        else:
+            out[position:position + length] = source[index + 1:index + 1 + length]
+            index += 1 + length
+        position += length
+    if position != count or index != source.size:
+        raise ValueError(f"RLE数据不完整: 解码{position}/{count}像素")
+    return out
+
+
+def encode_frame(frame, reference=None, codecs=frozenset((CODEC_RLE, CODEC_XOR_RLE))) -> EncodedFrame:
+    """
+    压缩一帧RGB565数据
+
+    有参考帧（设备当前显示的上一帧）且允许时先用CODEC_XOR_RLE，效果不好时再试CODEC_RLE；
+    压缩后不比原始数据小时返回CODEC_RAW（payload为原始数据）。
+
+    Args:
+        frame: RGB565字节数据或uint16数组
+        reference: 上一帧，与frame大小相同；None时只用CODEC_RLE
+        codecs: 允许的压缩方式（negotiate_codecs的结果）
+    """
+    words = _as_words(frame)
+    raw_size = words.nbytes
+    best = None
+    if CODEC_XOR_RLE in codecs and reference is not None:
+        previous = _as_words(reference)
+        if previous.size == words.size:
+            best = EncodedFrame(CODEC_XOR_RLE, rle_encode(words ^ previous), raw_size)
+    if CODEC_RLE in codecs and (best is None or len(best.payload) >= raw_size):
+        candidate = EncodedFrame(CODEC_RLE, rle_encode(words), raw_size)
+        if best is None or len(candidate.payload) < len(best.payload):
+            best = candidate
+    if best is None or len(best.payload) >= raw_size:
+        payload = bytes(frame) if isinstance(frame, (bytes, bytearray, memoryview)) else words.tobytes()
+        return EncodedFrame(CODEC_RAW, payload, raw_size)
+    return best
+
+
+def decode_frame(encoded: EncodedFrame, reference=None) -> bytes:
+    """参考解码器：还原encode_frame压缩前的字节数据"""
+    count = encoded.raw_size // 2
+    if encoded.codec == CODEC_RAW:
+        return bytes(encoded.payload)
+    words = rle_decode(encoded.payload, count)
+    if encoded.codec == CODEC_XOR_RLE:
+        if reference is None:
+            raise ValueError("CODEC_XOR_RLE需要参考帧")
+        words ^= _as_words(reference)
+    elif encoded.codec != CODEC_RLE:
+        raise ValueError(f"未知的压缩方式: {encoded.codec}")
+    return words.tobytes()
+
+
+def pack_codec_header(encoded: EncodedFrame) -> bytes:
+    """
+    压缩帧的命令：FF 05 压缩方式 校验，后接压缩后长度和原始长度（32位小端）
+
+    Returns:
+        12字节的命令
+    """
+    return bytes([0xFF, 0x05, encoded.codec, 0xFA - encoded.codec]) + struct.pack(
+        "<II", len(encoded.payload), encoded.raw_size)
+
+
+def iter_frame_packets(encoded: EncodedFrame):
+    """
+    按发送顺序生成一帧的数据：压缩时为压缩帧命令、开始标记、压缩数据、结束标记；
+    CODEC_RAW时与原来相同，为开始标记、原始数据、结束标记
+    """
+    if encoded.codec != CODEC_RAW:
+        yield pack_codec_header(encoded)
+    yield D_START
+    yield encoded.payload
+    yield D_END
+
+
+def query_codec_support(device) -> frozenset:
+    """
+    查询固件支持的压缩方式
+
+    Args:
+        device: usb.core.Device或USBSession（有ctrl_transfer即可）
+
+    Returns:
+        支持的压缩方式集合；旧固件不支持此查询（STALL等）时为空集合
+    """
+    try:
+        caps = device.ctrl_transfer(
+            bmRequestType=0xC0,
+            bRequest=0xA0,
+            wValue=CODEC_CAPS_DESCRIPTOR,
+            wIndex=0,
+            data_or_wLength=1
+        )
+    except Exception as e:
+        print(f"固件不支持压缩查询，使用原始数据发送: {e}")
+        return frozenset()
+    if len(caps) < 1:
+        return frozenset()
+    return frozenset(codec for codec in (CODEC_RLE, CODEC_XOR_RLE) if caps[0] & (1 << codec))
+
+
+def negotiate_codecs(device, enabled=None) -> frozenset:
+    """
+    协商可用的压缩方式：主机端开启且固件报告支持的方式
+
+    Args:
+        device: usb.core.Device或USBSession；USBSession时结果缓存在会话中（设备重新打开后重新查询）
+        enabled: 主机端是否开启，None时使用FRAME_CODEC_ENABLED
+    """
+    if not (FRAME_CODEC_ENABLED if enabled is None else enabled):
+        return frozenset()
+    cache = getattr(device, "cache", None)
+    if cache is None:
+        return query_codec_support(device)
+    codecs = cache.get("frame_codecs")
+    if codecs is None:
+        codecs = cache["frame_codecs"] = query_codec_support(device)
+    return codecs
+
+
+# ================== 基准测试 ==================
+
+def make_animation(width: int, height: int, count: int):
+    """生成测试动画：渐变背景上移动的色块和变化的数字条（RGB565，uint16数组）"""
+    y, x = np.mgrid[0:height, 0:width]
+    background = (((x * 31 // max(width - 1, 1)) << 11) | ((y * 63 // max(height - 1, 1)) << 5)).astype("<u2")
+    block = max(8, min(width, height) // 6)
+    frames = []
+    for index in range(count):
+        frame = background.copy()
+        left = (index * 7) % max(width - block, 1)
+        top = (index * 3) % max(height - block, 1)
+        frame[top:top + block, left:left + block] = 0xF800 if index % 2 else 0x07E0
+        # 类似时钟或计数器的小区域
+        digits = f"{index:06d}"
+        for position, digit in enumerate(digits):
+            x0 = 8 + position * 12
+            frame[8:24, x0:x0 + 10] = 0xFFFF if int(digit) % 2 else 0x001F
+        frames.append(frame)
+    return frames
+
+
+def load_bin_frames(paths, width: int, height: int):
+    """读取RGB565 bin文件作为帧（大小须为width*height*2）"""
+    frames = []
+    for path in paths:
+        data = np.fromfile(path, "<u2")
+        if data.size != width * height:
+            raise ValueError(f"{path}: {data.nbytes}字节，与{width}x{height}不符")
+        frames.append(data.reshape(height, width))
+    return frames
+
+
+def run_benchmark(frames, codecs=frozenset((CODEC_RLE, CODEC_XOR_RLE)), verify: bool = True) -> dict:
+    """
+    逐帧压缩（以前一帧为参考），统计压缩比和每帧编码时间
+
+    Returns:
+        结果字典
+    """
+    per_frame = []
+    previous = None
+    for frame in frames:
+        start = time.perf_counter()
+        encoded = encode_frame(frame, previous, codecs)
+        seconds = time.perf_counter() - start
+        if verify and decode_frame(encoded, previous) != frame.tobytes():
+            raise AssertionError(f"第{len(per_frame)}帧解码结果与原始数据不一致")
+        per_frame.append((encoded.codec, encoded.raw_size, len(encoded.payload), seconds))
+        previous = frame
+    raw_total = sum(item[1] for item in per_frame)
+    sent_total = sum(item[2] for item in per_frame)
+    encode_ms = [item[3] * 1000 for item in per_frame]
+    return {
+        "frames": len(per_frame),
+        "raw_bytes": raw_total,
+        "encoded_bytes": sent_total,
+        "compression_ratio": raw_total / sent_total if sent_total else 0.0,
+        "encode_ms_mean": sum(encode_ms) / len(encode_ms) if encode_ms else 0.0,
+        "encode_ms_max": max(encode_ms) if encode_ms else 0.0,
+        "codecs": {CODEC_NAMES[codec]: sum(1 for item in per_frame if item[0] == codec) for codec in CODEC_NAMES},
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="RGB565帧压缩基准测试（压缩比和每帧编码时间）")
+    parser.add_argument("bins", nargs="*", help="按顺序的RGB565 bin文件，不指定时生成测试动画")
+    parser.add_argument("--width", type=int, default=480, help="帧宽度")
+    parser.add_argument("--height", type=int, default=480, help="帧高度")
+    parser.add_argument("--frames", type=int, default=60, help="测试动画帧数")
+    parser.add_argument("--rle-only", action="store_true", help="只用CODEC_RLE（不与上一帧异或）")
+    parser.add_argument("--no-verify", action="store_true", help="不用参考解码器校验")
+    args = parser.parse_args(argv)
+
+    if args.bins:
+        frames = load_bin_frames(args.bins, args.width, args.height)
+    else:
+        frames = make_animation(args.width, args.height, args.frames)
+    codecs = frozenset((CODEC_RLE,)) if args.rle_only else frozenset((CODEC_RLE, CODEC_XOR_RLE))
+    result = run_benchmark(frames, codecs, verify=not args.no_verify)
+
+    print(f"帧数: {result['frames']} ({args.width}x{args.height})")
+    print(f"原始: {result['raw_bytes']} 字节, 压缩后: {result['encoded_bytes']} 字节, "
+          f"压缩比: {result['compression_ratio']:.2f}")
+    print(f"编码时间: 平均 {result['encode_ms_mean']:.2f} ms/帧, 最长 {result['encode_ms_max']:.2f} ms")
+    print("压缩方式: " + ", ".join(f"{name}={count}" for name, count in result["codecs"].items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""局部刷新：比较新旧RGB565帧，只通过区域命令（FF 04）发送变化的矩形区域"""
+
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+PARTIAL_UPDATE_ENABLED = False  # 主机端总开关，固件支持区域命令（FF 04）的局部刷新后再开启
+REGION_MODE_PARTIAL = 0x02  # M2：设置更新区域
+REGION_COORD_MAX = 0xFFF  # 区域命令中x、y、宽、高各占12位
+
+DIRTY_TILE = 16  # 差分的块大小（像素），块内任一像素变化即视为脏块
+DIRTY_MAX_RECTS = 8  # 每帧最多发送的矩形数
+DIRTY_MERGE_LIMIT = 64  # 初始矩形超过此数时画面过于零散，直接整帧发送
+DIRTY_RECT_COST = 2048  # 每个矩形的额外开销（区域命令、开始/结束标记和传输延迟），折合像素数
+DIRTY_FULL_RATIO = 0.6  # 变化区域超过整帧的此比例时整帧发送
+
+D_START = bytes.fromhex("FF 01")
+D_END = bytes.fromhex("FF 02")
+
+Rect = namedtuple("Rect", ["x", "y", "w", "h"])
+Rect.area = property(lambda self: self.w * self.h)
+
+UpdatePlan = namedtuple("UpdatePlan", ["panel", "full", "rects", "window_reset"])
+UpdatePlan.__doc__ = """
+一次刷新的发送计划
+
+full为True时整帧发送（window_reset为True时先用区域命令把更新区域恢复为整屏）；
+否则只发送rects中的区域，rects为空表示画面未变化，不需要发送。
+"""
+
+
+def pack_region_command(x: int, y: int, w: int, h: int, mode: int = REGION_MODE_PARTIAL) -> bytes:
+    """
+    打包区域命令：FF 04 模式 校验，后接12位的x、y、宽、高和两个保留字节
+
+    Returns:
+        12字节的命令
+    """
+    for name, value in (("x", x), ("y", y), ("w", w), ("h", h)):
+        if not 0 <= value <= REGION_COORD_MAX:
+            raise ValueError(f"区域{name}={value}超出范围 0~{REGION_COORD_MAX}")
+    return bytes([
+        0xFF, 0x04, mode, 0xFD - mode,
+        x >> 4, ((x & 0xF) << 4) | (y >> 8), y & 0xFF,
+        w >> 4, ((w & 0xF) << 4) | (h >> 8), h & 0xFF,
+        0x00, 0x00,
+    ])
+
+
+def _merge_boxes(boxes, max_rects, rect_cost):
+    """
+    反复合并代价最小的两个矩形（合并多发送的像素数），直到再合并不划算且数量不超过max_rects
+    """
+    boxes = [tuple(box) for box in boxes]
+    while len(boxes) > 1:
+        best = None
+        for i in range(len(boxes)):
+            ax0, ay0, ax1, ay1 = boxes[i]
+            area_a = (ax1 - ax0) * (ay1 - ay0)
+            for j in range(i + 1, len(boxes)):
+                bx0, by0, bx1, by1 = boxes[j]
+                union = (min(ax0, bx0), min(ay0, by0), max(ax1, bx1), max(ay1, by1))
+                cost = (union[2] - union[0]) * (union[3] - union[1]) - area_a - (bx1 - bx0) * (by1 - by0)
+                if best is None or cost < best[0]:
+                    best = (cost, i, j, union)
+        cost, i, j, union = best
+        if cost > rect_cost and len(boxes) <= max_rects:
+            break
+        ux0, uy0, ux1, uy1 = union
+        # 被合并结果包含的矩形一并去掉
+        boxes = [union] + [box for k, box in enumerate(boxes) if k not in (i, j)
+                           and not (ux0 <= box[0] and uy0 <= box[1] and box[2] <= ux1 and box[3] <= uy1)]
+    return boxes
+
+
+def find_dirty_rects(previous, frame, tile: int = DIRTY_TILE, max_rects: int = DIRTY_MAX_RECTS,
+                     rect_cost: int = DIRTY_RECT_COST):
+    """
+    比较两帧，求覆盖所有变化像素的少量矩形
+
+    先按tile×tile分块找出脏块，行内连续的脏块合并为横条，上下相邻且横向范围相同的横条
+    合并为矩形，再按发送代价合并到不超过max_rects个，最后收紧到实际变化的像素范围。
+
+    Args:
+        previous: 上次发送的帧，(高, 宽)的uint16数组
+        frame: 新帧，与previous形状相同
+
+    Returns:
+        Rect列表；画面未变化时为空列表，变化过于零散时返回None（应整帧发送）
+    """
+    changed = previous != frame
+    height, width = changed.shape
+    tiles_y, tiles_x = -(-height // tile), -(-width // tile)
+    if tiles_y * tile != height or tiles_x * tile != width:
+        padded = np.zeros((tiles_y * tile, tiles_x * tile), bool)
+        padded[:height, :width] = changed
+    else:
+        padded = changed
+    tiles = padded.reshape(tiles_y, tile, tiles_x, tile).any(axis=(1, 3))
+    if not tiles.any():
+        return []
+
+    boxes = []  # [x0, y0, x1, y1]，单位为块，不含右下边界
+    open_runs = {}  # {(x0, x1): 上一行延续下来的矩形序号}
+    for ty in range(tiles_y):
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], tiles[ty].view(np.int8), [0]))))
+        runs = {}
+        for x0, x1 in zip(edges[::2].tolist(), edges[1::2].tolist()):
+            index = open_runs.get((x0, x1))
+            if index is None:
+                index = len(boxes)
+                boxes.append([x0, ty, x1, ty + 1])
+            else:
+                boxes[index][3] = ty + 1
+            runs[(x0, x1)] = index
+        open_runs = runs
+        if len(boxes) > DIRTY_MERGE_LIMIT:
+            return None
+
+    boxes = [(x0 * tile, y0 * tile, min(x1 * tile, width), min(y1 * tile, height)) for x0, y0, x1, y1 in boxes]
+    rects = []
+    for x0, y0, x1, y1 in _merge_boxes(boxes, max_rects, rect_cost):
+        region = changed[y0:y1, x0:x1]
+        rows = np.flatnonzero(region.any(axis=1))
+        cols = np.flatnonzero(region.any(axis=0))
+        rects.append(Rect(x0 + int(cols[0]), y0 + int(rows[0]),
+                          int(cols[-1] - cols[0]) + 1, int(rows[-1] - rows[0]) + 1))
+    return rects
+
+
+def region_payload(frame, rect: Rect) -> bytes:
+    """取出帧中一个矩形区域的RGB565数据（逐行连续）"""
+    return frame[rect.y:rect.y + rect.h, rect.x:rect.x + rect.w].tobytes()
+
+
+def iter_region_packets(frame, rects):
+    """
+    按发送顺序生成局部刷新的数据：每个矩形依次为区域命令、开始标记、区域数据、结束标记
+    """
+    for rect in rects:
+        yield pack_region_command(*rect)
+        yield D_START
+        yield region_payload(frame, rect)
+        yield D_END
+
+
+class PartialUpdateTracker:
+    """
+    记录每个屏幕上次发送的帧，决定下一帧整帧发送还是只发送变化区域
+
+    用法:
+        plan = tracker.plan(panel, frame)
+        ...按plan发送（局部刷新用iter_region_packets）...
+        tracker.commit(plan, frame)       # 发送成功
+        tracker.invalidate(panel)         # 发送失败，下一帧整帧发送
+    """
+
+    def __init__(self, tile: int = DIRTY_TILE, max_rects: int = DIRTY_MAX_RECTS,
+                 rect_cost: int = DIRTY_RECT_COST, full_ratio: float = DIRTY_FULL_RATIO):
+        self.tile = tile
+        self.max_rects = max_rects
+        self.rect_cost = rect_cost
+        self.full_ratio = full_ratio
+        self.full_updates = 0  # 整帧发送次数
+        self.partial_updates = 0  # 局部刷新次数
+        self.bytes_saved = 0  # 局部刷新比整帧少发送的字节数
+        self._frames = {}  # {屏幕: 上次发送的帧}
+        self._partial_window = set()  # 更新区域可能不是整屏的屏幕
+        self._lock = threading.Lock()
+
+    def has_frame(self, panel) -> bool:
+        """是否记录了该屏幕上次发送的帧（没有时只能整帧发送）"""
+        with self._lock:
+            return panel in self._frames
+
+    def last_frame(self, panel):
+        """该屏幕上次发送的帧（即屏幕当前显示的内容），没有时返回None"""
+        with self._lock:
+            return self._frames.get(panel)
+
+    def plan(self, panel, frame) -> UpdatePlan:
+        """
+        生成发送计划
+
+        Args:
+            panel: 屏幕标识（如屏幕序号）
+            frame: 新帧，(高, 宽)的uint16数组；None表示整帧发送（如边转换边发送时）
+        """
+        with self._lock:
+            previous = self._frames.get(panel)
+            window_reset = panel in self._partial_window
+        if previous is None or frame is None or previous.shape != frame.shape:
+            return UpdatePlan(panel, True, [], window_reset)
+        rects = find_dirty_rects(previous, frame, self.tile, self.max_rects, self.rect_cost)
+        if rects is None or sum(rect.area for rect in rects) > self.full_ratio * frame.size:
+            return UpdatePlan(panel, True, [], window_reset)
+        return UpdatePlan(panel, False, rects, False)
+
+    def commit(self, plan: UpdatePlan, frame):
+        """按计划发送成功后记录新帧（可写数组复制一份，防止调用方复用缓冲区）"""
+        if frame.flags.writeable:
+            frame = frame.copy()
+        with self._lock:
+            self._frames[plan.panel] = frame
+            if plan.full:
+                self.full_updates += 1
+                self._partial_window.discard(plan.panel)
+            elif plan.rects:
+                self.partial_updates += 1
+                self.bytes_saved += (frame.size - sum(rect.area for rect in plan.rects)) * frame.itemsize
+                self._partial_window.add(plan.panel)
+
+    def invalidate(self, panel=None):
+        """
+        忘记屏幕上次的帧（发送失败或设备重新连接后调用），下一帧整帧发送并先恢复整屏区域
+
+        Args:
+            panel: 屏幕标识，None时清除所有屏幕
+        """
+        with self._lock:
+            panels = list(self._frames) if panel is None else [panel]
+            for key in panels:
+                self._frames.pop(key, None)
+                self._partial_window.add(key)
@@ -0,0 +1,128 @@
+"""RGB565编码：在预分配的输出缓冲区中原地打包，支持小端、大端和红蓝互换"""
+
+import sys
+
+import numpy as np
+
+RGB565_LITTLE = "little"  # 低字节在前
+RGB565_BIG = "big"  # 高字节在前（RT1809面板使用的格式）
+
+# 各位域：(掩码, 左移位数)，负数为右移；8位通道值经掩码和移位后落到16位中的位置
+_HIGH5 = (0xF8, 8)  # 位15-11
+_MIDDLE6 = (0xFC, 3)  # 位10-5
+_LOW5 = (0xF8, -3)  # 位4-0
+
+
+def _check_modes(byteorder: str, channel_order: str):
+    if byteorder not in (RGB565_LITTLE, RGB565_BIG):
+        raise ValueError(f"不支持的字节序: {byteorder}")
+    if channel_order not in ("bgr", "rgb"):
+        raise ValueError(f"不支持的通道顺序: {channel_order}")
+
+
+def _pack_field(channel, field, target, first: bool, scratch):
+    """把一个通道打包到target的位域（first时直接写入，否则经scratch按位或）"""
+    mask, shift = field
+    dest = target if first else scratch
+    np.copyto(dest, channel, casting="unsafe")
+    np.bitwise_and(dest, mask, out=dest)
+    if shift > 0:
+        np.left_shift(dest, shift, out=dest)
+    elif shift < 0:
+        np.right_shift(dest, -shift, out=dest)
+    if not first:
+        np.bitwise_or(target, dest, out=target)
+
+
+def encode_rgb565(image, byteorder: str = RGB565_BIG, swap_rb: bool = False, channel_order: str = "bgr",
+                  out=None, scratch=None):
+    """
+    把8位彩色图像编码为RGB565
+
+    所有运算都在uint16的out和scratch上原地进行，不生成其他整帧临时数组；
+    非本机字节序时最后原地交换字节。
+
+    Args:
+        image: uint8数组，形状为(..., 3)或(..., 4)，如(高, 宽, 3)或(帧数, 高, 宽, 3)
+        byteorder: RGB565_BIG（高字节在前）或RGB565_LITTLE（低字节在前）
+        swap_rb: 互换红蓝位域（BGR565）
+        channel_order: 输入通道顺序，"bgr"（cv2.imread）或"rgb"（PIL等）
+        out: 预分配的uint16输出数组（元素数与像素数相同），None时新建
+        scratch: 预分配的uint16临时数组（元素数与像素数相同），None时新建
+
+    Returns:
+        uint16数组，形状为image.shape[:-1]；tobytes()/tofile()得到按byteorder排列的字节
+    """
+    image = np.asarray(image)
+    if image.dtype != np.uint8 or image.ndim < 2 or image.shape[-1] not in (3, 4):
+        raise ValueError(f"需要uint8的3或4通道图像，实际为 {image.dtype} {image.shape}")
+    _check_modes(byteorder, channel_order)
+    shape = image.shape[:-1]
+    out = np.empty(shape, np.uint16) if out is None else out.reshape(shape)
+    scratch = np.empty(shape, np.uint16) if scratch is None else scratch.reshape(shape)
+    red, green, blue = (image[..., 2], image[..., 1], image[..., 0]) if channel_order == "bgr" \
+        else (image[..., 0], image[..., 1], image[..., 2])
+    if swap_rb:
+        red, blue = blue, red
+    _pack_field(red, _HIGH5, out, True, scratch)
+    _pack_field(green, _MIDDLE6, out, False, scratch)
+    _pack_field(blue, _LOW5, out, False, scratch)
+    if byteorder != sys.byteorder:
+        out.byteswap(inplace=True)
+    return out
+
+
+def encode_rgb565_bytes(image, byteorder: str = RGB565_BIG, swap_rb: bool = False, channel_order: str = "bgr") -> bytes:
+    """把8位彩色图像编码为RGB565字节数据"""
+    return encode_rgb565(image, byteorder, swap_rb, channel_order).tobytes()
+
+
+def encode_rgb565_frames(frames, byteorder: str = RGB565_BIG, swap_rb: bool = False, channel_order: str = "bgr",
+                         out=None):
+    """
+    批量编码尺寸相同的多帧图像
+
+    Args:
+        frames: (帧数, 高, 宽, 3)数组或尺寸相同的帧列表
+        out: 预分配的uint16输出数组，形状为(帧数, 高, 宽)，None时新建
+
+    Returns:
+        uint16数组，形状为(帧数, 高, 宽)
+    """
+    if isinstance(frames, np.ndarray):
+        return encode_rgb565(frames, byteorder, swap_rb, channel_order, out)
+    if not frames:
+        return np.empty((0, 0, 0), np.uint16)
+    shape = np.shape(frames[0])[:-1]
+    if out is None:
+        out = np.empty((len(frames),) + shape, np.uint16)
+    scratch = np.empty(shape, np.uint16)
+    for index, frame in enumerate(frames):
+        if np.shape(frame)[:-1] != shape:
+            raise ValueError(f"第{index}帧尺寸 {np.shape(frame)[:-1]} 与第0帧 {shape} 不同")
+        encode_rgb565(frame, byteorder, swap_rb, channel_order, out[index], scratch)
+    return out
+
+
+class RGB565Encoder:
+    """
+    重复编码同尺寸图像的编码器，输出和临时缓冲区只分配一次
+
+    encode返回的数组在下一次encode时被覆盖，需要保留时请复制（如tobytes()）。
+    """
+
+    def __init__(self, byteorder: str = RGB565_BIG, swap_rb: bool = False, channel_order: str = "bgr"):
+        _check_modes(byteorder, channel_order)
+        self.byteorder = byteorder
+        self.swap_rb = swap_rb
+        self.channel_order = channel_order
+        self._out = None
+        self._scratch = None
+
+    def encode(self, image):
+        """编码一帧，尺寸变化时重新分配缓冲区"""
+        shape = np.shape(image)[:-1]
+        if self._out is None or self._out.shape != shape:
+            self._out = np.empty(shape, np.uint16)
+            self._scratch = np.empty(shape, np.uint16)
+        return encode_rgb565(image, self.byteorder, self.swap_rb, self.channel_order, self._out, self._scratch)
@@ -0,0 +1,247 @@
+"""USB设备会话：按VID/PID缓存已配置的设备句柄、已声明的接口和端点描述符"""
+
+import atexit
+import errno
+import threading
+
+import usb.core
+import usb.util
+
+BULK_CHUNK_SIZE = 64 * 1024  # 单次提交的bulk数据大小，由主机控制器按wMaxPacketSize拆包
+BULK_MIN_TIMEOUT = 1000  # bulk写入的最小超时（毫秒）
+BULK_PACKET_TIMEOUT = 20  # 默认超时中每个wMaxPacketSize包的份额（毫秒）
+
+
+def is_disconnect_error(e: Exception) -> bool:
+    """
+    判断USB错误是否表示设备已断开（拔出或重新枚举），此时需要重新打开设备
+    """
+    if not isinstance(e, usb.core.USBError):
+        return False
+    # 旧版pyusb没有USBTimeoutError
+    if isinstance(e, getattr(usb.core, "USBTimeoutError", ())):
+        return False
+    # libusb: LIBUSB_ERROR_IO = -1, LIBUSB_ERROR_NO_DEVICE = -4
+    if getattr(e, "backend_error_code", None) in (-1, -4):
+        return True
+    if e.errno in (errno.ENODEV, errno.EIO):
+        return True
+    message = str(e).lower()
+    return "no such device" in message or "no device" in message
+
+
+def bulk_write(ep, data, chunk_size=BULK_CHUNK_SIZE, timeout=None, progress=None,
+               block_size=None, block_timeout=BULK_PACKET_TIMEOUT):
+    """
+    以大块提交bulk OUT数据，不再每个wMaxPacketSize调用一次ep.write
+
+    chunk_size向下取整为wMaxPacketSize的整数倍，除最后一块外每块都以完整包结束，
+    设备收到的包序列与逐包写入时相同。
+
+    Args:
+        ep: OUT端点
+        data: bytes或bytearray
+        chunk_size: 单次提交的字节数
+        timeout: 每次提交的超时（毫秒），None时为本次提交的块数×block_timeout（不低于BULK_MIN_TIMEOUT）
+        progress: 每次提交后以写入字节数调用
+        block_size: 计算默认超时的块大小，None时为wMaxPacketSize；
+            设备每收到一块都要处理时（如OTA每2KB写一次Flash）传入该块大小
+        block_timeout: 每块的超时（毫秒）
+
+    Returns:
+        写入的字节数
+    """
+    packet_size = ep.wMaxPacketSize or 64
+    chunk_size = max(packet_size, chunk_size - chunk_size % packet_size)
+    block_size = block_size or packet_size
+    written = 0
+    for offset in range(0, len(data), chunk_size):
+        chunk = data[offset:offset + chunk_size]
+        # 超时按本次提交的块数计算，与逐块写入时每块各有一次超时相当
+        chunk_timeout = timeout
+        if chunk_timeout is None:
+            chunk_timeout = max(BULK_MIN_TIMEOUT, -(-len(chunk) // block_size) * block_timeout)
+        count = ep.write(chunk, chunk_timeout)
+        written += count
+        if progress:
+            progress(count)
+    return written
+
+
+class USBSession:
+    """
+    一个VID/PID的USB设备会话
+
+    设备只查找和配置一次，之后的控制传输直接使用缓存的句柄，
+    不再每次调用usb.core.find和set_configuration。设备拔出后
+    ctrl_transfer自动重新打开一次；bulk传输出错时调用方调用close，
+    下次使用时重新打开。同一会话的控制传输串行执行。
+    """
+
+    def __init__(self, vid: int, pid: int):
+        self.vid = vid
+        self.pid = pid
+        self.dev = None
+        self.lock = threading.RLock()
+        self.reconnects = 0  # 设备断开后重新打开的次数
+        self._interfaces = set()  # 已声明的接口号
+        self._endpoints = {}  # {(接口号, 端点地址): 端点描述符}
+        self.cache = {}  # 调用方缓存的设备静态信息，设备关闭或重新打开时清空
+        self.bulk_chunk_size = BULK_CHUNK_SIZE  # 该设备单次提交的bulk数据大小
+
+    @property
+    def is_open(self) -> bool:
+        return self.dev is not None
+
+    def open(self):
+        """
+        打开并配置设备（已打开时直接返回缓存的句柄）
+
+        Returns:
+            usb.core.Device
+        """
+        with self.lock:
+            if self.dev is not None:
+                return self.dev
+            dev = usb.core.find(idVendor=self.vid, idProduct=self.pid)
+            if dev is None:
+                raise ValueError('設備未找到，請檢查VID和PID')
+            try:
+                dev.set_configuration()
+            except usb.core.USBError as e:
+                # 如果配置已經設置，忽略此錯誤
+                if "already" not in str(e).lower() and "busy" not in str(e).lower():
+                    usb.util.dispose_resources(dev)
+                    raise
+            self.dev = dev
+            return dev
+
+    def claim_interface(self, interface: int = 0):
+        """
+        声明接口（必要时先分离内核驱动），已声明时不重复声明
+
+        Returns:
+            usb.core.Device
+        """
+        with self.lock:
+            dev = self.open()
+            if interface in self._interfaces:
+                return dev
+            try:
+                if dev.is_kernel_driver_active(interface):
+                    dev.detach_kernel_driver(interface)
+            except (usb.core.USBError, NotImplementedError):
+                pass  # Windows可能不支持此操作
+            usb.util.claim_interface(dev, interface)
+            self._interfaces.add(interface)
+            return dev
+
+    def endpoint(self, address: int, interface: int = 0):
+        """
+        获取端点描述符（缓存）
+
+        Args:
+            address: 端点地址，如0x02
+            interface: 接口号
+        """
+        with self.lock:
+            key = (interface, address)
+            ep = self._endpoints.get(key)
+            if ep is None:
+                dev = self.open()
+                intf = dev.get_active_configuration()[(interface, 0)]
+                ep = usb.util.find_descriptor(intf, custom_match=lambda e: e.bEndpointAddress == address)
+                if ep is None:
+                    raise ValueError(f'未找到指定的端点 0x{address:02X} (接口{interface})')
+                self._endpoints[key] = ep
+            return ep
+
+    def bulk_write(self, address: int, data, interface: int = 0, timeout=None, progress=None):
+        """以bulk_chunk_size大块写入OUT端点，返回写入的字节数"""
+        return bulk_write(self.endpoint(address, interface), data, self.bulk_chunk_size, timeout, progress)
+
+    def ctrl_transfer(self, bmRequestType, bRequest, wValue=0, wIndex=0, data_or_wLength=None, timeout=1000):
+        """执行控制传输，设备已断开时重新打开后再试一次"""
+        with self.lock:
+            for attempt in range(2):
+                dev = self.open()
+                try:
+                    return dev.ctrl_transfer(
+                        bmRequestType=bmRequestType,
+                        bRequest=bRequest,
+                        wValue=wValue,
+                        wIndex=wIndex,
+                        data_or_wLength=data_or_wLength,
+                        timeout=timeout
+                    )
+                except usb.core.USBError as e:
+                    if attempt == 0 and is_disconnect_error(e):
+                        self.close()
+                        self.reconnects += 1
+                        continue
+                    raise
+
+    def close(self):
+        """释放已声明的接口和设备句柄，下次使用时重新打开"""
+        with self.lock:
+            dev = self.dev
+            self.dev = None
+            interfaces = self._interfaces
+            self._interfaces = set()
+            self._endpoints = {}
+            cache = self.cache
+            self.cache = {}
+            # 缓存中持有设备资源的对象（如异步写入器）先于设备关闭
+            for value in cache.values():
+                if hasattr(value, "close"):
+                    try:
+                        value.close()
+                    except Exception:
+                        pass
+            if dev is None:
+                return
+            for interface in interfaces:
+                try:
+                    usb.util.release_interface(dev, interface)
+                except Exception:
+                    pass
+            try:
+                usb.util.dispose_resources(dev)
+            except Exception:
+                pass
+
+
+class USBSessionPool:
+    """进程内的USB设备会话池，每个VID/PID一个会话"""
+
+    _sessions = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, vid: int, pid: int) -> USBSession:
+        """获取VID/PID的会话（不立即打开设备）"""
+        with cls._lock:
+            session = cls._sessions.get((vid, pid))
+            if session is None:
+                session = USBSession(vid, pid)
+                cls._sessions[(vid, pid)] = session
+            return session
+
+    @classmethod
+    def close(cls, vid: int, pid: int):
+        """关闭VID/PID的会话（例如设备即将重启时）"""
+        with cls._lock:
+            session = cls._sessions.get((vid, pid))
+        if session is not None:
+            session.close()
+
+    @classmethod
+    def close_all(cls):
+        """关闭所有会话"""
+        with cls._lock:
+            sessions = list(cls._sessions.values())
+        for session in sessions:
+            session.close()
+
+
+atexit.register(USBSessionPool.close_all)
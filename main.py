@@ -13,6 +13,11 @@ from tkinter import messagebox, ttk, filedialog
 from PIL import Image, ImageTk
 from example_run_dll import CryptoLib,ECPoint
 from example_control import CreatePackage, random_key, set_control_transfer, get_control_transfer
+from example_usb_session import USBSessionPool, bulk_write
+from example_usb_async import open_async_writer
+from example_rgb565 import encode_rgb565, RGB565_BIG
+from example_partial_update import Rect, pack_region_command
+from example_frame_codec import CODEC_NAMES, encode_frame, iter_frame_packets, negotiate_codecs
 AUO = 0
 WIDGET = 1
 NOTIKINTER = 2
@@ -21,10 +26,6 @@ DUALPANEL = 4
 APP_model_ = DUALPANEL#NOTIKINTER
 OTA_FILE_PATH = "1809_bin/GPCM2_CM3_strip_Trans_r.bin"
 imgdata = None
-dev = None
-cfg = None
-ep = None
-intf = None
 isPUM = False
 isModel = None
 def save_image_as_bytes(image_path, output_path, format='.png'):
@@ -65,15 +66,10 @@ def save_image_rgb565_bin(image_path, output_path):
     img = cv2.imread(image_path)
     if img is None:
         raise FileNotFoundError(f"无法读取图片: {image_path}")
-    rgb = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
-    r = (rgb[..., 0] >> 3).astype(np.uint16)
-    g = (rgb[..., 1] >> 2).astype(np.uint16)
-    b = (rgb[..., 2] >> 3).astype(np.uint16)
-    # r
-    rgb565 = (b << 8) | (g << 13) | (r << 3) | (g >> 3)
-    rgb565 = rgb565.flatten()
+    # 设备使用高字节在前的RGB565
+    rgb565 = encode_rgb565(img, RGB565_BIG)
     with open(output_path, 'wb') as f:
-        f.write(rgb565.tobytes()) 
+        rgb565.tofile(f)
 
 def get_state(dev):
     result = 0
@@ -102,63 +98,61 @@ def send_bytes_over_usb(vid, pid, endpoint_out, directory_path):
     :param endpoint_out: USB输出端点
     :param directory_path: 包含bin文件的目录路径
     """
-    global dev , ep
-    # 查找 USB 设备
-    if(dev is None):
-        dev = usb.core.find(idVendor=vid, idProduct=pid)
-        if dev is None:
-            raise ValueError('设备未找到，请检查VID和PID')
-        # 设置配置
-        dev.set_configuration()
-    # 获取端点
-    if(ep is None):
-        cfg = dev.get_active_configuration()
-        intf = cfg[(0,0)]
-        ep = usb.util.find_descriptor(
-            intf,
-            custom_match = lambda e: e.bEndpointAddress == endpoint_out
-        )
-        if ep is None:
-            raise ValueError('未找到指定的 OUT 端点')
-
-    # 获取目录下所有的bin文件
-    bin_files = [f for f in os.listdir(directory_path) if f.endswith('.bin')]
-    if not bin_files:
-        raise ValueError(f'在目录 {directory_path} 中没有找到.bin文件')
-
-    # 发送数据
-    chunk_size = ep.wMaxPacketSize
-    d_start = bytes.fromhex("FF 01")
-    d_clear = bytes.fromhex("FF 04")
-    d_end = bytes.fromhex("FF 02")
-
-    #ep.write(d_clear)
-    for bin_file in bin_files:
-        file_path = os.path.join(directory_path, bin_file)
-        print(f"正在发送文件: {bin_file}")
-        
-        # 读取文件数据
-        with open(file_path, 'rb') as f:
-            data = f.read()
-        data_len = len(data)
-        data_count = 0
+    # 使用缓存的设备句柄和端点描述符，多次发送不再重新查找设备
+    session = USBSessionPool.get(vid, pid)
+    try:
+        ep = session.endpoint(endpoint_out)
+        # libusb1后端时异步提交，多个传输同时在途；否则同步写入
+        writer = open_async_writer(session, endpoint_out)
+        # 主机端开启且固件支持时压缩发送
+        codecs = negotiate_codecs(session)
+
+        # 获取目录下所有的bin文件
+        bin_files = [f for f in os.listdir(directory_path) if f.endswith('.bin')]
+        if not bin_files:
+            raise ValueError(f'在目录 {directory_path} 中没有找到.bin文件')
+
         # 发送数据
+        d_start = bytes.fromhex("FF 01")
+        d_clear = bytes.fromhex("FF 04")
+        d_end = bytes.fromhex("FF 02")
+
         #ep.write(d_clear)
-        ep.write(d_start)
-        indexss = 100
-        data_array = None        
-        for i in range(0, len(data), chunk_size):
-            ep.write(data[i:i+chunk_size])
-        ep.write(d_end)
-        print(f"已通过USB发送 {len(data)} 字节")
+        previous = None  # 上一个发送的文件数据（屏幕当前内容）
+        for bin_file in bin_files:
+            file_path = os.path.join(directory_path, bin_file)
+            print(f"正在发送文件: {bin_file}")
         
-        # 可选：在文件之间添加短暂延迟
-        time.sleep(0.5)
-    usb.util.dispose_resources(dev)
-    ep = None
-    dev = None
-    
-    
+            # 读取文件数据
+            with open(file_path, 'rb') as f:
+                data = f.read()
+            data_len = len(data)
+            data_count = 0
+            # 发送数据：固件支持时压缩（相同大小的上一个文件作为异或参考），否则为开始标记 + 数据 + 结束标记
+            #ep.write(d_clear)
+            if codecs:
+                encoded = encode_frame(data, previous if previous is not None and len(previous) == data_len else None, codecs)
+                packets = list(iter_frame_packets(encoded))
+                print(f"压缩方式: {CODEC_NAMES[encoded.codec]}, {data_len} -> {len(encoded.payload)} 字节")
+            else:
+                packets = [d_start, data, d_end]
+            if writer is not None:
+                for packet in packets:
+                    writer.submit(packet)
+                writer.flush()
+            else:
+                # 整块提交，由主机控制器拆包
+                for packet in packets:
+                    bulk_write(ep, packet, session.bulk_chunk_size)
+            previous = data
+            print(f"已通过USB发送 {len(data)} 字节")
+        
+            # 可选：在文件之间添加短暂延迟
+            time.sleep(0.5)
+    except (usb.core.USBError, TimeoutError):
+        # 拔出或写入失败后句柄、端点和异步写入器已失效，释放后下次发送时重新打开设备
+        session.close()
+        raise
 
 
 def crcCalculate(crc : bytearray):
@@ -168,75 +162,50 @@ def openDeviceIS(vid, pid):
     pass
 
 def edit2textProcess(dataLinst):
+    """解析輸入的"x y w h"，返回(是否有效, Rect)"""
     text = dataLinst.split()
     text = [int(x) for x in text]
-    data_one = list()
-    data_two = list()
     if(len(text) != 4):
-        return False, data_one, data_two
+        return False, None
         
     if(((text[0] + text[2] ) < 1920 ) and ((text[1] + text[3]) < 1080)):
-        data_one.append(text[0] >> 4)
-        data_one.append(((text[0] & 0xf) << 4) | (text[1] >> 8))
-        data_one.append(text[1] & 0xff)
-        data_one.append(text[2] >> 4)
-        data_two.append(((text[2] & 0xf) << 4) | (text[3] >> 8))
-        data_two.append(text[3] & 0xff);
-        data_two.append(0x00)
-        data_two.append(0x00)
-        return True , data_one, data_two
-    return False, data_one, data_two
+        return True, Rect(*text)
+    return False, None
 
 def send_USB_data(vid, pid, endpoint_out,mode:str, data = None):
-    global dev, cfg, ep, intf
-    if dev is None:
-        print("dev is none")
-        dev = usb.core.find(idVendor=vid, idProduct=pid)
-        if dev is None:
-            raise ValueError('设备未找到，请检查VID和PID')
-        dev.set_configuration()
-    
-    # 设置配置
-    #dev.set_configuration()
-
-    # 获取端点
-    if cfg is None:
-        cfg = dev.get_active_configuration()
-    if intf is None:
-        intf = cfg[(0,0)]
-    if ep is None:
-        ep = usb.util.find_descriptor(
-            intf,
-            custom_match = lambda e: e.bEndpointAddress == endpoint_out
-        )
-
-    if ep is None:
-        raise ValueError('未找到指定的 OUT 端点')
+    # 使用缓存的设备句柄和端点描述符
+    session = USBSessionPool.get(vid, pid)
+    try:
+        ep = session.endpoint(endpoint_out)
 
-    # 发送数据
-    chunk_size = ep.wMaxPacketSize
-    d_start = bytes.fromhex("FF 01")
-    d_clear = bytes.fromhex("FF 04")
-    d_end = bytes.fromhex("FF 02")
+        # 发送数据
+        chunk_size = ep.wMaxPacketSize
+        d_start = bytes.fromhex("FF 01")
+        d_clear = bytes.fromhex("FF 04")
+        d_end = bytes.fromhex("FF 02")
     
-    d_m0 = bytes.fromhex("FF 04 00 fd")
-    d_m1 = bytes.fromhex("FF 04 01 fc")
-    d_m2 = bytes.fromhex("FF 04 02 fb")
-    d_m3 = bytes.fromhex("FF 04 03 fa")
-    d_m4 = bytes.fromhex("FF 04 04 f9")
+        d_m0 = bytes.fromhex("FF 04 00 fd")
+        d_m1 = bytes.fromhex("FF 04 01 fc")
+        d_m2 = bytes.fromhex("FF 04 02 fb")
+        d_m3 = bytes.fromhex("FF 04 03 fa")
+        d_m4 = bytes.fromhex("FF 04 04 f9")
     
-    if mode == "M0":
-        ep.write(d_m0)
-    elif mode == "M1":
-        ep.write(d_m1)
-    elif mode == "M2":
-        ep.write(data)
-    elif mode == "M3":
-        ep.write(d_m3)
-    elif mode == "M4":        
-        ep.write(data)
+        if mode == "M0":
+            ep.write(d_m0)
+        elif mode == "M1":
+            ep.write(d_m1)
+        elif mode == "M2":
+            ep.write(data)
+        elif mode == "M3":
+            ep.write(d_m3)
+        elif mode == "M4":        
+            ep.write(data)
     
-    print(type(d_m2))
+        print(type(d_m2))
+    except usb.core.USBError:
+        # 拔出或写入失败后句柄和端点已失效，释放后下次发送时重新打开设备
+        session.close()
+        raise
 
     #dev = None
 
@@ -275,17 +244,11 @@ def process_text():
         messagebox.showinfo("訊息", "輸入欄位為空！")
         return
 
-    state, data_one, data_two = edit2textProcess(input_text)
+    state, rect = edit2textProcess(input_text)
     if state == False:
         return
-    send_data = None
-    if isModel == "M2":
-        send_data = bytearray([255, 4, 2, 251])
-    elif isModel == "M4":
-        send_data = bytearray("FF 04 02 f9")
-    send_data.extend(data_one)
-    send_data.extend(data_two)
-    final = bytes(send_data)
+    # M2: FF 04 02 FB，M4: FF 04 04 F9，後接區域座標
+    final = pack_region_command(*rect, mode=2 if isModel == "M2" else 4)
     send_USB_data(vid=0x34C7, pid=0x8888, endpoint_out= 0x02 ,mode= isModel, data= final)
     #if state == True:
     # 這可以添加任何自定義處理邏輯
@@ -446,81 +409,73 @@ class ImageViewerApp:
         self.last_canvas_height = self.canvas.winfo_height()
         self.root.after(500, self.check_canvas_size)
 
-def ota_usb_send(vid, pid, endpoint_out, file_path = None):
+def ota_usb_send(vid, pid, endpoint_out, file_path = None, timeout_ms = 5000):
     # 查找 USB 设备
     cheksum = 0
-    dev = usb.core.find(idVendor=vid, idProduct=pid)
-    if dev is None:
-        raise ValueError('设备未找到，请检查VID和PID')
-
-    # 设置配置
-    dev.set_configuration()
-
-    # 获取端点
-    cfg = dev.get_active_configuration()
-    intf = cfg[(0,0)]
-    ep = usb.util.find_descriptor(
-        intf,
-        custom_match = lambda e: e.bEndpointAddress == endpoint_out
-    )
-    if ep is None:
-        raise ValueError('未找到指定的 OUT 端点')
-
-    # 发送数据
-    chunk_size = ep.wMaxPacketSize
-    d_key = bytes.fromhex("1B 24 42 4f 4f 54 00")
-    d_lens = bytes.fromhex("00 01 00 00")
-    #d_header = bytes.fromhex("43 4D 33 58")
+    # 使用缓存的设备句柄和端点描述符
+    session = USBSessionPool.get(vid, pid)
+    try:
+        ep = session.endpoint(endpoint_out)
+
+        # 发送数据
+        chunk_size = ep.wMaxPacketSize
+        d_key = bytes.fromhex("1B 24 42 4f 4f 54 00")
+        d_lens = bytes.fromhex("00 01 00 00")
+        #d_header = bytes.fromhex("43 4D 33 58")
     
-    for i in range(0, len(d_key), chunk_size):
-        ep.write(d_key[i:i+chunk_size])
-    print(f"已通过USB发送 {len(d_key)} 字节")
-
-    for i in range(0, len(d_lens), chunk_size):
-        ep.write(d_lens[i:i+chunk_size])
-    print(f"已通过USB发送 {len(d_lens)} 字节")
-
-    if file_path is not None and os.path.exists(file_path):
-        file_size = os.path.getsize(file_path)
-        data_list = []
-        data_list_len = int(file_size / 2048)
-        data_list_pa_len = 2048
-        with open(file_path, "rb") as f:
-            for i in range(0 , data_list_len):
-                data_list.append(f.read(data_list_pa_len))
-        d_header = data_list[0][0:4] 
-        print(f"data list len : {data_list_len} data list pa len : {data_list_pa_len}")
-        checksum = 0
-        checksum_list = []
-        count = 0;
-        for i in range(0, data_list_len):
-            count = 0
-            for j in range(0, data_list_pa_len):
-                checksum += data_list[i][j]
-                count += data_list[i][j]
-            checksum_list.append(count)
-        byte_array = bytearray(struct.pack('>I', checksum))
-        print(f"checksum : {checksum} byte_array : {byte_array}")
-
-        for i in range(0, len(d_header), chunk_size):
-            ep.write(d_header[i:i+chunk_size])
-        print(f"已通过USB发送 {len(d_header)} 字节")
-        cheksum = 0
-        for j in range(0, data_list_len):
-            print(f"package : {j}")
-            for i in range(0, data_list_pa_len, chunk_size):
-                ep.write(data_list[j][i:i + chunk_size])
-            #time.sleep(0.5)
-
-        print(f"END CHeksum {checksum}")
+        for i in range(0, len(d_key), chunk_size):
+            ep.write(d_key[i:i+chunk_size])
+        print(f"已通过USB发送 {len(d_key)} 字节")
+
+        for i in range(0, len(d_lens), chunk_size):
+            ep.write(d_lens[i:i+chunk_size])
+        print(f"已通过USB发送 {len(d_lens)} 字节")
+
+        if file_path is not None and os.path.exists(file_path):
+            file_size = os.path.getsize(file_path)
+            data_list = []
+            data_list_len = int(file_size / 2048)
+            data_list_pa_len = 2048
+            with open(file_path, "rb") as f:
+                for i in range(0 , data_list_len):
+                    data_list.append(f.read(data_list_pa_len))
+            d_header = data_list[0][0:4] 
+            print(f"data list len : {data_list_len} data list pa len : {data_list_pa_len}")
+            checksum = 0
+            checksum_list = []
+            count = 0;
+            for i in range(0, data_list_len):
+                count = 0
+                for j in range(0, data_list_pa_len):
+                    checksum += data_list[i][j]
+                    count += data_list[i][j]
+                checksum_list.append(count)
+            byte_array = bytearray(struct.pack('>I', checksum))
+            print(f"checksum : {checksum} byte_array : {byte_array}")
+
+            for i in range(0, len(d_header), chunk_size):
+                ep.write(d_header[i:i+chunk_size])
+            print(f"已通过USB发送 {len(d_header)} 字节")
+            cheksum = 0
+            # 所有数据包整块提交，由主机控制器拆包；设备写Flash较慢，每块保留timeout_ms
+            bulk_write(ep, b"".join(data_list), session.bulk_chunk_size,
+                       block_size=data_list_pa_len, block_timeout=timeout_ms)
+            print(f"package : {data_list_len}")
+
+            print(f"END CHeksum {checksum}")
 
                 
 
-        ep.write(byte_array)
+            ep.write(byte_array)
+    except usb.core.USBError:
+        # 拔出或写入失败后句柄和端点已失效，释放后下次发送时重新打开设备
+        session.close()
+        raise
 
     time.sleep(0.5)
     print("Data is None")
-    dev = None
+    # 设备写入固件后重启，下次使用时重新打开
+    USBSessionPool.close(vid, pid)
 
 if APP_model_ == AUO:
     # 創建主視窗
@@ -568,11 +523,7 @@ elif APP_model_ == WIDGET:
     app = ImageViewerApp(root)
     app.run()
 elif APP_model_ == NOTIKINTER:
-    for i in range(1, 10):
-        if(GetPanelSourceState() == 1):
-            if(GetPanelState() == 1):
-                break
-        time.sleep(0.5)
+    WaitPanelReady()
     package = CreatePackage(0x32, random_key)
     print("Config pp Key")
     CryptoLib.config_key_function(random_key)
@@ -587,11 +538,7 @@ elif APP_model_ == NOTIKINTER:
     send_bytes_over_usb(vid=0x34C7, pid=0x8888, endpoint_out=0x02, directory_path=".")
 
 elif APP_model_ == OTA:
-    for i in range(1, 10):
-        if(GetPanelSourceState() == 1):
-            if(GetPanelState() == 1):
-                break
-        time.sleep(0.5)
+    WaitPanelReady()
     package = CreatePackage(0x32, random_key)
     print("Config pp Key")
     CryptoLib.config_key_function(random_key)
@@ -612,10 +559,7 @@ elif APP_model_ == OTA:
 
 elif APP_model_ == DUALPANEL:
     # Flow
-    # Step 1 GetPanelNumber - 获取屏幕数量
-    # Step 2 GetPanelSize - 获取屏幕尺寸
-    # Step 3 GetPanelDirect - 获取屏幕方向
-    # Step 4 GetPanelShape - 获取屏幕形状
+    # Step 1-4 GetPanelInfo - 一次获取屏幕数量、尺寸、方向和形状
     # Step 5 SelectPanel - 选择屏幕
     # Step 6 SendStartCmd - 发送开始命令
     # Step 7 SendData - 发送数据
@@ -635,17 +579,13 @@ elif APP_model_ == DUALPANEL:
     # 等待设备就绪
     # GetPanelSourceState 返回值: 0=logo, 1=background, 2=usb
     # 返回值 > 0 表示设备已初始化
-    for i in range(1, 10):
-        source_state = GetPanelSourceState()
-        state_val = get_value(source_state)
-        if state_val is not None and state_val > 0:
-            print(f"Device ready, source state: {state_val}")
-            break
-        time.sleep(0.5)
+    ready = WaitForState(PollPanelSourceState, lambda state: state > 0)
+    if ready.ok:
+        print(f"Device ready, source state: {get_value(ready.value)} ({ready.elapsed:.3f}s)")
     
-    # 获取屏幕数量，决定使用的索引
-    panel_num = GetPanelNumber()
-    num_panels = get_value(panel_num) or 1
+    # 获取所有屏幕的描述符（静态信息在设备会话期间缓存），决定使用的索引
+    panel_info = GetPanelInfo()
+    num_panels = (panel_info.panel_num if panel_info is not None else 0) or 1
     print(f"Panel count: {num_panels}")
     
     # 重要：索引从 0 开始，单屏时只有 index=0 有效
@@ -659,25 +599,10 @@ elif APP_model_ == DUALPANEL:
     # 选择屏幕
     SetSelectPanel(index)
     
-    # 获取当前屏幕尺寸
-    panel_size = GetPanelSize(index)
-    if panel_size is not None:
-        # 16位小端序: h = [0]+[1]*256, w = [2]+[3]*256
-        height = get_value(panel_size, 0) + (get_value(panel_size, 1) * 256)
-        width = get_value(panel_size, 2) + (get_value(panel_size, 3) * 256)
-        print(f"Panel {index} size: {width}x{height}")
-    
-    # 如果是双屏，获取另一个屏幕的尺寸
-    if num_panels > 1:
-        other_index = 0 if index == 1 else 1
-        panel_size = GetPanelSize(other_index)
-        if panel_size is not None:
-            height = get_value(panel_size, 0) + (get_value(panel_size, 1) * 256)
-            width = get_value(panel_size, 2) + (get_value(panel_size, 3) * 256)
-            print(f"Panel {other_index} size: {width}x{height}")
-    
-    panel_direct = GetPanelDirect(index)
-    panel_shape = GetPanelShape(index)
+    # 屏幕尺寸、方向和形状
+    if panel_info is not None:
+        for panel in panel_info.panels:
+            print(f"Panel {panel.index} size: {panel.width}x{panel.height}, direct: {panel.direct}, shape: {panel.shape}")
     
     # 配置加密密钥
     package = CreatePackage(0x32, random_key)
@@ -705,34 +630,20 @@ elif APP_model_ == DUALPANEL:
         print("Image sent successfully!")
         
         # 重要：发送完数据后等待设备处理完成
-        # 设备正忙于 DMA 传输时可能无法响应控制传输
+        # 设备正忙于 DMA 传输时可能无法响应控制传输（查询返回0），按退避间隔轮询直到完成
         print("Waiting for device to process data...")
-        time.sleep(1.0)  # 等待设备 DMA 传输完成
-        
-        # 等待传输完成（带错误处理）
-        transfer_complete = False
-        for i in range(1, 10):
-            try:
-                panel_state = GetPanelState(index)
-                state_val = get_value(panel_state)
-                print(f"Panel state check {i}: {state_val}")
-                if state_val == 1:
-                    print(f"Panel {index} transfer complete!")
-                    transfer_complete = True
-                    break
-            except Exception as e:
-                print(f"Warning: Failed to get panel state (attempt {i}): {e}")
-            time.sleep(0.5)
-        
-        if not transfer_complete:
+        transfer = WaitPanelIdle(index)
+        print(f"Panel state history: {transfer.history}")
+        if transfer.ok:
+            print(f"Panel {index} transfer complete! ({transfer.elapsed:.3f}s, {transfer.polls} polls)")
+        else:
             print("Note: Could not confirm transfer completion, but image data was sent.")
         
         # 双屏模式下发送到另一个屏幕
         if num_panels > 1:
             other_index = 0 if index == 1 else 1
-            SetSelectPanel(other_index)
             print(f"Sending image to panel {other_index}...")
-            time.sleep(0.5)  # 等待屏幕切换
+            SwitchPanel(other_index)  # 等待屏幕切换
             send_bytes_over_usb(vid=0x34C7, pid=0x8888, endpoint_out=0x02, directory_path=".")
             print("Image sent to second panel!")
     else:
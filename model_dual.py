@@ -1,4 +1,7 @@
+import time
+from collections import namedtuple
 from example_control import usb_control_transfer
+from example_usb_session import USBSessionPool
 
 def GetPanelNumber():
     try:
@@ -147,4 +150,197 @@ def GetPanelSourceState(wIndex = 0):
         return device_desc[0] 
     except Exception as e:
         print(f"GetPanelSourceState Fail: {str(e)}")  # 修复错误消息
-        return 0  # 返回默认值（0表示未就绪）
\ No newline at end of file
+        return 0  # 返回默认值（0表示未就绪）
+
+
+class PanelInfo(namedtuple("PanelInfo", "index width height direct shape state process_state")):
+    """单个屏幕的描述符快照（不可变）"""
+    __slots__ = ()
+
+    @property
+    def size(self):
+        return (self.width, self.height)
+
+
+class PanelSnapshot(namedtuple("PanelSnapshot", "source_state panels")):
+    """所有屏幕的描述符快照（不可变），panels按屏幕索引排列"""
+    __slots__ = ()
+
+    @property
+    def panel_num(self):
+        return len(self.panels)
+
+    def panel(self, index):
+        """取指定索引的屏幕，不存在时返回None"""
+        return self.panels[index] if 0 <= index < len(self.panels) else None
+
+
+def _read_panel_descriptor(session, wValue, wIndex, length):
+    return session.ctrl_transfer(
+        bmRequestType=0xC0,
+        bRequest=0xA0,
+        wValue=wValue,
+        wIndex=wIndex,
+        data_or_wLength=length
+    )
+
+
+def GetPanelInfo(vid=0x34C7, pid=0x8888):
+    """
+    一次获取所有屏幕的描述符
+
+    所有查询在同一个设备句柄上连续执行。屏幕数量、尺寸、方向和形状
+    在设备会话期间缓存（设备重新打开后重新查询），每次调用只查询
+    SourceState、PanelState和ProcessState。
+
+    Returns:
+        PanelSnapshot，失败时返回None
+    """
+    session = USBSessionPool.get(vid, pid)
+    try:
+        with session.lock:
+            # 设备断开重连时会话会清空缓存，静态信息随之重新查询
+            static = session.cache.get("panel_static")
+            if static is None:
+                panel_num = _read_panel_descriptor(session, 0x82, 0, 1)[0]
+                static = []
+                for index in range(panel_num):
+                    size = _read_panel_descriptor(session, 0x81, index, 4)
+                    # 16位小端序: h = [0]+[1]*256, w = [2]+[3]*256
+                    height = size[0] + size[1] * 256
+                    width = size[2] + size[3] * 256
+                    direct = _read_panel_descriptor(session, 0x84, index, 1)[0]
+                    shape = _read_panel_descriptor(session, 0x83, index, 1)[0]
+                    static.append((width, height, direct, shape))
+                session.cache["panel_static"] = static
+
+            source_state = _read_panel_descriptor(session, 0x93, 0, 1)[0]
+            panels = []
+            for index, (width, height, direct, shape) in enumerate(static):
+                state = _read_panel_descriptor(session, 0x91, index, 1)[0]
+                process_state = _read_panel_descriptor(session, 0x92, index, 1)[0]
+                panels.append(PanelInfo(index, width, height, direct, shape, state, process_state))
+        return PanelSnapshot(source_state, tuple(panels))
+    except Exception as e:
+        print(f"GetPanelInfo Fail: {str(e)}")
+        return None
+
+
+def ClearPanelInfoCache(vid=0x34C7, pid=0x8888):
+    """清除缓存的屏幕静态信息（例如更换屏幕后）"""
+    USBSessionPool.get(vid, pid).cache.pop("panel_static", None)
+
+
+class StateWait(namedtuple("StateWait", "ok value elapsed polls history")):
+    """
+    WaitForState的结果（不可变）
+
+    ok: 是否在超时前达到期望状态
+    value: 最后一次查询到的状态
+    elapsed: 从开始等待到最后一次查询的秒数
+    polls: 查询次数
+    history: 状态变化记录 ((距开始的秒数, 状态), ...)，状态每变化一次记录一条
+    """
+    __slots__ = ()
+
+
+PANEL_POLL_TIMEOUT = 100  # 轮询状态时单次控制传输的超时（毫秒）
+
+
+def _poll_panel_descriptor(wValue, wIndex=0, vid=0x34C7, pid=0x8888, timeout=PANEL_POLL_TIMEOUT):
+    """
+    轮询用的单字节状态查询：只尝试一次、短超时、不打印
+
+    设备忙于DMA传输时可能不响应控制传输，此时返回0（未就绪）由调用方继续轮询；
+    不经过usb_control_transfer的重试和延时，也不关闭会话（设备断开时会话自行重新打开）。
+    """
+    try:
+        return USBSessionPool.get(vid, pid).ctrl_transfer(
+            bmRequestType=0xC0,
+            bRequest=0xA0,
+            wValue=wValue,
+            wIndex=wIndex,
+            data_or_wLength=1,
+            timeout=timeout
+        )[0]
+    except Exception:
+        return 0
+
+
+def PollPanelState(wIndex=0):
+    """轮询用的PanelState查询，失败时返回0"""
+    return _poll_panel_descriptor(0x91, wIndex)
+
+
+def PollPanelSourceState(wIndex=0):
+    """轮询用的SourceState查询，失败时返回0"""
+    return _poll_panel_descriptor(0x93, wIndex)
+
+
+def WaitForState(getter, expected, *args, timeout=5.0, interval=0.01, max_interval=0.2, backoff=2.0):
+    """
+    轮询getter(*args)直到返回期望的状态
+
+    开始时快速轮询，之后查询间隔按backoff倍数增长（不超过max_interval），
+    设备处理完成后很快就能返回，而不必等待按最坏情况估计的固定时间。
+    超时只在两次查询之间检查，getter应使用PollPanelState等单次、短超时的查询，
+    否则实际等待时间可能超过timeout。
+
+    Args:
+        getter: 状态查询函数，如PollPanelState
+        expected: 期望的状态，或判断状态的函数（返回True表示已达到）
+        *args: 传给getter的参数，如屏幕索引
+        timeout: 最长等待秒数
+        interval: 首次查询后的等待秒数
+        max_interval: 查询间隔上限
+        backoff: 查询间隔增长倍数
+
+    Returns:
+        StateWait
+    """
+    matches = expected if callable(expected) else (lambda value: value == expected)
+    start = time.monotonic()
+    deadline = start + timeout
+    history = []
+    polls = 0
+    while True:
+        value = getter(*args)
+        polls += 1
+        now = time.monotonic()
+        elapsed = now - start
+        if not history or history[-1][1] != value:
+            history.append((elapsed, value))
+        if matches(value):
+            return StateWait(True, value, elapsed, polls, tuple(history))
+        if now >= deadline:
+            return StateWait(False, value, elapsed, polls, tuple(history))
+        time.sleep(min(interval, deadline - now))
+        interval = min(interval * backoff, max_interval)
+
+
+def WaitPanelReady(index=0, timeout=5.0):
+    """等待设备初始化完成且屏幕就绪（SourceState == 1 且 PanelState == 1）"""
+    return WaitForState(lambda: PollPanelSourceState() == 1 and PollPanelState(index) == 1, True, timeout=timeout)
+
+
+def WaitPanelIdle(index=0, timeout=5.0):
+    """等待屏幕的DMA传输完成（PanelState == 1），用于发送图像之后"""
+    return WaitForState(PollPanelState, 1, index, timeout=timeout)
+
+
+PANEL_SWITCH_SETTLE = 0.5  # SetSelectPanel后屏幕切换所需的时间（秒）
+
+
+def SwitchPanel(index, settle=PANEL_SWITCH_SETTLE, timeout=5.0):
+    """
+    切换到另一个屏幕并等待其可以接收图像
+
+    设备没有可查询的屏幕切换完成状态，PanelState为1不代表切换已完成，
+    因此SetSelectPanel后先固定等待settle秒，再等待新屏幕空闲。
+
+    Returns:
+        StateWait
+    """
+    SetSelectPanel(index)
+    time.sleep(settle)
+    return WaitPanelIdle(index, timeout)
@@ -8,9 +8,17 @@ import usb.util
 import numpy as np
 import cv2
 import time
+import queue
+import hashlib
+from collections import OrderedDict
 from model_dual import *
 from example_run_dll import CryptoLib #GetPanelSize, GetPanelNumber, SetSelectPanel
 from example_control import CreatePackage, random_key
+from example_usb_session import bulk_write
+from example_usb_async import AsyncBulkWriter
+from example_rgb565 import RGB565Encoder, encode_rgb565_bytes
+from example_partial_update import PARTIAL_UPDATE_ENABLED, PartialUpdateTracker, iter_region_packets, pack_region_command
+from example_frame_codec import CODEC_NAMES, CODEC_RAW, encode_frame, iter_frame_packets, negotiate_codecs
 from pathlib import Path
 import threading
 from PIL import Image, ImageTk
@@ -54,9 +62,20 @@ GESTURE_NAMES = {
 # 支持的图片格式
 IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff', '.tif'}
 
+# ================== 流式发送参数 ==================
+STREAM_BAND_ROWS = 32     # 每个行带的行数
+STREAM_QUEUE_DEPTH = 4    # 转换线程最多领先USB发送的行带数
+
+# ================== 帧缓存参数 ==================
+RGB565_BYTE_ORDER = "big"                 # 设备使用的RGB565字节序（高字节在前）
+FRAME_CACHE_MAX_BYTES = 64 * 1024 * 1024  # 内存中缓存的编码帧总大小上限
+FRAME_CACHE_SPILL_DIR = None              # 溢出到磁盘的目录，None时不溢出
+
 # ================== 全局变量 ==================
 dev = None
 ep = None
+async_writer = None  # EP2异步写入器（libusb1后端时使用）
+frame_codecs = frozenset()  # 与固件协商的压缩方式，空集合时发送原始数据
 current_image_index = 0
 image_files = []
 folder_path = ""
@@ -98,7 +117,7 @@ def parse_touch_data(data):
 
 def setup_usb_device():
     """设置USB设备"""
-    global dev, ep
+    global dev, ep, frame_codecs
     try:
         dev = usb.core.find(idVendor=USB_VID, idProduct=USB_PID)
         if dev is None:
@@ -130,13 +149,36 @@ def setup_usb_device():
         if ep is None:
             return False, "未找到OUT端点"
         
+        # 主机端开启且固件支持时压缩发送整帧
+        frame_codecs = negotiate_codecs(dev)
+        
         return True, "设备初始化成功"
     except Exception as e:
         return False, f"设备初始化失败: {e}"
 
+def get_async_writer():
+    """获取EP2的异步写入器（出错后重新创建），后端不支持时返回None"""
+    global async_writer
+    if async_writer is not None and async_writer.error is None:
+        return async_writer
+    if async_writer is not None:
+        async_writer.close()
+        async_writer = None
+    if dev is None or ep is None or not AsyncBulkWriter.is_supported(dev):
+        return None
+    try:
+        async_writer = AsyncBulkWriter(dev, ep)
+    except (NotImplementedError, OSError, MemoryError) as e:
+        print(f"异步bulk写入不可用，使用同步写入: {e}")
+    return async_writer
+
 def cleanup_usb_device():
     """清理USB设备"""
-    global dev, ep
+    global dev, ep, async_writer, frame_codecs
+    frame_codecs = frozenset()
+    if async_writer is not None:
+        async_writer.close()
+        async_writer = None
     if dev is not None:
         try:
             usb.util.release_interface(dev, INTERFACE_MAIN)
@@ -166,8 +208,8 @@ def cleanup_all_usb_resources():
     except Exception:
         pass
 
-def convert_image_to_rgb565(image_path, target_width=None, target_height=None, status_callback=None):
-    """将图片转换为RGB565格式的字节数据
+def load_panel_image(image_path, target_width=None, target_height=None, status_callback=None):
+    """读取图片并在需要时缩放到设备分辨率
     
     Args:
         image_path: 图片路径
@@ -176,7 +218,7 @@ def convert_image_to_rgb565(image_path, target_width=None, target_height=None, s
         status_callback: 状态回调函数
     
     Returns:
-        RGB565格式的字节数据
+        BGR格式的图像数组
     """
     img = cv2.imread(image_path)
     if img is None:
@@ -191,16 +233,261 @@ def convert_image_to_rgb565(image_path, target_width=None, target_height=None, s
                 status_callback(f"图片尺寸 {original_width}x{original_height} 不匹配设备 {target_width}x{target_height}，进行缩放...")
             # 使用高质量插值算法进行缩放
             img = cv2.resize(img, (target_width, target_height), interpolation=cv2.INTER_LANCZOS4)
+    return img
+
+def bgr_to_rgb565_bytes(img, byteorder=RGB565_BYTE_ORDER):
+    """将BGR图像（或其中连续的若干行）转换为RGB565字节数据
+    
+    Args:
+        img: BGR图像数组
+        byteorder: "big"为高字节在前（设备使用），"little"为低字节在前
+    """
+    return encode_rgb565_bytes(img, byteorder)
+
+def convert_image_to_rgb565(image_path, target_width=None, target_height=None, status_callback=None):
+    """将图片转换为RGB565格式的字节数据
+    
+    Args:
+        image_path: 图片路径
+        target_width: 目标宽度（如果为None则不缩放）
+        target_height: 目标高度（如果为None则不缩放）
+        status_callback: 状态回调函数
+    
+    Returns:
+        RGB565格式的字节数据
+    """
+    return bgr_to_rgb565_bytes(load_panel_image(image_path, target_width, target_height, status_callback))
+
+class RGB565BandStream:
+    """在工作线程中把图片按行带转换为RGB565，USB发送端边转换边发送
+    
+    转换线程读取、缩放图片后逐个行带转换并放入有界队列，发送端从队列取出
+    行带写入EP2，第N个行带的传输与第N+1个行带的转换重叠。队列满时转换线程等待，
+    内存占用不超过queue_depth个行带。
+    
+    用法:
+        stream = RGB565BandStream(image_path, width, height)
+        try:
+            for band in stream:
+                ...
+        finally:
+            stream.close()
+    """
+    
+    def __init__(self, image_path, target_width=None, target_height=None, status_callback=None,
+                 band_rows=STREAM_BAND_ROWS, queue_depth=STREAM_QUEUE_DEPTH, byteorder=RGB565_BYTE_ORDER):
+        self.image_path = image_path
+        self.target_width = target_width
+        self.target_height = target_height
+        self.status_callback = status_callback
+        self.band_rows = band_rows
+        self.byteorder = byteorder
+        self._queue = queue.Queue(maxsize=queue_depth)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
     
-    rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    r = (rgb[..., 0] >> 3).astype(np.uint16)
-    g = (rgb[..., 1] >> 2).astype(np.uint16)
-    b = (rgb[..., 2] >> 3).astype(np.uint16)
-    rgb565 = (b << 8) | (g << 13) | (r << 3) | (g >> 3)
-    rgb565 = rgb565.flatten()
-    return rgb565.tobytes()
+    def _put(self, item):
+        """放入队列；发送端已停止时放弃并返回False"""
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def _run(self):
+        try:
+            img = load_panel_image(self.image_path, self.target_width, self.target_height, self.status_callback)
+            encoder = RGB565Encoder(self.byteorder)  # 各行带复用同一组缓冲区
+            for row in range(0, img.shape[0], self.band_rows):
+                if not self._put(encoder.encode(img[row:row + self.band_rows]).tobytes()):
+                    return
+            self._put(None)  # 结束
+        except Exception as e:
+            self._put(e)  # 在发送端重新抛出
+    
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    
+    def close(self):
+        """停止转换线程"""
+        self._stop.set()
+        self._thread.join()
 
-def send_image_to_device(image_path, status_callback=None, target_width=None, target_height=None):
+class FrameCache:
+    """已编码RGB565帧的缓存
+    
+    以(文件路径, 修改时间, 文件大小, 目标宽高, 字节序)为键缓存编码后的整帧数据，
+    图片文件被修改后自动失效。内存中按最近使用顺序保留，总大小超过max_bytes时
+    淘汰最久未使用的帧；设置spill_dir时淘汰的帧写入磁盘，再次使用时从磁盘读回，
+    不再重新解码和缩放。prefetch在后台线程中预先编码即将显示的图片。
+    """
+    
+    def __init__(self, max_bytes=FRAME_CACHE_MAX_BYTES, spill_dir=FRAME_CACHE_SPILL_DIR,
+                 byteorder=RGB565_BYTE_ORDER):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.byteorder = byteorder
+        self.hits = 0        # 内存命中次数
+        self.disk_hits = 0   # 磁盘命中次数
+        self.misses = 0      # 未命中（重新编码）次数
+        self._frames = OrderedDict()  # {键: 帧数据}
+        self._size = 0
+        self._lock = threading.Lock()
+        self._encoding = {}  # {键: threading.Event}，正在编码的帧
+        self._prefetch_queue = queue.Queue()
+        self._prefetch_thread = None
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+    
+    def make_key(self, image_path, target_width=None, target_height=None):
+        """生成缓存键，文件不存在时抛出OSError"""
+        stat = os.stat(image_path)
+        return (os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size,
+                target_width, target_height, self.byteorder)
+    
+    def _spill_path(self, key):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.spill_dir, f"{digest}.rgb565")
+    
+    def _read_spill(self, key):
+        if not self.spill_dir:
+            return None
+        try:
+            with open(self._spill_path(key), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+    
+    def _write_spill(self, key, frame):
+        path = self._spill_path(key)
+        if os.path.exists(path):
+            return
+        # 先写临时文件再替换，避免读到不完整的帧
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(frame)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"帧缓存写入磁盘失败: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+    
+    def _store(self, key, frame):
+        evicted = []
+        with self._lock:
+            if key in self._frames:
+                self._frames.move_to_end(key)
+                return
+            self._frames[key] = frame
+            self._size += len(frame)
+            while self._size > self.max_bytes and len(self._frames) > 1:
+                old_key, old_frame = self._frames.popitem(last=False)
+                self._size -= len(old_frame)
+                evicted.append((old_key, old_frame))
+        if self.spill_dir:
+            for old_key, old_frame in evicted:
+                self._write_spill(old_key, old_frame)
+    
+    def lookup(self, image_path, target_width=None, target_height=None):
+        """查找已编码的帧（内存或磁盘），没有时返回None，不进行编码"""
+        try:
+            key = self.make_key(image_path, target_width, target_height)
+        except OSError:
+            return None
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is not None:
+                self._frames.move_to_end(key)
+                self.hits += 1
+                return frame
+        frame = self._read_spill(key)
+        if frame is not None:
+            self.disk_hits += 1
+            self._store(key, frame)
+        return frame
+    
+    def is_encoding(self, image_path, target_width=None, target_height=None):
+        """该帧是否正在其他线程（如预取）中编码"""
+        try:
+            key = self.make_key(image_path, target_width, target_height)
+        except OSError:
+            return False
+        with self._lock:
+            return key in self._encoding
+    
+    def store(self, image_path, frame, target_width=None, target_height=None):
+        """存入已编码的帧（例如流式发送时收集的数据）"""
+        try:
+            key = self.make_key(image_path, target_width, target_height)
+        except OSError:
+            return
+        self._store(key, bytes(frame))
+    
+    def get(self, image_path, target_width=None, target_height=None, status_callback=None):
+        """取得已编码的帧，没有缓存时编码并存入缓存"""
+        frame = self.lookup(image_path, target_width, target_height)
+        if frame is not None:
+            return frame
+        key = self.make_key(image_path, target_width, target_height)
+        # 同一帧正在其他线程中编码时等待其完成
+        with self._lock:
+            event = self._encoding.get(key)
+            owner = event is None
+            if owner:
+                event = self._encoding[key] = threading.Event()
+        if not owner:
+            event.wait()
+            frame = self.lookup(image_path, target_width, target_height)
+            if frame is not None:
+                return frame
+        try:
+            img = load_panel_image(image_path, target_width, target_height, status_callback)
+            frame = bgr_to_rgb565_bytes(img, self.byteorder)
+            self.misses += 1
+            self._store(key, frame)
+            return frame
+        finally:
+            if owner:
+                with self._lock:
+                    self._encoding.pop(key, None)
+                event.set()
+    
+    def prefetch(self, image_paths, target_width=None, target_height=None):
+        """在后台线程中预先编码图片（已缓存的跳过）"""
+        for image_path in image_paths:
+            self._prefetch_queue.put((image_path, target_width, target_height))
+        if self._prefetch_thread is None:
+            self._prefetch_thread = threading.Thread(target=self._prefetch_loop, daemon=True)
+            self._prefetch_thread.start()
+    
+    def _prefetch_loop(self):
+        while True:
+            image_path, target_width, target_height = self._prefetch_queue.get()
+            try:
+                self.get(image_path, target_width, target_height)
+            except Exception as e:
+                print(f"预取图片失败: {os.path.basename(image_path)}: {e}")
+    
+    def clear(self):
+        """清空内存中的缓存（磁盘上的帧保留）"""
+        with self._lock:
+            self._frames.clear()
+            self._size = 0
+
+def send_image_to_device(image_path, status_callback=None, target_width=None, target_height=None, frame_cache=None,
+                         dirty_tracker=None, panel=0):
     """发送图片到设备
     
     Args:
@@ -208,6 +495,11 @@ def send_image_to_device(image_path, status_callback=None, target_width=None, ta
         status_callback: 状态回调函数
         target_width: 目标分辨率宽度（如果为None则使用全局变量）
         target_height: 目标分辨率高度（如果为None则使用全局变量）
+        frame_cache: FrameCache，命中时直接发送已编码的帧，未命中时发送后存入缓存
+        dirty_tracker: PartialUpdateTracker，与该屏幕上一帧比较，只发送变化的区域
+        panel: 屏幕序号（dirty_tracker按屏幕记录上一帧）
+    
+    与固件协商了压缩方式（frame_codecs）时，整帧压缩后发送；有dirty_tracker时以上一帧为异或参考
     
     注意：此函数使用锁来防止与触摸数据读取冲突，并在发送前等待触摸数据传输完成
     """
@@ -221,6 +513,52 @@ def send_image_to_device(image_path, status_callback=None, target_width=None, ta
         target_width = device_width
     if target_height is None:
         target_height = device_height
+    if target_width is None or target_height is None:
+        dirty_tracker = None  # 分辨率未知时无法逐帧比较
+    
+    # 已缓存的帧直接发送；否则在工作线程中开始读取和转换图片，与下面的等待和USB发送重叠
+    frame = frame_cache.lookup(image_path, target_width, target_height) if frame_cache is not None else None
+    if frame is None and frame_cache is not None and frame_cache.is_encoding(image_path, target_width, target_height):
+        # 预取正在编码这张图片（快速切换时），等待其完成，不再重复解码和缩放
+        frame = frame_cache.get(image_path, target_width, target_height, status_callback)
+    if frame is None and (frame_codecs or (dirty_tracker is not None and dirty_tracker.has_frame(panel))):
+        # 压缩和局部刷新都需要完整的新帧，不再边转换边发送
+        if frame_cache is not None:
+            frame = frame_cache.get(image_path, target_width, target_height, status_callback)
+        else:
+            frame = convert_image_to_rgb565(image_path, target_width, target_height, status_callback)
+    plan = None
+    pixels = None
+    if dirty_tracker is not None:
+        if frame is not None:
+            pixels = np.frombuffer(frame, np.uint16).reshape(target_height, target_width)
+        plan = dirty_tracker.plan(panel, pixels)
+        if not plan.full and not plan.rects:
+            if status_callback:
+                status_callback(f"画面未变化，跳过发送: {os.path.basename(image_path)}")
+            return True
+    partial = plan is not None and not plan.full
+    encoded = None
+    if not partial and frame is not None and frame_codecs:
+        reference = dirty_tracker.last_frame(panel) if dirty_tracker is not None else None
+        encoded = encode_frame(frame, reference, frame_codecs)
+        if encoded.codec == CODEC_RAW:
+            encoded = None  # 压缩无效，按原始数据发送
+    collected = None
+    if partial:
+        stream = None
+        bands = iter(())
+    elif frame is not None:
+        stream = None
+        bands = iter((frame,))
+    else:
+        byteorder = frame_cache.byteorder if frame_cache is not None else RGB565_BYTE_ORDER
+        stream = RGB565BandStream(image_path, target_width, target_height, status_callback, byteorder=byteorder)
+        bands = iter(stream)
+        if frame_cache is not None or dirty_tracker is not None:
+            # 发送的同时收集各行带，发送完成后存入缓存并记录为该屏幕的上一帧
+            collected = []
+            bands = (collected.append(band) or band for band in bands)
     
     # 获取图片传输锁，防止触摸数据读取干扰
     # 设备端的EP1（触摸）和EP2（图片）是互斥的
@@ -247,21 +585,37 @@ def send_image_to_device(image_path, status_callback=None, target_width=None, ta
                 # 其他异常，忽略并继续
                 break
         
-        # 转换图片为RGB565格式（如果需要则进行缩放）
-        image_data = convert_image_to_rgb565(image_path, target_width, target_height, status_callback)
+        # 取得第一个行带（图片无法读取时在发送开始标记前抛出异常）
+        first_band = next(bands, b"")
         
         chunk_size = ep.wMaxPacketSize
         d_start = bytes.fromhex("FF 01")
         d_end = bytes.fromhex("FF 02")
         
-        # 发送开始标记
+        # 第一包：局部刷新时为第一个区域命令；上次是局部刷新时先把更新区域恢复为整屏；
+        # 压缩时为压缩帧命令；否则为开始标记
+        packets = None
+        if partial:
+            packets = iter_region_packets(pixels, plan.rects)
+        elif encoded is not None:
+            packets = iter_frame_packets(encoded)
+            if plan is not None and plan.window_reset:
+                packets = iter([pack_region_command(0, 0, target_width, target_height)] + list(packets))
+        if packets is not None:
+            first_packet = next(packets)
+        elif plan is not None and plan.window_reset:
+            first_packet = pack_region_command(0, 0, target_width, target_height)
+        else:
+            first_packet = d_start
+        
+        # 发送第一包
         # 由于设备端ServiceLoop会主动检查并恢复EP2，需要等待一段时间
         # 但为了更可靠，使用重试机制：如果第一次失败，等待后重试
         max_retries = 5
         for retry in range(max_retries):
             try:
-                # 尝试发送开始标记
-                ep.write(d_start, timeout=500)  # 500ms超时
+                # 尝试发送第一包
+                ep.write(first_packet, timeout=500)  # 500ms超时
                 break
             except (usb.core.USBTimeoutError, usb.core.USBError) as e:
                 if retry < max_retries - 1:
@@ -276,27 +630,87 @@ def send_image_to_device(image_path, status_callback=None, target_width=None, ta
                         status_callback(f"发送开始标记失败: EP2可能仍被禁用")
                     raise
         
+        writer = get_async_writer()
+        write = writer.submit if writer is not None else (lambda data: bulk_write(ep, data))
+        
+        if packets is not None:
+            # 局部刷新或压缩帧：其余的命令、开始标记、数据和结束标记依次发送
+            total_size = len(first_packet)
+            for packet in packets:
+                write(packet)
+                total_size += len(packet)
+            if writer is not None:
+                writer.flush()
+            if dirty_tracker is not None:
+                dirty_tracker.commit(plan, pixels)
+            if status_callback:
+                if partial:
+                    status_callback(f"局部刷新完成: {os.path.basename(image_path)} "
+                                    f"({len(plan.rects)}个区域, {total_size} 字节)")
+                else:
+                    status_callback(f"压缩帧发送完成: {os.path.basename(image_path)} "
+                                    f"({CODEC_NAMES[encoded.codec]}, {encoded.raw_size} -> {total_size} 字节)")
+            return True
+        
+        if first_packet is not d_start:
+            ep.write(d_start, timeout=500)
+        
         if status_callback:
-            status_callback(f"发送图片: {os.path.basename(image_path)} ({len(image_data)} 字节)")
+            status_callback(f"发送图片: {os.path.basename(image_path)}")
         
-        # 发送图片数据
-        for i in range(0, len(image_data), chunk_size):
-            ep.write(image_data[i:i+chunk_size])
+        # 发送图片数据：每个行带的完整包部分整块提交，由主机控制器拆包；
+        # 行带之间不足chunk_size的尾部并入下一个行带，除最后一包外每包都是完整的chunk_size。
+        # libusb1后端时异步提交（提交后立即转换下一个行带），否则同步写入
+        total_size = 0
+        pending = bytearray(first_band)
+        for band in bands:
+            pending += band
+            full = len(pending) - len(pending) % chunk_size
+            if full:
+                write(pending[:full])
+            total_size += full
+            del pending[:full]
+        if pending:
+            write(pending)
+        total_size += len(pending)
         
         # 发送结束标记
-        ep.write(d_end)
+        if writer is not None:
+            writer.submit(d_end)
+            writer.flush()
+        else:
+            ep.write(d_end)
         
         if status_callback:
-            status_callback(f"图片发送完成: {os.path.basename(image_path)}")
+            status_callback(f"图片发送完成: {os.path.basename(image_path)} ({total_size} 字节)")
+        
+        if collected is not None:
+            frame = b"".join(collected)
+            if frame_cache is not None:
+                frame_cache.store(image_path, frame, target_width, target_height)
+        if dirty_tracker is not None:
+            if pixels is None:
+                pixels = np.frombuffer(frame, np.uint16).reshape(target_height, target_width)
+            dirty_tracker.commit(plan, pixels)
         
         return True
     except Exception as e:
         if status_callback:
             status_callback(f"发送图片失败: {e}")
+        if dirty_tracker is not None:
+            dirty_tracker.invalidate(panel)  # 屏幕上的内容不确定，下一帧整帧发送
+        # 已提交的异步传输结束后才释放锁，避免与触摸数据读取冲突
+        if async_writer is not None:
+            try:
+                async_writer.flush(timeout=5)
+            except Exception:
+                pass
         raise
     finally:
         # 确保锁被释放，即使发生异常
         image_transfer_lock.release()
+        if stream is not None:
+            stream.close()
 
 def read_touch_data(timeout=100):
     """读取触摸数据
@@ -401,6 +815,9 @@ class ImageViewerApp:
         self.image_files = []
         self.current_index = 0
         self.folder_path = ""
+        self.frame_cache = FrameCache()  # 已编码帧缓存，切换图片时直接发送
+        # 只发送与上一帧相比变化的区域（PARTIAL_UPDATE_ENABLED关闭时始终整帧发送）
+        self.dirty_tracker = PartialUpdateTracker() if PARTIAL_UPDATE_ENABLED else None
         
         # 创建界面
         self.create_widgets()
@@ -530,6 +947,8 @@ class ImageViewerApp:
                 self.folder_label.config(text=f"已选择: {os.path.basename(folder)} ({len(self.image_files)} 张图片)")
                 self.update_image_info()
                 self.log_status(f"找到 {len(self.image_files)} 张图片")
+                # 预先编码第一张及其前后两张
+                self.frame_cache.prefetch(self.image_files[:2] + self.image_files[-1:], device_width, device_height)
             else:
                 self.folder_label.config(text="未找到图片文件")
                 messagebox.showwarning("警告", "选择的文件夹中没有找到图片文件")
@@ -662,6 +1081,20 @@ class ImageViewerApp:
             self.update_image_info()
             self.log_status(f"切换到下一张: {os.path.basename(self.image_files[self.current_index])}")
     
+    def send_image(self, index):
+        """发送指定图片（使用帧缓存），并在后台预取前后两张图片"""
+        send_image_to_device(self.image_files[index], self.log_status, frame_cache=self.frame_cache,
+                             dirty_tracker=self.dirty_tracker)
+        self.prefetch_neighbors()
+    
+    def prefetch_neighbors(self):
+        """在后台编码当前图片的上一张和下一张"""
+        if len(self.image_files) > 1:
+            count = len(self.image_files)
+            neighbors = [self.image_files[(self.current_index - 1) % count],
+                         self.image_files[(self.current_index + 1) % count]]
+            self.frame_cache.prefetch(neighbors, device_width, device_height)
+    
     def send_current_image(self):
         """发送当前图片到设备"""
         if not self.image_files:
@@ -673,8 +1106,7 @@ class ImageViewerApp:
             return
         
         try:
-            image_path = self.image_files[self.current_index]
-            send_image_to_device(image_path, self.log_status)
+            self.send_image(self.current_index)
         except Exception as e:
             messagebox.showerror("错误", f"发送图片失败: {e}")
             self.log_status(f"发送图片失败: {e}")
@@ -684,6 +1116,8 @@ class ImageViewerApp:
         global device_width, device_height
         
         success, message = setup_usb_device()
+        if self.dirty_tracker is not None:
+            self.dirty_tracker.invalidate()  # 设备重新初始化后屏幕内容未知
         if success:
             self.log_status("USB设备初始化成功")
             if device_width is not None and device_height is not None:
@@ -717,7 +1151,7 @@ class ImageViewerApp:
             try:
                 self.current_index = 0
                 self.update_image_info()
-                send_image_to_device(self.image_files[self.current_index], self.log_status)
+                self.send_image(self.current_index)
                 time.sleep(0.5)  # 等待图片发送完成
             except Exception as e:
                 self.log_status(f"发送第一张图片失败: {e}")
@@ -805,7 +1239,7 @@ class ImageViewerApp:
         
         try:
             # send_image_to_device内部已经包含了等待触摸数据传输完成的逻辑
-            send_image_to_device(self.image_files[self.current_index], self.log_status)
+            self.send_image(self.current_index)
             time.sleep(0.3)  # 等待图片发送完成（减少等待时间，因为内部已有保护）
             self.log_status("等待下一个手势...")
         except Exception as e:
@@ -821,7 +1255,7 @@ class ImageViewerApp:
         
         try:
             # send_image_to_device内部已经包含了等待触摸数据传输完成的逻辑
-            send_image_to_device(self.image_files[self.current_index], self.log_status)
+            self.send_image(self.current_index)
             time.sleep(0.3)  # 等待图片发送完成（减少等待时间，因为内部已有保护）
             self.log_status("等待下一个手势...")
         except Exception as e:
@@ -9,6 +9,10 @@ import time
 from model_dual import *
 from example_run_dll import CryptoLib
 from example_control import CreatePackage, random_key
+from example_usb_session import USBSessionPool, bulk_write
+from example_usb_async import open_async_writer
+from example_rgb565 import encode_rgb565, RGB565_BIG
+from example_frame_codec import CODEC_NAMES, encode_frame, iter_frame_packets, negotiate_codecs
 
 # ================== 模式定义 ==================
 DISPLAY = 0
@@ -17,10 +21,6 @@ APP_model_ = TOUCH
 
 # ================== 全局变量 ==================
 imgdata = None
-dev = None
-cfg = None
-ep = None
-intf = None
 index = 0  # 面板索引
 
 # ================== USB参数 ==================
@@ -242,74 +242,43 @@ def save_image_rgb565_bin(image_path, output_path):
     img = cv2.imread(image_path)
     if img is None:
         raise FileNotFoundError(f"无法读取图片: {image_path}")
-    rgb = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
-    r = (rgb[..., 0] >> 3).astype(np.uint16)
-    g = (rgb[..., 1] >> 2).astype(np.uint16)
-    b = (rgb[..., 2] >> 3).astype(np.uint16)
-    rgb565 = (b << 8) | (g << 13) | (r << 3) | (g >> 3)
-    rgb565 = rgb565.flatten()
+    # 设备使用高字节在前的RGB565
+    rgb565 = encode_rgb565(img, RGB565_BIG)
     with open(output_path, 'wb') as f:
-        f.write(rgb565.tobytes()) 
+        rgb565.tofile(f)
 
 def send_bytes_over_usb(vid, pid, endpoint_out, directory_path):
     """
     读取指定目录下所有的bin文件并通过USB发送（使用接口0）
     """
-    global dev, ep
-    dev = None
-    ep = None
+    # 设备句柄、接口0的声明和端点描述符由会话缓存，连续发送时不再重新查找和声明
+    session = USBSessionPool.get(vid, pid)
     
     try:
-        # 查找设备
-        dev = usb.core.find(idVendor=vid, idProduct=pid)
-        if dev is None:
-            raise ValueError('设备未找到，请检查VID和PID')
-        
-        # 设置配置（如果尚未设置）
-        try:
-            dev.set_configuration()
-        except usb.core.USBError as e:
-            # 如果配置已经设置，忽略此错误
-            if "already" not in str(e).lower() and "busy" not in str(e).lower():
-                raise
-        
-        # Windows/Linux: 检查并分离内核驱动（接口0）
-        try:
-            if dev.is_kernel_driver_active(INTERFACE_MAIN):
-                print("[信息] 分离内核驱动（接口0）...")
-                dev.detach_kernel_driver(INTERFACE_MAIN)
-        except (usb.core.USBError, NotImplementedError):
-            pass  # Windows可能不支持此操作
-        
         # 声明接口0（该接口同时支持触摸和显示）
         try:
-            usb.util.claim_interface(dev, INTERFACE_MAIN)
-            print(f"[成功] 接口{INTERFACE_MAIN}（触摸和显示接口）已声明")
+            session.claim_interface(INTERFACE_MAIN)
         except usb.core.USBError as e:
             print(f"[警告] 声明接口{INTERFACE_MAIN}失败: {e}")
             raise
         
-        # 获取端点
-        cfg = dev.get_active_configuration()
-        # 使用接口0（触摸和显示接口）
-        intf = cfg[(INTERFACE_MAIN, 0)]
-        ep = usb.util.find_descriptor(
-            intf,
-            custom_match = lambda e: e.bEndpointAddress == endpoint_out
-        )
-        if ep is None:
-            raise ValueError(f'未找到指定的 OUT 端点 (接口{INTERFACE_MAIN})')
+        # 获取端点（使用接口0，触摸和显示接口）
+        ep = session.endpoint(endpoint_out, INTERFACE_MAIN)
+        # libusb1后端时异步提交，多个传输同时在途；否则同步写入
+        writer = open_async_writer(session, endpoint_out, INTERFACE_MAIN)
+        # 主机端开启且固件支持时压缩发送
+        codecs = negotiate_codecs(session)
 
         # 获取目录下所有的bin文件
         bin_files = [f for f in os.listdir(directory_path) if f.endswith('.bin')]
         if not bin_files:
             raise ValueError(f'在目录 {directory_path} 中没有找到.bin文件')
 
-        chunk_size = ep.wMaxPacketSize
         d_start = bytes.fromhex("FF 01")
         d_end = bytes.fromhex("FF 02")
 
         # 发送所有bin文件
+        previous = None  # 上一个发送的文件数据（屏幕当前内容）
         for bin_file in bin_files:
             file_path = os.path.join(directory_path, bin_file)
             print(f"正在发送文件: {bin_file}")
@@ -318,39 +287,35 @@ def send_bytes_over_usb(vid, pid, endpoint_out, directory_path):
                 with open(file_path, 'rb') as f:
                     data = f.read()
                 
-                # 发送数据包：开始标记 + 数据 + 结束标记
-                ep.write(d_start)
-                for i in range(0, len(data), chunk_size):
-                    ep.write(data[i:i+chunk_size])
-                ep.write(d_end)
+                # 发送数据包：固件支持时为压缩帧命令 + 开始标记 + 压缩数据 + 结束标记，
+                # 否则为开始标记 + 数据 + 结束标记
+                if codecs:
+                    reference = previous if previous is not None and len(previous) == len(data) else None
+                    encoded = encode_frame(data, reference, codecs)
+                    packets = list(iter_frame_packets(encoded))
+                    print(f"压缩方式: {CODEC_NAMES[encoded.codec]}, {len(data)} -> {len(encoded.payload)} 字节")
+                else:
+                    packets = [d_start, data, d_end]
+                if writer is not None:
+                    for packet in packets:
+                        writer.submit(packet)
+                    writer.flush()
+                else:
+                    for packet in packets:
+                        bulk_write(ep, packet, session.bulk_chunk_size)  # 整块提交，由主机控制器拆包
+                previous = data
                 print(f"已通过USB发送 {len(data)} 字节")
                 time.sleep(0.5)
             except Exception as e:
+                previous = None  # 屏幕内容不确定，下一个文件不做异或
                 print(f"[错误] 发送文件 {bin_file} 失败: {e}")
                 raise
     
     except Exception as e:
         print(f"[错误] USB发送过程出错: {e}")
+        # 出错时释放接口和资源，下次发送时重新打开设备
+        session.close()
         raise
-    finally:
-        # 确保释放接口和资源
-        if dev is not None:
-            try:
-                # 释放接口0（触摸和显示接口）
-                usb.util.release_interface(dev, INTERFACE_MAIN)
-                print(f"[成功] 接口{INTERFACE_MAIN}（触摸和显示接口）已释放")
-            except:
-                pass
-            
-            try:
-                # 释放设备资源
-                usb.util.dispose_resources(dev)
-            except:
-                pass
-        
-        # 清理全局变量
-        ep = None
-        dev = None
 
 # ================== 清理函数 ==================
 def cleanup_all_usb_resources():
@@ -359,6 +324,9 @@ def cleanup_all_usb_resources():
     用于模式切换前清理资源
     """
     try:
+        # 释放发送会话持有的接口和设备句柄
+        USBSessionPool.close(USB_VID, USB_PID)
+        
         # 查找设备
         dev = usb.core.find(idVendor=USB_VID, idProduct=USB_PID)
         if dev is not None: